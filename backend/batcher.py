@@ -0,0 +1,114 @@
+"""Dynamic micro-batching of concurrent requests."""
+import asyncio
+from typing import Any, Callable, List, Optional
+
+from executor import InferenceExecutor
+
+
+class MicroBatcher:
+    """
+    Coalesces items submitted by concurrent requests into batches.
+
+    Items are collected until max_batch_size is reached or max_wait_ms has
+    passed since the first item arrived, then the whole batch is processed
+    by one call on the inference executor and each result is handed back to
+    the request that submitted it.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[list], list],
+        executor: InferenceExecutor,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 2.0
+    ):
+        """
+        Initialize batcher.
+
+        Args:
+            process_batch: Blocking function mapping a list of items to a list of results
+            executor: Executor the batches run on
+            max_batch_size: Maximum items per batch
+            max_wait_ms: Maximum time the first item of a batch waits for others
+        """
+        self.process_batch = process_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self.pending = []  # (item, future) pairs waiting for the next batch
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks = set()  # running batches, referenced so they are not garbage collected
+
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Add an item to the next batch and wait for its result.
+
+        Args:
+            item: Item to process
+
+        Returns:
+            Result of process_batch for this item
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((item, future))
+
+        if len(self.pending) >= self.max_batch_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Start processing the pending items as one batch."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        batch = self.pending[:self.max_batch_size]
+        self.pending = self.pending[self.max_batch_size:]
+
+        # Leftovers (only possible after a full flush) start a new wait window
+        if self.pending:
+            self.timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch: List[tuple]) -> None:
+        """Process a batch on the executor and resolve the waiting futures."""
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+        try:
+            results = await self.executor.run(self.process_batch, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> dict:
+        """Get batch count and size statistics."""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch
+        }
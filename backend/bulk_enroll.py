@@ -0,0 +1,377 @@
+"""Bulk enrollment of labelled photos from a directory or a zip/tar archive."""
+import csv
+import io
+import os
+import posixpath
+import tarfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+from database import Database
+from vector_store import VectorStore
+
+
+# CSV with the columns file, name, email (file paths relative to the manifest)
+MANIFEST_NAME = "manifest.csv"
+
+# Failed items kept on a job for the status endpoint
+MAX_JOB_ERRORS = 1000
+
+# Finished jobs stay queryable for this long (seconds), and at most this many are kept
+FINISHED_JOB_TTL = 3600
+MAX_FINISHED_JOBS = 100
+
+# (file, name, email, image bytes or None if the file is missing)
+Photo = Tuple[str, str, str, Optional[bytes]]
+
+
+def read_manifest(text: str, prefix: str = "") -> Dict[str, Tuple[str, str]]:
+    """
+    Parse a manifest into {normalized file path: (name, email)}.
+
+    Args:
+        text: CSV contents with a header row containing file, name and email
+        prefix: Directory of the manifest (file paths are relative to it)
+
+    Raises:
+        ValueError: If a column is missing
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    missing = {"file", "name", "email"} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"Manifest is missing columns: {', '.join(sorted(missing))}")
+
+    labels = {}
+    for row in reader:
+        path = posixpath.normpath(posixpath.join(prefix, row["file"].strip()))
+        labels[path] = (row["name"].strip(), row["email"].strip())
+    return labels
+
+
+def _find_manifest(names: List[str]) -> Optional[str]:
+    """Pick the manifest closest to the archive root."""
+    candidates = [name for name in names if posixpath.basename(name) == MANIFEST_NAME]
+    return min(candidates, key=lambda name: name.count("/")) if candidates else None
+
+
+def iter_photos(source: str, manifest: Optional[str] = None) -> Iterator[Photo]:
+    """
+    Read labelled photos from a directory, zip or tar (optionally compressed).
+
+    Labels come from a manifest CSV (columns file, name, email), by default
+    the manifest.csv in the directory or archive (in a tar, the first one).
+    Tars are read in one sequential pass, so compressed tars are decompressed
+    once; files stored before the manifest are held in memory until it is
+    read, so archives should put it first. Manifest entries whose file is
+    not found are yielded last with no image.
+
+    Args:
+        source: Directory or archive path
+        manifest: Manifest CSV path (default: manifest.csv inside source)
+
+    Yields:
+        Tuples (file, name, email, image bytes or None)
+
+    Raises:
+        ValueError: If there is no manifest or source is not a directory/zip/tar
+    """
+    labels = None
+    if manifest is not None:
+        with open(manifest, encoding="utf-8-sig") as f:
+            labels = read_manifest(f.read())
+
+    if os.path.isdir(source):
+        if labels is None:
+            path = os.path.join(source, MANIFEST_NAME)
+            if not os.path.exists(path):
+                raise ValueError(f"No {MANIFEST_NAME} in {source}")
+            with open(path, encoding="utf-8-sig") as f:
+                labels = read_manifest(f.read())
+
+        for path, (name, email) in labels.items():
+            try:
+                with open(os.path.join(source, path), "rb") as f:
+                    image = f.read()
+            except OSError:
+                image = None
+            yield path, name, email, image
+        return
+
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            names = archive.namelist()
+            if labels is None:
+                labels = _read_archive_manifest(names, archive.read)
+            remaining = dict(labels)
+            for member in names:
+                path = posixpath.normpath(member)
+                if path in remaining:
+                    name, email = remaining.pop(path)
+                    yield path, name, email, archive.read(member)
+    elif tarfile.is_tarfile(source):
+        remaining = dict(labels) if labels is not None else None
+        buffered: Dict[str, bytes] = {}
+        with tarfile.open(source, "r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                path = posixpath.normpath(member.name)
+
+                if remaining is None:
+                    if posixpath.basename(path) != MANIFEST_NAME:
+                        buffered[path] = archive.extractfile(member).read()
+                        continue
+                    remaining = read_manifest(archive.extractfile(member).read().decode("utf-8-sig"),
+                                              prefix=posixpath.dirname(path))
+                    for buffered_path, image in buffered.items():
+                        if buffered_path in remaining:
+                            name, email = remaining.pop(buffered_path)
+                            yield buffered_path, name, email, image
+                    buffered = {}
+                elif path in remaining:
+                    name, email = remaining.pop(path)
+                    yield path, name, email, archive.extractfile(member).read()
+
+        if remaining is None:
+            raise ValueError(f"No {MANIFEST_NAME} in archive")
+    else:
+        raise ValueError(f"{source} is not a directory, zip or tar archive")
+
+    for path, (name, email) in remaining.items():
+        yield path, name, email, None
+
+
+def _read_archive_manifest(names: List[str], read: Callable[[str], bytes]) -> Dict[str, Tuple[str, str]]:
+    """Find and parse the manifest inside an archive."""
+    member = _find_manifest(names)
+    if member is None:
+        raise ValueError(f"No {MANIFEST_NAME} in archive")
+    return read_manifest(read(member).decode("utf-8-sig"), prefix=posixpath.dirname(member))
+
+
+def embed_photo(face_detector, face_embedder, image: bytes) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """
+    Decode, detect and embed the single face of an enrollment photo.
+
+    Returns:
+        Tuple (embedding, None) or (None, error message)
+    """
+    try:
+        faces = face_detector.detect_from_bytes(image, align=face_embedder.single_pass)
+    except ValueError:
+        return None, "Could not decode image"
+
+    if len(faces) == 0:
+        return None, "No face detected"
+    if len(faces) > 1:
+        return None, "Multiple faces detected"
+
+    embedding = face_embedder.get_embedding(faces[0][0])
+    if embedding is None:
+        return None, "Failed to generate face embedding"
+    return embedding, None
+
+
+def bulk_enroll(photos: Iterator[Photo], face_detector, face_embedder, database: Database,
+                vector_store: VectorStore, user_cache=None, workers: int = 2, batch_size: int = 500,
+                on_result: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Enroll labelled photos in batches.
+
+    Each batch skips emails that are already enrolled (so an interrupted
+    import can simply be run again), embeds the remaining photos on a pool
+    of threads and creates their users in one transaction. All embeddings
+    are added to the vector store in one bulk add followed by one snapshot.
+
+    Args:
+        photos: Tuples (file, name, email, image bytes or None)
+        face_detector: FaceDetector
+        face_embedder: FaceEmbedder
+        database: Database to create users in
+        vector_store: Vector store to add embeddings to
+        user_cache: UserCache to add created users to (optional)
+        workers: Threads decoding, detecting and embedding
+        batch_size: Photos per database transaction
+        on_result: Called with a result dict per photo (file, email, status,
+            and user_id or error); status is "enrolled", "exists" or "failed"
+
+    Returns:
+        Dict with the number of photos per status
+    """
+    counts = {"total": 0, "enrolled": 0, "exists": 0, "failed": 0}
+    user_ids = []
+    embeddings = []
+
+    def report(file: str, email: str, status: str, **fields) -> None:
+        counts["total"] += 1
+        counts[status] += 1
+        if on_result is not None:
+            on_result({"file": file, "email": email, "status": status, **fields})
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-enroll") as pool:
+            for batch in _batches(photos, batch_size):
+                existing = database.get_existing_emails([email for _, _, email, _ in batch])
+                todo = []
+                for file, name, email, image in batch:
+                    if email in existing:
+                        report(file, email, "exists", error="Email already enrolled")
+                    elif image is None:
+                        report(file, email, "failed", error="File not found")
+                    else:
+                        todo.append((file, name, email, image))
+
+                results = pool.map(lambda photo: embed_photo(face_detector, face_embedder, photo[3]), todo)
+                embedded = []
+                for (file, name, email, _), (embedding, error) in zip(todo, results):
+                    if error:
+                        report(file, email, "failed", error=error)
+                    elif email in existing:
+                        # Another photo of this email in the import already embedded
+                        report(file, email, "exists", error="Email already enrolled")
+                    else:
+                        existing.add(email)
+                        embedded.append((file, name, email, embedding))
+
+                for (file, _, email, embedding), user in zip(embedded, _create_users(database, embedded)):
+                    if isinstance(user, str):
+                        report(file, email, "failed", error=user)
+                        continue
+                    user_ids.append(user.id)
+                    embeddings.append(embedding)
+                    if user_cache is not None:
+                        user_cache.add(user)
+                    report(file, email, "enrolled", user_id=user.id)
+    finally:
+        # Users committed before an error still get indexed
+        if user_ids:
+            vector_store.add_embeddings(np.array(user_ids), np.stack(embeddings), snapshot=True)
+
+    return counts
+
+
+def _batches(photos: Iterator[Photo], batch_size: int) -> Iterator[List[Photo]]:
+    """Group photos into lists of batch_size."""
+    batch = []
+    for photo in photos:
+        batch.append(photo)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _create_users(database: Database, embedded: list) -> list:
+    """
+    Create a batch of users in one transaction.
+
+    If the batch conflicts with a user enrolled concurrently, users are
+    created one by one instead.
+
+    Returns:
+        Created User or error message per item
+    """
+    users = [(name, email, embedding) for _, name, email, embedding in embedded]
+    try:
+        return database.create_users(users)
+    except IntegrityError:
+        pass
+
+    created = []
+    for name, email, embedding in users:
+        try:
+            created.append(database.create_user(name=name, email=email, embedding=embedding))
+        except IntegrityError:
+            created.append("Email already enrolled")
+    return created
+
+
+class BulkEnrollJob:
+    """Bulk enrollment of an uploaded archive, running on a background thread."""
+
+    def __init__(self, archive_path: str, **kwargs):
+        """
+        Initialize job.
+
+        Args:
+            archive_path: Uploaded zip/tar, deleted when the job ends
+            **kwargs: Arguments passed to bulk_enroll
+        """
+        self.id = uuid.uuid4().hex
+        self.archive_path = archive_path
+        self.kwargs = kwargs
+
+        self.lock = Lock()
+        self.status = "queued"
+        self.counts = {"total": 0, "enrolled": 0, "exists": 0, "failed": 0}
+        self.errors = []
+        self.message = ""
+        self.started_at = None
+        self.finished_at = None
+        self.thread = Thread(target=self._run, name=f"bulk-enroll-{self.id[:8]}", daemon=True)
+
+    def start(self) -> None:
+        """Start the job."""
+        self.thread.start()
+
+    def is_running(self) -> bool:
+        """Check whether the job has not finished yet."""
+        return self.thread.is_alive() or self.status == "queued"
+
+    def _on_result(self, result: dict) -> None:
+        """Record a per-photo result."""
+        with self.lock:
+            self.counts["total"] += 1
+            self.counts[result["status"]] += 1
+            if result["status"] == "failed" and len(self.errors) < MAX_JOB_ERRORS:
+                self.errors.append(result)
+
+    def _run(self) -> None:
+        """Run bulk enrollment and record the outcome."""
+        self.status = "running"
+        self.started_at = time.time()
+        try:
+            bulk_enroll(iter_photos(self.archive_path), on_result=self._on_result, **self.kwargs)
+            self.status = "completed"
+        except Exception as e:
+            self.status = "failed"
+            self.message = str(e)
+        finally:
+            self.finished_at = time.time()
+            os.remove(self.archive_path)
+
+    def to_dict(self) -> dict:
+        """Get the job's progress and failed items."""
+        with self.lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "message": self.message,
+                **self.counts,
+                "errors": list(self.errors),
+                "elapsed_seconds": ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+            }
+
+
+def prune_jobs(jobs: Dict[str, BulkEnrollJob], now: Optional[float] = None) -> None:
+    """
+    Forget finished jobs older than FINISHED_JOB_TTL, keeping at most MAX_FINISHED_JOBS.
+
+    Args:
+        jobs: Jobs by id, in the order they were started (modified in place)
+        now: Current time (default: time.time())
+    """
+    now = time.time() if now is None else now
+    finished = [job for job in jobs.values() if job.finished_at is not None]
+    expired = {job.id for job in finished if now - job.finished_at > FINISHED_JOB_TTL}
+    expired.update(job.id for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)])
+    for job_id in expired:
+        del jobs[job_id]
@@ -0,0 +1,134 @@
+"""Runtime configuration read from environment variables."""
+import os
+
+
+# Face pipeline mode:
+#   "two_pass"    - MediaPipe detection, padded crop, InsightFace FaceAnalysis
+#                   (runs its own SCRFD detector on the crop again)
+#   "single_pass" - MediaPipe detection + keypoint alignment, ArcFace model fed
+#                   aligned 112x112 crops directly (other buffalo_l models unloaded)
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "two_pass")
+
+# InsightFace model pack
+INSIGHTFACE_MODEL = os.getenv("INSIGHTFACE_MODEL", "buffalo_l")
+
+# Inference executor: threads running detection/embedding/search, and how many
+# requests may wait for a thread before /enroll and /recognize return 503
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "32"))
+
+# ONNX Runtime threads per inference call (0 = one per core). With several
+# inference workers, cores / INFERENCE_WORKERS avoids oversubscription.
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+
+# Recognition micro-batching: concurrent /recognize requests are embedded and
+# searched together, up to BATCH_MAX_SIZE faces or BATCH_MAX_WAIT_MS of waiting
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "2"))
+
+# Longest side JPEG uploads are decoded to (in the DCT domain) for face
+# detection; faces are cropped from a second decode only when needed (0 = off)
+DETECTION_MAX_SIDE = int(os.getenv("DETECTION_MAX_SIDE", "640"))
+
+# Vector store persistence: changes go to an append-only log, and a full
+# index snapshot is written in the background every VECTOR_SNAPSHOT_EVERY changes
+VECTOR_SNAPSHOT_EVERY = int(os.getenv("VECTOR_SNAPSHOT_EVERY", "1000"))
+VECTOR_WAL_FSYNC = os.getenv("VECTOR_WAL_FSYNC", "false").lower() == "true"
+
+# Vector index for large galleries: flat (exact), hnsw, ivf_flat, ivf_pq, or a
+# compressed flat index: sq_fp16 (2 bytes/dim), sq_int8 (1 byte/dim) or pq.
+# Galleries use an exact flat index until they reach VECTOR_ANN_THRESHOLD embeddings
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+VECTOR_ANN_THRESHOLD = int(os.getenv("VECTOR_ANN_THRESHOLD", "100000"))
+
+# HNSW graph degree and candidate list sizes (efSearch trades recall for latency)
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+# IVF lists (0 = 4 * sqrt(gallery size)), lists probed per search (recall vs
+# latency) and PQ bytes per vector (ivf_pq and pq)
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+IVF_PQ_M = int(os.getenv("IVF_PQ_M", "64"))
+
+# Re-score the top k * VECTOR_RERANK hits of a quantized index (ivf_pq, sq_*, pq)
+# with the exact embeddings stored in the database (0 = off)
+VECTOR_RERANK = int(os.getenv("VECTOR_RERANK", "0"))
+
+# Users whose name/email are cached in memory for recognition (LRU beyond that)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "100000"))
+
+# On startup, compare the FAISS index with the users in the database and
+# re-index missing users from their stored embeddings (rebuilding the whole
+# index if it was lost), using INDEX_REBUILD_WORKERS processes (0 = one per core)
+INDEX_SYNC_ON_STARTUP = os.getenv("INDEX_SYNC_ON_STARTUP", "true").lower() == "true"
+INDEX_REBUILD_WORKERS = int(os.getenv("INDEX_REBUILD_WORKERS", "0"))
+
+# Precision embeddings are stored with in the database: float32 (exact) or
+# float16 (half the size, for rebuilding the index only)
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")
+
+# SQLite connections kept open (WAL mode, shared by all threads)
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "8"))
+
+# Users per /users page (default and maximum)
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "100"))
+USERS_PAGE_MAX = int(os.getenv("USERS_PAGE_MAX", "1000"))
+
+# Bulk enrollment: threads decoding/detecting/embedding photos (alongside the
+# inference executor) and photos per database transaction
+BULK_ENROLL_WORKERS = int(os.getenv("BULK_ENROLL_WORKERS", "2"))
+BULK_ENROLL_BATCH_SIZE = int(os.getenv("BULK_ENROLL_BATCH_SIZE", "500"))
+
+# How a user's face samples are indexed: one aggregated vector per user
+# ("mean" or "medoid") or every sample ("all"), scored per user by the best
+# ("max") or average ("mean") sample similarity; and samples kept per user
+TEMPLATE_MODE = os.getenv("TEMPLATE_MODE", "mean")
+SAMPLE_SCORING = os.getenv("SAMPLE_SCORING", "max")
+MAX_SAMPLES_PER_USER = int(os.getenv("MAX_SAMPLES_PER_USER", "10"))
+
+# Keep the gallery in a memory-mapped file shared by all server processes (run
+# several uvicorn workers without a copy per worker); exact search only, the
+# ANN and re-ranking settings above are ignored
+VECTOR_SHARED_GALLERY = os.getenv("VECTOR_SHARED_GALLERY", "false").lower() == "true"
+
+# Search backend: "faiss" (VectorStore, all index types) or "numpy" (exact
+# search over a NumPy matrix, no faiss-cpu needed; fine below ~50K embeddings)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "faiss")
+
+# Replace the face detector and embedder with model-free stubs (one
+# deterministic face per image) to load test the API, database and vector
+# store without inference cost. Never enable in production.
+STUB_MODELS = os.getenv("STUB_MODELS", "false").lower() == "true"
+
+# Time each pipeline stage (decode, detect, embed, search, database), count
+# recognition outcomes and serve them on /metrics in the Prometheus format.
+# When disabled nothing is instrumented and /metrics returns 404.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+
+# On-demand profiling: a request sent with "X-Profile: <PROFILING_TOKEN>" has
+# every thread sampled each PROFILE_INTERVAL_MS while it runs, and the profile
+# (collapsed stacks for flamegraphs) saved under data/profiles. Empty = off.
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+
+# Rolling sampler: sample all threads every SLOW_REQUEST_SAMPLE_MS and save the
+# profile of any request slower than SLOW_REQUEST_PROFILE_MS (0 = off); keep
+# the newest PROFILE_KEEP profiles
+SLOW_REQUEST_PROFILE_MS = float(os.getenv("SLOW_REQUEST_PROFILE_MS", "0"))
+SLOW_REQUEST_SAMPLE_MS = float(os.getenv("SLOW_REQUEST_SAMPLE_MS", "10"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))
+
+# Load models and storage in a background task so the server answers /health
+# (with per-component progress) immediately; other requests wait until loaded.
+# Components load concurrently either way.
+BACKGROUND_STARTUP = os.getenv("BACKGROUND_STARTUP", "false").lower() == "true"
+
+# Directory of ONNX Runtime optimized model files, written on first load and
+# used by later starts (and other workers) to skip graph optimization. Empty = off.
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "")
+
+# Secret for admin operations, sent in the X-Admin-Token header: currently
+# GET /stats?benchmark=true (expensive recall sweep). Empty = disabled.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
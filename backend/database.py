@@ -1,15 +1,42 @@
 """Database operations using SQLAlchemy and SQLite."""
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, LargeBinary
+from sqlalchemy import (
+    create_engine, event, func, Column, ForeignKey, Integer, String, DateTime, LargeBinary, UniqueConstraint
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+import numpy as np
+import base64
 import os
 import json
+import struct
+
+from templates import aggregate_embeddings
 
 Base = declarative_base()
 
+# Bound parameters per IN (...) query (older SQLite builds allow 999)
+MAX_QUERY_PARAMS = 900
+
+# Attempts at storing a face sample when concurrent requests take the same slot
+SAMPLE_WRITE_ATTEMPTS = 5
+
+# Stored embedding format: header (magic, version, dtype code), 12-byte nonce,
+# then the raw vector bytes under AES-256-GCM with the header as associated data.
+# Rows without the magic are legacy Fernet tokens of a JSON float list.
+EMBEDDING_MAGIC = b'HFE'
+EMBEDDING_VERSION = 1
+EMBEDDING_HEADER = struct.Struct('<3sBB')
+EMBEDDING_DTYPES = {1: np.float32, 2: np.float16}
+NONCE_SIZE = 12
+
 
 class User(Base):
     """User model for storing enrolled users."""
@@ -22,28 +49,126 @@ class User(Base):
     embedding_encrypted = Column(LargeBinary, nullable=True)  # Encrypted embedding
 
 
+class FaceSample(Base):
+    """Face captures of a user; the user's embedding is aggregated from them."""
+    __tablename__ = 'face_samples'
+    __table_args__ = (UniqueConstraint('user_id', 'slot'),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    slot = Column(Integer, nullable=False)  # 0, 1, 2, ... per user
+    captured_at = Column(DateTime, default=datetime.utcnow)
+    embedding_encrypted = Column(LargeBinary, nullable=False)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Tune every new SQLite connection of the pool."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")  # Readers don't block the writer or each other
+    cursor.execute("PRAGMA synchronous=NORMAL")  # fsync at checkpoints only (durable with WAL)
+    cursor.execute("PRAGMA busy_timeout=30000")  # Wait for the write lock instead of failing
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")  # Memory-map up to 256 MB for reads
+    cursor.close()
+
+
+class EmbeddingCipher:
+    """Authenticated encryption of embeddings as raw float32/float16 bytes."""
+    
+    def __init__(self, encryption_key: bytes, dtype: str = "float32"):
+        """
+        Initialize cipher.
+        
+        Args:
+            encryption_key: Fernet key (the AES-GCM key is derived from it)
+            dtype: Storage precision of new embeddings ("float32" or "float16")
+        """
+        dtype_codes = {np.dtype(value).name: code for code, value in EMBEDDING_DTYPES.items()}
+        if dtype not in dtype_codes:
+            raise ValueError(f"Unsupported embedding dtype '{dtype}', expected one of {list(dtype_codes)}")
+        self.dtype_code = dtype_codes[dtype]
+        
+        # Legacy rows
+        self.fernet = Fernet(encryption_key)
+        
+        key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"helloface embedding v1"
+        ).derive(base64.urlsafe_b64decode(encryption_key))
+        self.aead = AESGCM(key)
+    
+    def encrypt(self, embedding: np.ndarray) -> bytes:
+        """Encrypt an embedding vector."""
+        data = np.asarray(embedding, dtype=EMBEDDING_DTYPES[self.dtype_code]).tobytes()
+        header = EMBEDDING_HEADER.pack(EMBEDDING_MAGIC, EMBEDDING_VERSION, self.dtype_code)
+        nonce = os.urandom(NONCE_SIZE)
+        return header + nonce + self.aead.encrypt(nonce, data, header)
+    
+    def decrypt(self, encrypted: bytes) -> np.ndarray:
+        """
+        Decrypt a stored embedding of either format.
+        
+        Returns:
+            float32 embedding vector
+            
+        Raises:
+            ValueError: Unknown format version
+            cryptography.exceptions.InvalidTag / InvalidToken: Tampered or foreign data
+        """
+        if not self.is_current(encrypted):
+            return np.array(json.loads(self.fernet.decrypt(encrypted)), dtype=np.float32)
+        
+        _, version, dtype_code = EMBEDDING_HEADER.unpack_from(encrypted)
+        if version != EMBEDDING_VERSION or dtype_code not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unsupported embedding format (version {version}, dtype {dtype_code})")
+        
+        header = encrypted[:EMBEDDING_HEADER.size]
+        nonce = encrypted[EMBEDDING_HEADER.size:EMBEDDING_HEADER.size + NONCE_SIZE]
+        data = self.aead.decrypt(nonce, encrypted[EMBEDDING_HEADER.size + NONCE_SIZE:], header)
+        return np.frombuffer(data, dtype=EMBEDDING_DTYPES[dtype_code]).astype(np.float32)
+    
+    @staticmethod
+    def is_current(encrypted: bytes) -> bool:
+        """Check whether a stored embedding uses the binary format."""
+        return encrypted[:len(EMBEDDING_MAGIC)] == EMBEDDING_MAGIC
+
+
 class Database:
     """Database manager with encryption support."""
     
-    def __init__(self, db_path: str = "data/helloface.db", encryption_key: Optional[bytes] = None):
+    def __init__(self, db_path: str = "data/helloface.db", encryption_key: Optional[bytes] = None,
+                 embedding_dtype: str = "float32", pool_size: int = 8):
         """
         Initialize database connection.
         
         Args:
             db_path: Path to SQLite database file
             encryption_key: Fernet encryption key for embeddings
+            embedding_dtype: Storage precision of new embeddings ("float32" or "float16")
+            pool_size: Pooled SQLite connections kept open
         """
         # Create data directory if needed
         os.makedirs(os.path.dirname(db_path) if os.path.dirname(db_path) else ".", exist_ok=True)
         
-        # Create engine
-        self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
+        # Create engine with a pool of WAL-mode connections shared by all threads
+        self.engine = create_engine(
+            f'sqlite:///{db_path}',
+            echo=False,
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=pool_size,
+            connect_args={"check_same_thread": False, "timeout": 30}
+        )
+        event.listen(self.engine, "connect", _set_sqlite_pragmas)
         
         # Create tables
         Base.metadata.create_all(self.engine)
         
-        # Create session factory
-        self.SessionLocal = sessionmaker(bind=self.engine)
+        # Create session factory (objects stay readable after commit and close)
+        self.SessionLocal = sessionmaker(bind=self.engine, expire_on_commit=False)
         
         # Setup encryption
         if encryption_key is None:
@@ -57,23 +182,23 @@ class Database:
                 with open(key_path, 'wb') as f:
                     f.write(encryption_key)
         
-        self.cipher = Fernet(encryption_key)
+        self.encryption_key = encryption_key
+        self.embedding_dtype = embedding_dtype
+        self.cipher = EmbeddingCipher(encryption_key, embedding_dtype)
     
     def get_session(self) -> Session:
         """Get a new database session."""
         return self.SessionLocal()
     
-    def encrypt_embedding(self, embedding: list) -> bytes:
+    def encrypt_embedding(self, embedding: np.ndarray) -> bytes:
         """Encrypt embedding for storage."""
-        embedding_json = json.dumps(embedding)
-        return self.cipher.encrypt(embedding_json.encode())
+        return self.cipher.encrypt(embedding)
     
-    def decrypt_embedding(self, encrypted: bytes) -> list:
+    def decrypt_embedding(self, encrypted: bytes) -> np.ndarray:
         """Decrypt embedding from storage."""
-        decrypted = self.cipher.decrypt(encrypted)
-        return json.loads(decrypted.decode())
+        return self.cipher.decrypt(encrypted)
     
-    def create_user(self, name: str, email: str, embedding: Optional[list] = None) -> User:
+    def create_user(self, name: str, email: str, embedding: Optional[np.ndarray] = None) -> User:
         """
         Create a new user.
         
@@ -99,11 +224,39 @@ class Database:
             )
             session.add(user)
             session.commit()
-            session.refresh(user)
             return user
         finally:
             session.close()
     
+    def create_users(self, users: List[Tuple[str, str, Optional[np.ndarray]]]) -> List[User]:
+        """
+        Create several users in one transaction.
+        
+        Args:
+            users: List of (name, email, embedding or None)
+            
+        Returns:
+            Created User objects, in input order
+            
+        Raises:
+            sqlalchemy.exc.IntegrityError: An email already exists (nothing is created)
+        """
+        session = self.get_session()
+        try:
+            created = [
+                User(
+                    name=name,
+                    email=email,
+                    embedding_encrypted=self.encrypt_embedding(embedding) if embedding is not None else None
+                )
+                for name, email, embedding in users
+            ]
+            session.add_all(created)
+            session.commit()
+            return created
+        finally:
+            session.close()
+    
     def get_user(self, user_id: int) -> Optional[User]:
         """Get user by ID."""
         session = self.get_session()
@@ -112,6 +265,18 @@ class Database:
         finally:
             session.close()
     
+    def get_users_by_ids(self, user_ids: List[int]) -> Dict[int, User]:
+        """Get several users by ID (one query per MAX_QUERY_PARAMS IDs)."""
+        session = self.get_session()
+        try:
+            users = {}
+            for start in range(0, len(user_ids), MAX_QUERY_PARAMS):
+                for user in session.query(User).filter(User.id.in_(user_ids[start:start + MAX_QUERY_PARAMS])):
+                    users[user.id] = user
+            return users
+        finally:
+            session.close()
+    
     def get_user_by_email(self, email: str) -> Optional[User]:
         """Get user by email."""
         session = self.get_session()
@@ -120,6 +285,18 @@ class Database:
         finally:
             session.close()
     
+    def get_existing_emails(self, emails: List[str]) -> Set[str]:
+        """Get which of the given emails are already enrolled."""
+        session = self.get_session()
+        try:
+            existing = set()
+            for start in range(0, len(emails), MAX_QUERY_PARAMS):
+                rows = session.query(User.email).filter(User.email.in_(emails[start:start + MAX_QUERY_PARAMS]))
+                existing.update(email for email, in rows)
+            return existing
+        finally:
+            session.close()
+    
     def get_all_users(self) -> List[User]:
         """Get all users."""
         session = self.get_session()
@@ -128,6 +305,205 @@ class Database:
         finally:
             session.close()
     
+    def get_user_summaries(self, limit: Optional[int] = None, newest_first: bool = True,
+                           after_id: Optional[int] = None) -> List[Tuple[int, str, str, datetime]]:
+        """
+        Get (id, name, email, enrolled_at) of users in enrollment order.
+        
+        Only these columns are loaded, not the encrypted embeddings.
+        
+        Args:
+            limit: Maximum number of users (None = all)
+            newest_first: Most recently enrolled users first
+            after_id: Only users with a higher ID (keyset pagination, oldest first)
+        """
+        session = self.get_session()
+        try:
+            order = User.id.desc() if newest_first else User.id
+            query = session.query(User.id, User.name, User.email, User.enrolled_at).order_by(order)
+            if after_id is not None:
+                query = query.filter(User.id > after_id)
+            if limit is not None:
+                query = query.limit(limit)
+            return [tuple(row) for row in query.all()]
+        finally:
+            session.close()
+    
+    def iter_user_summaries(self, after_id: Optional[int] = None,
+                            chunk_size: int = 1000) -> Iterator[Tuple[int, str, str, datetime]]:
+        """
+        Stream (id, name, email, enrolled_at) of all users, oldest first.
+        
+        Each chunk is its own short query, so no connection or read
+        transaction is held while the caller consumes the rows.
+        
+        Args:
+            after_id: Start after this user ID
+            chunk_size: Rows per query
+        """
+        while True:
+            rows = self.get_user_summaries(limit=chunk_size, newest_first=False, after_id=after_id)
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            after_id = rows[-1][0]
+    
+    def get_user_ids(self, with_embedding: bool = False) -> List[int]:
+        """
+        Get IDs of all users.
+        
+        Args:
+            with_embedding: Only users with a stored embedding
+        """
+        session = self.get_session()
+        try:
+            query = session.query(User.id)
+            if with_embedding:
+                query = query.filter(User.embedding_encrypted.isnot(None))
+            return [user_id for user_id, in query.all()]
+        finally:
+            session.close()
+    
+    def iter_encrypted_embeddings(self, chunk_size: int = 10000,
+                                  user_ids: Optional[List[int]] = None) -> Iterator[List[Tuple[int, bytes]]]:
+        """
+        Stream stored embeddings without decrypting them.
+        
+        Args:
+            chunk_size: Rows per chunk
+            user_ids: Only these users (None = all users with an embedding)
+            
+        Yields:
+            Lists of (user_id, encrypted embedding) tuples
+        """
+        session = self.get_session()
+        try:
+            query = session.query(User.id, User.embedding_encrypted).filter(User.embedding_encrypted.isnot(None))
+            
+            if user_ids is not None:
+                for start in range(0, len(user_ids), MAX_QUERY_PARAMS):
+                    rows = query.filter(User.id.in_(user_ids[start:start + MAX_QUERY_PARAMS])).all()
+                    if rows:
+                        yield [tuple(row) for row in rows]
+                return
+            
+            # Keyset pagination keeps every chunk an index range scan
+            last_id = 0
+            while True:
+                rows = query.filter(User.id > last_id).order_by(User.id).limit(chunk_size).all()
+                if not rows:
+                    return
+                yield [tuple(row) for row in rows]
+                last_id = rows[-1][0]
+        finally:
+            session.close()
+    
+    def iter_encrypted_samples(self, chunk_size: int = 10000,
+                               user_ids: Optional[List[int]] = None) -> Iterator[List[Tuple[int, int, bytes]]]:
+        """
+        Stream every stored face sample without decrypting it.
+        
+        Users without sample rows (enrolled with a single capture) yield
+        their embedding as sample 0.
+        
+        Args:
+            chunk_size: Users per chunk
+            user_ids: Only these users (None = all users with an embedding)
+            
+        Yields:
+            Lists of (user_id, slot, encrypted embedding) tuples
+        """
+        session = self.get_session()
+        try:
+            for users in self.iter_encrypted_embeddings(chunk_size=chunk_size, user_ids=user_ids):
+                ids = [user_id for user_id, _ in users]
+                rows = []
+                for start in range(0, len(ids), MAX_QUERY_PARAMS):
+                    rows.extend(
+                        tuple(row) for row in
+                        session.query(FaceSample.user_id, FaceSample.slot, FaceSample.embedding_encrypted)
+                        .filter(FaceSample.user_id.in_(ids[start:start + MAX_QUERY_PARAMS]))
+                    )
+                
+                sampled = {user_id for user_id, _, _ in rows}
+                rows.extend((user_id, 0, encrypted) for user_id, encrypted in users if user_id not in sampled)
+                yield rows
+        finally:
+            session.close()
+    
+    def get_sample_slots(self) -> List[Tuple[int, int]]:
+        """Get (user_id, slot) of every stored face sample, as iter_encrypted_samples yields them."""
+        session = self.get_session()
+        try:
+            slots = [tuple(row) for row in session.query(FaceSample.user_id, FaceSample.slot)]
+            single = (
+                session.query(User.id)
+                .filter(User.embedding_encrypted.isnot(None))
+                .filter(~User.id.in_(session.query(FaceSample.user_id)))
+            )
+            return slots + [(user_id, 0) for user_id, in single]
+        finally:
+            session.close()
+    
+    def add_face_sample(self, user_id: int, embedding: np.ndarray, template_method: str = "mean",
+                        max_samples: int = 10) -> Optional[Tuple[int, np.ndarray]]:
+        """
+        Store another face sample of a user and re-aggregate their embedding.
+        
+        Users enrolled with a single capture have no sample rows yet; their
+        embedding is kept as sample 0 before the aggregate replaces it.
+        Concurrent calls for the same user that pick the same slot are retried.
+        
+        Args:
+            user_id: User ID
+            embedding: Embedding of the new capture
+            template_method: How samples are aggregated ("mean" or "medoid")
+            max_samples: Maximum samples per user
+            
+        Returns:
+            Tuple (slot of the new sample, new aggregated embedding), or None if the user is not found
+            
+        Raises:
+            ValueError: The user already has max_samples samples
+        """
+        for attempt in range(SAMPLE_WRITE_ATTEMPTS):
+            session = self.get_session()
+            try:
+                user = session.query(User).filter(User.id == user_id).first()
+                if user is None:
+                    return None
+                
+                encrypted = [
+                    blob for blob, in
+                    session.query(FaceSample.embedding_encrypted)
+                    .filter(FaceSample.user_id == user_id)
+                    .order_by(FaceSample.slot)
+                ]
+                if not encrypted and user.embedding_encrypted is not None:
+                    session.add(FaceSample(user_id=user_id, slot=0, embedding_encrypted=user.embedding_encrypted))
+                    encrypted = [user.embedding_encrypted]
+                
+                if len(encrypted) >= max_samples:
+                    raise ValueError(f"User already has {max_samples} face samples")
+                
+                # Samples are only ever appended, so slots run 0..n-1
+                slot = len(encrypted)
+                session.add(FaceSample(user_id=user_id, slot=slot, embedding_encrypted=self.encrypt_embedding(embedding)))
+                
+                samples = np.stack([self.decrypt_embedding(blob) for blob in encrypted] + [embedding])
+                template = aggregate_embeddings(samples, template_method)
+                user.embedding_encrypted = self.encrypt_embedding(template)
+                
+                session.commit()
+                return slot, template
+            except IntegrityError:
+                # A concurrent request stored a sample in the same slot; re-read and aggregate again
+                session.rollback()
+                if attempt == SAMPLE_WRITE_ATTEMPTS - 1:
+                    raise
+            finally:
+                session.close()
+    
     def delete_user(self, user_id: int) -> bool:
         """
         Delete user by ID.
@@ -142,6 +518,7 @@ class Database:
         try:
             user = session.query(User).filter(User.id == user_id).first()
             if user:
+                session.query(FaceSample).filter(FaceSample.user_id == user_id).delete()
                 session.delete(user)
                 session.commit()
                 return True
@@ -149,7 +526,33 @@ class Database:
         finally:
             session.close()
     
-    def update_user_embedding(self, user_id: int, embedding: list) -> bool:
+    def delete_users(self, user_ids: List[int]) -> int:
+        """
+        Delete several users in one transaction.
+        
+        Args:
+            user_ids: User IDs to delete
+            
+        Returns:
+            Number of users deleted
+        """
+        session = self.get_session()
+        try:
+            deleted = 0
+            for start in range(0, len(user_ids), MAX_QUERY_PARAMS):
+                chunk = user_ids[start:start + MAX_QUERY_PARAMS]
+                session.query(FaceSample).filter(FaceSample.user_id.in_(chunk)).delete(synchronize_session=False)
+                deleted += (
+                    session.query(User)
+                    .filter(User.id.in_(chunk))
+                    .delete(synchronize_session=False)
+                )
+            session.commit()
+            return deleted
+        finally:
+            session.close()
+    
+    def update_user_embedding(self, user_id: int, embedding: np.ndarray) -> bool:
         """
         Update user's embedding.
         
@@ -171,10 +574,65 @@ class Database:
         finally:
             session.close()
     
+    def migrate_embeddings(self, chunk_size: int = 1000) -> int:
+        """
+        Re-encrypt legacy JSON/Fernet embeddings in the binary format.
+        
+        Covers both user embeddings and face samples (a user's first sample
+        is a copy of the embedding they were enrolled with, so it can be a
+        legacy row too).
+        
+        Args:
+            chunk_size: Rows converted per transaction
+            
+        Returns:
+            Number of rows converted
+        """
+        return sum(self._migrate_embedding_rows(model, chunk_size) for model in (User, FaceSample))
+    
+    def _migrate_embedding_rows(self, model, chunk_size: int) -> int:
+        """Re-encrypt the legacy embeddings of one table (User or FaceSample)."""
+        session = self.get_session()
+        migrated = 0
+        last_id = 0
+        try:
+            while True:
+                rows = (
+                    session.query(model)
+                    .filter(model.id > last_id, model.embedding_encrypted.isnot(None),
+                            func.substr(model.embedding_encrypted, 1, len(EMBEDDING_MAGIC)) != EMBEDDING_MAGIC)
+                    .order_by(model.id)
+                    .limit(chunk_size)
+                    .all()
+                )
+                if not rows:
+                    return migrated
+                
+                for row in rows:
+                    row.embedding_encrypted = self.encrypt_embedding(self.decrypt_embedding(row.embedding_encrypted))
+                session.commit()
+                
+                migrated += len(rows)
+                last_id = rows[-1].id
+        finally:
+            session.close()
+    
     def get_user_count(self) -> int:
         """Get total number of users."""
         session = self.get_session()
         try:
-            return session.query(User).count()
+            return session.query(func.count(User.id)).scalar()
         finally:
             session.close()
+    
+    def instrument(self, timer) -> None:
+        """
+        Time user lookups and writes.
+        
+        Args:
+            timer: Callable (stage, function) -> timed function, see Metrics.timer
+        """
+        for method in ("get_user", "get_users_by_ids", "get_user_by_email"):
+            setattr(self, method, timer("db_lookup", getattr(self, method)))
+        for method in ("create_user", "add_face_sample", "delete_user"):
+            setattr(self, method, timer("db_write", getattr(self, method)))
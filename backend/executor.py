@@ -0,0 +1,127 @@
+"""Bounded thread pool for running blocking inference off the event loop."""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable
+
+import numpy as np
+
+
+class ExecutorBusyError(RuntimeError):
+    """Raised when the inference queue is full."""
+
+
+class InferenceExecutor:
+    """
+    Thread pool that runs blocking detection/embedding/search work.
+
+    MediaPipe, ONNX Runtime and FAISS release the GIL during inference, so a
+    small pool of threads sharing the loaded models scales across cores
+    without duplicating them per process.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue_size: int = 32, window: int = 1000):
+        """
+        Initialize executor.
+
+        Args:
+            max_workers: Number of inference threads
+            max_queue_size: Maximum jobs waiting for a thread before new jobs are rejected
+            window: Number of recent jobs kept for wait/run time statistics
+        """
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+
+        # Metrics
+        self.lock = Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_times = deque(maxlen=window)
+        self.run_times = deque(maxlen=window)
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking function on the pool and await its result.
+
+        Args:
+            func: Function to run
+            *args, **kwargs: Arguments passed to func
+
+        Returns:
+            Return value of func
+
+        Raises:
+            ExecutorBusyError: If max_queue_size jobs are already waiting
+        """
+        with self.lock:
+            if self.queued >= self.max_queue_size:
+                self.rejected += 1
+                raise ExecutorBusyError("Inference queue is full")
+            self.queued += 1
+
+        future = self.pool.submit(self._call, time.perf_counter(), func, args, kwargs)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _call(self, submitted: float, func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        """Run a job on a worker thread, recording wait and run times."""
+        started = time.perf_counter()
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+            self.wait_times.append(started - submitted)
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+                self.run_times.append(time.perf_counter() - started)
+
+    def _on_done(self, future: Future) -> None:
+        """Release the queue slot of jobs cancelled before they started."""
+        if future.cancelled():
+            with self.lock:
+                self.queued -= 1
+
+    def get_stats(self) -> dict:
+        """Get queue depth and wait/run time statistics (milliseconds)."""
+        with self.lock:
+            wait_times = list(self.wait_times)
+            run_times = list(self.run_times)
+            stats = {
+                "workers": self.max_workers,
+                "max_queue_size": self.max_queue_size,
+                "queue_depth": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
+
+        stats["wait_ms"] = self._summarize(wait_times)
+        stats["run_ms"] = self._summarize(run_times)
+        return stats
+
+    @staticmethod
+    def _summarize(times: list) -> dict:
+        """Summarize a list of durations in seconds as millisecond percentiles."""
+        if not times:
+            return {"avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+
+        times_ms = np.array(times) * 1000
+        return {
+            "avg": float(np.mean(times_ms)),
+            "p50": float(np.percentile(times_ms, 50)),
+            "p95": float(np.percentile(times_ms, 95)),
+            "max": float(np.max(times_ms))
+        }
+
+    def shutdown(self) -> None:
+        """Wait for running jobs and stop the worker threads."""
+        self.pool.shutdown(wait=True)
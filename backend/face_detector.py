@@ -6,23 +6,65 @@ from typing import List, Tuple, Optional
 import base64
 from PIL import Image
 import io
+import threading
+
+
+# ArcFace reference landmarks for a 112x112 aligned crop, in image order:
+# right eye, left eye, nose tip, right mouth corner, left mouth corner
+ARCFACE_TEMPLATE = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041]
+], dtype=np.float32)
+
+# Mouth width relative to eye distance in the ArcFace template. MediaPipe only
+# gives a mouth centre keypoint, so the corners are placed along the eye axis.
+MOUTH_TO_EYE_RATIO = float(
+    np.linalg.norm(ARCFACE_TEMPLATE[4] - ARCFACE_TEMPLATE[3]) /
+    np.linalg.norm(ARCFACE_TEMPLATE[1] - ARCFACE_TEMPLATE[0])
+)
+
+# Minimum face width (pixels) kept when decoding images for cropping, so the
+# 112x112 ArcFace input is never upsampled from a downscaled decode
+MIN_FACE_SIZE = 112
 
 
 class FaceDetector:
     """Face detector using MediaPipe Face Detection."""
     
-    def __init__(self, min_detection_confidence: float = 0.7):
+    def __init__(self, min_detection_confidence: float = 0.7, working_size: int = 0):
         """
         Initialize MediaPipe face detector.
         
         Args:
             min_detection_confidence: Minimum confidence for face detection (0-1)
+            working_size: Longest side encoded images are decoded to for detection
+                (0 = full resolution). MediaPipe runs at 192x192 internally.
         """
         self.mp_face_detection = mp.solutions.face_detection
-        self.face_detection = self.mp_face_detection.FaceDetection(
-            model_selection=1,  # 1 for full range (better for varied distances)
-            min_detection_confidence=min_detection_confidence
-        )
+        self.min_detection_confidence = min_detection_confidence
+        self.working_size = working_size
+        
+        # MediaPipe graphs are not thread-safe, so each inference thread gets its own
+        self._local = threading.local()
+        self._instances = []
+        self._instances_lock = threading.Lock()
+    
+    @property
+    def face_detection(self):
+        """MediaPipe FaceDetection instance for the calling thread."""
+        face_detection = getattr(self._local, 'face_detection', None)
+        if face_detection is None:
+            face_detection = self.mp_face_detection.FaceDetection(
+                model_selection=1,  # 1 for full range (better for varied distances)
+                min_detection_confidence=self.min_detection_confidence
+            )
+            self._local.face_detection = face_detection
+            with self._instances_lock:
+                self._instances.append(face_detection)
+        return face_detection
         
     def decode_image(self, base64_image: str) -> np.ndarray:
         """
@@ -34,25 +76,68 @@ class FaceDetector:
         Returns:
             Image as numpy array in RGB format
         """
+        return self.decode_bytes(self._b64decode(base64_image))
+    
+    @staticmethod
+    def _b64decode(base64_image: str) -> bytes:
+        """Decode a base64 string, removing any data URL prefix."""
         # Remove data URL prefix if present
         if ',' in base64_image:
             base64_image = base64_image.split(',')[1]
             
-        # Decode base64
-        image_bytes = base64.b64decode(base64_image)
-        image = Image.open(io.BytesIO(image_bytes))
+        return base64.b64decode(base64_image)
+    
+    def decode_bytes(self, image_bytes: bytes, max_side: int = 0) -> np.ndarray:
+        """
+        Decode raw JPEG/PNG bytes straight into a numpy array.
         
-        # Convert to RGB numpy array
-        image_np = np.array(image.convert('RGB'))
+        Args:
+            image_bytes: Encoded image file contents
+            max_side: If set, JPEGs are decoded at the smallest 1/2, 1/4 or 1/8
+                DCT scale whose longest side is still at least max_side
+            
+        Returns:
+            Image as numpy array in RGB format (read-only)
+            
+        Raises:
+            ValueError: If the bytes are not a decodable image
+        """
+        return self._decode(image_bytes, max_side)[0]
+    
+    @staticmethod
+    def _decode(image_bytes: bytes, max_side: int = 0) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+        Decode image bytes, optionally downscaled in the JPEG DCT domain.
         
-        return image_np
+        Returns:
+            Tuple (RGB image array, (full_width, full_height))
+        """
+        try:
+            image = Image.open(io.BytesIO(image_bytes))
+            full_size = image.size
+            
+            if max_side and max(full_size) > max_side:
+                # Only JPEG supports draft(), other formats decode at full size
+                scale = max_side / max(full_size)
+                image.draft('RGB', (int(full_size[0] * scale), int(full_size[1] * scale)))
+            
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            
+            # Single copy from the decoder into numpy
+            return np.asarray(image), full_size
+        except (OSError, Image.DecompressionBombError):
+            # DecompressionBombError: dimensions over twice Image.MAX_IMAGE_PIXELS
+            raise ValueError("Could not decode image")
     
-    def detect_faces(self, image: np.ndarray) -> List[Tuple[np.ndarray, dict]]:
+    def detect_faces(self, image: np.ndarray, align: bool = False) -> List[Tuple[np.ndarray, dict]]:
         """
         Detect faces in image and return cropped face regions.
         
         Args:
             image: Input image as numpy array (RGB)
+            align: If True, return 112x112 crops aligned to the ArcFace template
+                instead of padded bounding box crops
             
         Returns:
             List of tuples (cropped_face, bounding_box_dict)
@@ -65,60 +150,193 @@ class FaceDetector:
             image = cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
             
         # Detect faces
+        detections = self._detect(image)
+        
+        h, w, _ = image.shape
+        faces = [
+            (self._crop_face(image, detection, align), self._padded_box(detection, w, h))
+            for detection in detections
+        ]
+        return [(crop, box) for crop, box in faces if crop is not None]
+    
+    def _detect(self, image: np.ndarray) -> list:
+        """Run MediaPipe on an RGB image and return its detections."""
         results = self.face_detection.process(image)
+        return results.detections or []
+    
+    @staticmethod
+    def _padded_box(detection, w: int, h: int) -> dict:
+        """
+        Get the padded bounding box of a detection in pixel coordinates.
         
-        faces = []
-        if results.detections:
-            h, w, _ = image.shape
+        Args:
+            detection: MediaPipe detection result
+            w: Image width
+            h: Image height
             
-            for detection in results.detections:
-                # Get bounding box
-                bbox = detection.location_data.relative_bounding_box
-                
-                # Convert to absolute coordinates
-                x = int(bbox.xmin * w)
-                y = int(bbox.ymin * h)
-                width = int(bbox.width * w)
-                height = int(bbox.height * h)
-                
-                # Add padding (30% on each side) to ensure InsightFace has enough context
-                padding_x = int(width * 0.3)
-                padding_y = int(height * 0.3)
-                
-                x = max(0, x - padding_x)
-                y = max(0, y - padding_y)
-                width = min(w - x, width + 2 * padding_x)
-                height = min(h - y, height + 2 * padding_y)
-                
-                # Crop face region
-                face_crop = image[y:y+height, x:x+width]
-                
-                # Store bounding box info
-                bbox_dict = {
-                    'x': x,
-                    'y': y,
-                    'width': width,
-                    'height': height
-                }
-                
-                faces.append((face_crop, bbox_dict))
-        
-        return faces
+        Returns:
+            Bounding box dict {x, y, width, height}
+        """
+        # Get bounding box
+        bbox = detection.location_data.relative_bounding_box
+        
+        # Convert to absolute coordinates
+        x = int(bbox.xmin * w)
+        y = int(bbox.ymin * h)
+        width = int(bbox.width * w)
+        height = int(bbox.height * h)
+        
+        # Add padding (30% on each side) to ensure InsightFace has enough context
+        padding_x = int(width * 0.3)
+        padding_y = int(height * 0.3)
+        
+        x = max(0, x - padding_x)
+        y = max(0, y - padding_y)
+        width = min(w - x, width + 2 * padding_x)
+        height = min(h - y, height + 2 * padding_y)
+        
+        return {
+            'x': x,
+            'y': y,
+            'width': width,
+            'height': height
+        }
     
-    def detect_from_base64(self, base64_image: str) -> List[Tuple[np.ndarray, dict]]:
+    def _crop_face(self, image: np.ndarray, detection, align: bool) -> Optional[np.ndarray]:
+        """
+        Crop (or align) a detected face from an image of any resolution.
+        
+        Returns:
+            Face crop, or None if the detection is empty after clipping to the image
+        """
+        h, w, _ = image.shape
+        
+        if align:
+            landmarks = self._get_landmarks(detection, w, h)
+            aligned = self.align_face(image, landmarks)
+            if aligned is not None:
+                return aligned
+        
+        box = self._padded_box(detection, w, h)
+        crop = image[box['y']:box['y'] + box['height'], box['x']:box['x'] + box['width']]
+        if crop.size == 0:
+            return None
+        if align:
+            # Degenerate landmarks (tiny face, clipped at the edge): plain crop at the ArcFace size
+            return cv2.resize(crop, (112, 112), interpolation=cv2.INTER_AREA)
+        return crop
+    
+    @staticmethod
+    def _get_landmarks(detection, w: int, h: int) -> np.ndarray:
+        """
+        Build 5-point landmarks from MediaPipe keypoints.
+        
+        Args:
+            detection: MediaPipe detection result
+            w: Image width
+            h: Image height
+            
+        Returns:
+            Array of shape (5, 2) in ARCFACE_TEMPLATE order
+        """
+        keypoints = detection.location_data.relative_keypoints
+        
+        # MediaPipe keypoints: right eye, left eye, nose tip, mouth centre, ...
+        right_eye, left_eye, nose, mouth = (
+            np.array([kp.x * w, kp.y * h], dtype=np.float32) for kp in keypoints[:4]
+        )
+        
+        # Place mouth corners around the mouth centre, parallel to the eye axis
+        half_mouth = (left_eye - right_eye) * (MOUTH_TO_EYE_RATIO / 2)
+        
+        return np.array([
+            right_eye,
+            left_eye,
+            nose,
+            mouth - half_mouth,
+            mouth + half_mouth
+        ], dtype=np.float32)
+    
+    @staticmethod
+    def align_face(image: np.ndarray, landmarks: np.ndarray, image_size: int = 112) -> Optional[np.ndarray]:
+        """
+        Warp a face to the ArcFace template using a similarity transform.
+        
+        Args:
+            image: Full image as numpy array (RGB)
+            landmarks: 5-point landmarks of shape (5, 2)
+            image_size: Output crop size (multiple of 112)
+            
+        Returns:
+            Aligned face crop of shape (image_size, image_size, 3), or None if
+            the landmarks are degenerate (coincident or collinear)
+        """
+        template = ARCFACE_TEMPLATE * (image_size / 112.0)
+        matrix, _ = cv2.estimateAffinePartial2D(landmarks, template, method=cv2.LMEDS)
+        if matrix is None:
+            return None
+        return cv2.warpAffine(image, matrix, (image_size, image_size), borderValue=0.0)
+    
+    def detect_from_base64(self, base64_image: str, align: bool = False) -> List[Tuple[np.ndarray, dict]]:
         """
         Detect faces from base64 encoded image.
         
         Args:
             base64_image: Base64 encoded image string
+            align: If True, return ArcFace-aligned 112x112 crops
+            
+        Returns:
+            List of tuples (cropped_face, bounding_box_dict)
+        """
+        return self.detect_from_bytes(self._b64decode(base64_image), align=align)
+    
+    def detect_from_bytes(self, image_bytes: bytes, align: bool = False) -> List[Tuple[np.ndarray, dict]]:
+        """
+        Detect faces from raw encoded image bytes.
+        
+        JPEGs are decoded at the detector's working resolution. Face crops are
+        then taken from a second decode at the smallest scale that keeps every
+        face at least MIN_FACE_SIZE pixels wide (or from the working image if
+        it already does), so large photos are never fully decoded for nothing.
+        Bounding boxes are in full-resolution pixel coordinates.
+        
+        Args:
+            image_bytes: Encoded JPEG/PNG file contents
+            align: If True, return ArcFace-aligned 112x112 crops
             
         Returns:
             List of tuples (cropped_face, bounding_box_dict)
         """
-        image = self.decode_image(base64_image)
-        return self.detect_faces(image)
+        image, (full_w, full_h) = self._decode(image_bytes, self.working_size)
+        detections = self._detect(image)
+        
+        if detections and image.shape[1] < full_w:
+            # Resolution the smallest face needs, relative to full size
+            min_face_width = min(d.location_data.relative_bounding_box.width for d in detections) * full_w
+            crop_side = int(np.ceil(max(full_w, full_h) * min(1.0, MIN_FACE_SIZE / max(min_face_width, 1))))
+            
+            if crop_side > max(image.shape[:2]):
+                image, _ = self._decode(image_bytes, crop_side)
+        
+        faces = [
+            (self._crop_face(image, detection, align), self._padded_box(detection, full_w, full_h))
+            for detection in detections
+        ]
+        return [(crop, box) for crop, box in faces if crop is not None]
+    
+    def instrument(self, timer) -> None:
+        """
+        Time base64 decoding, image decoding, MediaPipe and cropping/alignment.
+        
+        Args:
+            timer: Callable (stage, function) -> timed function, see Metrics.timer
+        """
+        self._b64decode = timer("base64_decode", self._b64decode)
+        self._decode = timer("decode", self._decode)
+        self._detect = timer("detect", self._detect)
+        self._crop_face = timer("align", self._crop_face)
     
     def __del__(self):
         """Cleanup MediaPipe resources."""
-        if hasattr(self, 'face_detection'):
-            self.face_detection.close()
+        for face_detection in getattr(self, '_instances', []):
+            face_detection.close()
@@ -1,57 +1,152 @@
 """Face embedding generation using InsightFace."""
 import numpy as np
 import cv2
-from insightface.app import FaceAnalysis
+import onnxruntime
+from insightface.app.common import Face
+from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+from insightface.model_zoo.retinaface import RetinaFace
+from insightface.utils import ensure_available
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 import os
+import threading
+
+
+# ArcFace recognition model file inside each InsightFace model pack
+RECOGNITION_MODELS = {
+    'buffalo_l': 'w600k_r50.onnx',
+    'buffalo_m': 'w600k_r50.onnx',
+    'buffalo_s': 'w600k_mbf.onnx',
+    'buffalo_sc': 'w600k_mbf.onnx',
+    'antelopev2': 'glintr100.onnx',
+}
+
+# SCRFD detection model file inside each pack (two-pass mode only)
+DETECTION_MODELS = {
+    'buffalo_l': 'det_10g.onnx',
+    'buffalo_m': 'det_2.5g.onnx',
+    'buffalo_s': 'det_500m.onnx',
+    'buffalo_sc': 'det_500m.onnx',
+    'antelopev2': 'scrfd_10g_bnkps.onnx',
+}
 
 
 class FaceEmbedder:
     """Face embedder using InsightFace (ArcFace model)."""
     
-    def __init__(self, model_name: str = 'buffalo_l'):
+    def __init__(self, model_name: str = 'buffalo_l', single_pass: bool = False,
+                 intra_op_threads: int = 0, cache_dir: str = ""):
         """
-        Initialize InsightFace model.
+        Initialize InsightFace models.
+        
+        Only the ONNX models the pipeline runs are loaded, not the whole pack
+        (buffalo_l also ships landmark and gender/age models).
         
         Args:
             model_name: Model name ('buffalo_l' for high accuracy, 'buffalo_s' for speed)
+            single_pass: If True, load only the ArcFace recognition model and embed
+                pre-aligned 112x112 crops directly, without a second detection pass
+            intra_op_threads: ONNX Runtime threads per inference call (0 = ORT default,
+                one per core). Set to cores / inference workers to avoid oversubscription.
+            cache_dir: If set, ONNX Runtime optimized graphs are saved here on first
+                load and later sessions are created from them
         """
-        # Initialize FaceAnalysis
-        self.app = FaceAnalysis(
-            name=model_name,
-            providers=['CPUExecutionProvider']  # CPU-only
-        )
+        self.single_pass = single_pass
+        self.intra_op_threads = intra_op_threads
+        self.cache_dir = cache_dir
+        self.det_model = None
+        
+        # Download the pack if needed
+        model_dir = ensure_available('models', model_name)
+        rec_file = os.path.join(model_dir, RECOGNITION_MODELS[model_name])
         
-        # Prepare model (downloads if needed)
-        self.app.prepare(ctx_id=-1, det_size=(640, 640))
+        if single_pass:
+            self.rec_model = self._load_recognition(rec_file)
+        else:
+            # Two-pass mode re-detects the face in each crop with SCRFD; load both models at once
+            det_file = os.path.join(model_dir, DETECTION_MODELS[model_name])
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="model-load") as pool:
+                detection = pool.submit(self._create_session, det_file)
+                self.rec_model = self._load_recognition(rec_file)
+                self.det_model = RetinaFace(model_file=det_file, session=detection.result())
+            self.det_model.prepare(ctx_id=-1, input_size=(640, 640), det_thresh=0.5)
         
         self.embedding_size = 512  # ArcFace produces 512-dim embeddings
+    
+    def _load_recognition(self, model_file: str) -> ArcFaceONNX:
+        """Load an ArcFace model on a session with the configured options."""
+        return ArcFaceONNX(model_file=model_file, session=self._create_session(model_file))
+        
+    def _create_session(self, model_file: str) -> onnxruntime.InferenceSession:
+        """
+        Create a CPU ONNX Runtime session with the configured options.
+        
+        With a cache directory, the first load saves the model's optimized
+        graph (extended level, so it stays portable across CPUs) from a
+        throwaway session; every serving session, the first included, is then
+        created from the cached graph with all optimizations on top.
+        """
+        path = model_file
+        if self.cache_dir:
+            stat = os.stat(model_file)
+            name = os.path.splitext(os.path.basename(model_file))[0]
+            path = os.path.join(
+                self.cache_dir, f"{name}-{stat.st_size}-{stat.st_mtime_ns}-ort{onnxruntime.__version__}.onnx"
+            )
+            if not os.path.exists(path):
+                self._save_optimized(model_file, path)
+        
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        return onnxruntime.InferenceSession(
+            path,
+            sess_options=options,
+            providers=['CPUExecutionProvider']  # CPU-only
+        )
+    
+    @staticmethod
+    def _save_optimized(model_file: str, cached: str) -> None:
+        """Write the extended-level optimized graph of a model to the cache."""
+        # Written under a unique name, then renamed, so workers never read a partial file
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        saving = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+        
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        options.optimized_model_filepath = saving
+        onnxruntime.InferenceSession(model_file, sess_options=options, providers=['CPUExecutionProvider'])
+        os.replace(saving, cached)
         
     def get_embedding(self, face_image: np.ndarray) -> Optional[np.ndarray]:
         """
         Generate face embedding from cropped face image.
         
         Args:
-            face_image: Cropped face image as numpy array (RGB)
+            face_image: Cropped face image as numpy array (RGB). In single-pass
+                mode this must be a 112x112 crop aligned by FaceDetector.
             
         Returns:
             512-dimensional embedding vector (L2 normalized) or None if no face detected
         """
+        if self.single_pass:
+            # Crop is already aligned, run ArcFace directly
+            return self._embed_aligned([face_image])[0]
+        
         # Convert RGB to BGR (InsightFace expects BGR)
         face_bgr = cv2.cvtColor(face_image, cv2.COLOR_RGB2BGR)
         
-        # Get face embeddings
-        faces = self.app.get(face_bgr)
+        # Detect the face again in the crop, for its keypoints
+        bboxes, kpss = self.det_model.detect(face_bgr, max_num=0, metric='default')
         
-        if len(faces) == 0:
-            print(f"DEBUG: InsightFace failed to detect face in crop. Shape: {face_bgr.shape}")
+        if len(bboxes) == 0:
+            # SCRFD missed the face MediaPipe found; callers report it as a failed embedding
             return None
         
         # Get the first (and should be only) face
-        face = faces[0]
+        face = Face(bbox=bboxes[0, 0:4], kps=kpss[0] if kpss is not None else None, det_score=bboxes[0, 4])
         
-        # Extract embedding (already L2 normalized by InsightFace)
-        embedding = face.embedding
+        # Align on the keypoints and extract the embedding
+        embedding = self.rec_model.get(face_bgr, face)
         
         # Ensure it's normalized (cosine similarity)
         embedding = embedding / np.linalg.norm(embedding)
@@ -62,18 +157,58 @@ class FaceEmbedder:
         """
         Generate embeddings for multiple faces.
         
+        In single-pass mode all crops go through ArcFace as one batch.
+        
         Args:
             face_images: List of cropped face images
             
         Returns:
             List of embeddings (some may be None if face not detected)
         """
+        if self.single_pass:
+            return list(self._embed_aligned(face_images)) if face_images else []
+        
         embeddings = []
         for face_image in face_images:
             embedding = self.get_embedding(face_image)
             embeddings.append(embedding)
         return embeddings
     
+    def _embed_aligned(self, face_images: list) -> np.ndarray:
+        """
+        Run ArcFace on aligned 112x112 RGB crops in a single ONNX call.
+        
+        Args:
+            face_images: List of aligned face crops (RGB)
+            
+        Returns:
+            L2 normalized embeddings of shape (len(face_images), 512)
+        """
+        model = self.rec_model
+        
+        # Crops are already RGB, so build the NCHW blob without a BGR round trip
+        blob = cv2.dnn.blobFromImages(
+            face_images, 1.0 / model.input_std, model.input_size,
+            (model.input_mean, model.input_mean, model.input_mean), swapRB=False
+        )
+        embeddings = model.session.run(model.output_names, {model.input_name: blob})[0]
+        
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    
+    def instrument(self, timer) -> None:
+        """
+        Time ArcFace and, in two-pass mode, InsightFace's detection on the crop.
+        
+        Args:
+            timer: Callable (stage, function) -> timed function, see Metrics.timer
+        """
+        if self.single_pass:
+            self._embed_aligned = timer("embed", self._embed_aligned)
+            return
+        
+        self.det_model.detect = timer("insightface_detect", self.det_model.detect)
+        self.rec_model.get = timer("embed", self.rec_model.get)
+    
     @staticmethod
     def cosine_similarity(embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """
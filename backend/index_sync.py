@@ -0,0 +1,197 @@
+"""Rebuild and repair the FAISS index from embeddings stored in the database."""
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from database import Database, EmbeddingCipher
+from vector_store import VectorStore
+from templates import MAX_SAMPLE_SLOTS, SAMPLE_KEY_BITS, sample_key
+
+
+# Rebuild the whole index when more than this fraction of users is missing from it
+FULL_REBUILD_RATIO = 0.5
+
+_cipher: Optional[EmbeddingCipher] = None
+
+
+def _init_worker(encryption_key: bytes) -> None:
+    """Set up the cipher in a decryption worker process."""
+    global _cipher
+    _cipher = EmbeddingCipher(encryption_key)
+
+
+def _decrypt_chunk(rows: List[Tuple[int, bytes]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Decrypt a chunk of (user_id, encrypted embedding) rows into an ID array and a matrix."""
+    ids = np.array([user_id for user_id, _ in rows], dtype='int64')
+    vectors = np.stack([_cipher.decrypt(encrypted) for _, encrypted in rows])
+    return ids, vectors
+
+
+def load_embeddings(database: Database, user_ids: Optional[List[int]] = None,
+                    chunk_size: int = 10000, workers: int = 0,
+                    samples: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Read and decrypt stored embeddings.
+
+    Chunks are streamed out of SQLite while worker processes decrypt the
+    previous ones (legacy Fernet/JSON rows are CPU bound and hold the GIL).
+    Only a few chunks per worker are read ahead.
+
+    Args:
+        database: Database to read from
+        user_ids: Only these users (None = all users with an embedding)
+        chunk_size: Rows per chunk
+        workers: Decryption processes (0 = one per core, 1 = decrypt in this process)
+        samples: Load every face sample, keyed by sample key, instead of one embedding per user
+
+    Returns:
+        Tuple of (user_ids or sample keys, embeddings matrix)
+    """
+    workers = workers or os.cpu_count() or 1
+    if samples:
+        chunks = (
+            [(sample_key(user_id, slot), encrypted) for user_id, slot, encrypted in rows]
+            for rows in database.iter_encrypted_samples(chunk_size=chunk_size, user_ids=user_ids)
+        )
+    else:
+        chunks = database.iter_encrypted_embeddings(chunk_size=chunk_size, user_ids=user_ids)
+
+    if workers == 1:
+        _init_worker(database.encryption_key)
+        results = [_decrypt_chunk(rows) for rows in chunks]
+    else:
+        results = []
+        in_flight = deque()
+
+        # Spawned workers don't inherit the parent's model/FAISS threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(database.encryption_key,)) as pool:
+            for rows in chunks:
+                in_flight.append(pool.submit(_decrypt_chunk, rows))
+                if len(in_flight) >= 2 * workers:
+                    results.append(in_flight.popleft().result())
+            results.extend(future.result() for future in in_flight)
+
+    if not results:
+        return np.zeros(0, dtype='int64'), np.zeros((0, 0), dtype='float32')
+    return np.concatenate([ids for ids, _ in results]), np.concatenate([vectors for _, vectors in results])
+
+
+def exact_vector_loader(database: Database, samples: bool = False) -> Callable[[List[int]], Dict[int, np.ndarray]]:
+    """
+    Create a loader of exact stored embeddings for re-ranking quantized search results.
+
+    Args:
+        database: Database holding the embeddings
+        samples: Keys are face sample keys (multi-sample index) instead of user IDs
+
+    Returns:
+        Function mapping index keys to {key: float32 embedding}
+    """
+    def load(keys: List[int]) -> Dict[int, np.ndarray]:
+        if samples:
+            wanted = set(keys)
+            user_ids = sorted({key >> SAMPLE_KEY_BITS for key in keys})
+            return {
+                sample_key(user_id, slot): database.decrypt_embedding(encrypted)
+                for rows in database.iter_encrypted_samples(user_ids=user_ids)
+                for user_id, slot, encrypted in rows
+                if sample_key(user_id, slot) in wanted
+            }
+        return {
+            user_id: database.decrypt_embedding(encrypted)
+            for rows in database.iter_encrypted_embeddings(user_ids=list(keys))
+            for user_id, encrypted in rows
+        }
+
+    return load
+
+
+def rebuild_index(database: Database, vector_store: VectorStore,
+                  chunk_size: int = 10000, workers: int = 0) -> int:
+    """
+    Replace the whole index with the embeddings stored in the database.
+
+    Returns:
+        Number of embeddings indexed
+    """
+    start = time.perf_counter()
+    ids, vectors = load_embeddings(database, chunk_size=chunk_size, workers=workers,
+                                   samples=vector_store.multi_sample)
+    print(f"Decrypted {len(ids)} stored embeddings in {time.perf_counter() - start:.1f}s")
+
+    vector_store.rebuild(ids, vectors.reshape(len(ids), vector_store.embedding_dim))
+    return len(ids)
+
+
+def sync_index(database: Database, vector_store: VectorStore,
+               chunk_size: int = 10000, workers: int = 0) -> dict:
+    """
+    Check that the index holds exactly the users in the database, and repair it.
+
+    Users with a stored embedding but missing from the index are added from
+    the database (or the whole index is rebuilt when most are missing).
+    Index entries without a database user are removed. Users without a
+    stored embedding are left as they are. With a multi-sample index, the
+    same is done per face sample.
+
+    Returns:
+        Dict with user counts and what was repaired
+    """
+    user_ids = np.array(database.get_user_ids(), dtype='int64')
+    index_ids = vector_store.get_ids()
+
+    if vector_store.multi_sample:
+        embedded_ids = np.array([sample_key(user_id, slot) for user_id, slot in database.get_sample_slots()],
+                                dtype='int64')
+        orphaned = np.setdiff1d(index_ids, embedded_ids)
+    else:
+        embedded_ids = np.array(database.get_user_ids(with_embedding=True), dtype='int64')
+        orphaned = np.setdiff1d(index_ids, user_ids)
+    missing = np.setdiff1d(embedded_ids, index_ids)
+
+    report = {
+        "database_users": len(user_ids),
+        "index_embeddings": len(index_ids),
+        "missing": len(missing),
+        "orphaned": len(orphaned),
+        "rebuilt": False
+    }
+
+    if len(missing) > FULL_REBUILD_RATIO * len(embedded_ids):
+        rebuild_index(database, vector_store, chunk_size=chunk_size, workers=workers)
+        report["rebuilt"] = True
+        return report
+
+    if vector_store.multi_sample and len(orphaned):
+        # Samples are removed together with the rest of their user; stored ones are re-added below
+        for user_id in np.unique(orphaned >> SAMPLE_KEY_BITS):
+            vector_store.remove_embedding(int(user_id))
+        missing = np.setdiff1d(embedded_ids, vector_store.get_ids())
+        orphaned = []
+
+    if len(missing):
+        if vector_store.multi_sample:
+            # Load the users' samples, add the missing ones
+            user_ids = np.unique(missing >> SAMPLE_KEY_BITS)
+            ids, vectors = load_embeddings(database, user_ids=user_ids.tolist(), chunk_size=chunk_size,
+                                           workers=workers if len(user_ids) > chunk_size else 1, samples=True)
+            keep = np.isin(ids, missing)
+            ids, vectors = ids[keep], vectors[keep]
+            vector_store.add_embeddings(ids >> SAMPLE_KEY_BITS, vectors, slots=ids & (MAX_SAMPLE_SLOTS - 1))
+        else:
+            # Starting worker processes isn't worth it for a few users
+            ids, vectors = load_embeddings(database, user_ids=missing.tolist(), chunk_size=chunk_size,
+                                           workers=workers if len(missing) > chunk_size else 1)
+            vector_store.add_embeddings(ids, vectors)
+
+    for user_id in orphaned:
+        vector_store.remove_embedding(int(user_id))
+
+    return report
@@ -1,18 +1,57 @@
 """FastAPI main application."""
-from fastapi import FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+from pydantic import ValidationError
 import numpy as np
-from typing import Optional
+import asyncio
+import hmac
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 from models import (
-    EnrollRequest, EnrollResponse, RecognizeRequest, RecognizeResponse,
-    UserResponse, UsersListResponse, DeleteResponse, HealthResponse, FaceMatch
+    EnrollForm, EnrollRequest, EnrollResponse, RecognizeRequest, RecognizeResponse,
+    MultiRecognizeResponse, UserResponse, UsersListResponse, DeleteResponse, HealthResponse, FaceMatch,
+    BulkEnrollJobResponse, SampleRequest, SampleResponse
 )
 from face_detector import FaceDetector
 from face_embedder import FaceEmbedder
+from stub_models import StubFaceDetector, StubFaceEmbedder
 from vector_store import VectorStore
+from shared_store import SharedVectorStore
+from numpy_store import NumpyVectorStore
+from templates import MAX_SAMPLE_SLOTS
 from database import Database
+from executor import InferenceExecutor, ExecutorBusyError
+from batcher import MicroBatcher
+from user_cache import UserCache
+from index_sync import exact_vector_loader, sync_index
+from bulk_enroll import BulkEnrollJob, prune_jobs
+from metrics import Metrics, CONTENT_TYPE
+from profiling import ProfileStore, ProfilingMiddleware
+from config import (
+    PIPELINE_MODE, INSIGHTFACE_MODEL,
+    INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, ONNX_INTRA_OP_THREADS,
+    BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, DETECTION_MAX_SIDE,
+    VECTOR_SNAPSHOT_EVERY, VECTOR_WAL_FSYNC,
+    VECTOR_INDEX_TYPE, VECTOR_ANN_THRESHOLD,
+    HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH,
+    IVF_NLIST, IVF_NPROBE, IVF_PQ_M, VECTOR_RERANK,
+    USER_CACHE_SIZE, INDEX_SYNC_ON_STARTUP, INDEX_REBUILD_WORKERS,
+    EMBEDDING_STORAGE_DTYPE, DATABASE_POOL_SIZE, USERS_PAGE_SIZE, USERS_PAGE_MAX,
+    BULK_ENROLL_WORKERS, BULK_ENROLL_BATCH_SIZE,
+    TEMPLATE_MODE, SAMPLE_SCORING, MAX_SAMPLES_PER_USER, VECTOR_SHARED_GALLERY,
+    VECTOR_BACKEND, STUB_MODELS, METRICS_ENABLED,
+    PROFILING_TOKEN, PROFILE_INTERVAL_MS, SLOW_REQUEST_PROFILE_MS, SLOW_REQUEST_SAMPLE_MS, PROFILE_KEEP,
+    BACKGROUND_STARTUP, ONNX_CACHE_DIR, ADMIN_TOKEN
+)
 
 
 # Global instances (initialized on startup)
@@ -20,37 +59,222 @@ face_detector: Optional[FaceDetector] = None
 face_embedder: Optional[FaceEmbedder] = None
 vector_store: Optional[VectorStore] = None
 database: Optional[Database] = None
+user_cache: Optional[UserCache] = None
+inference_executor: Optional[InferenceExecutor] = None
+recognition_batcher: Optional[MicroBatcher] = None
+metrics: Optional[Metrics] = None
+bulk_enroll_jobs: Dict[str, BulkEnrollJob] = {}
+profile_store = ProfileStore(directory="data/profiles", keep=PROFILE_KEEP)
+
+# Startup progress: component -> "pending", "loading", "ready" or "failed: <error>"
+component_status: Dict[str, str] = {}
+startup_task: Optional[asyncio.Task] = None
 
 # Recognition threshold (cosine similarity)
 RECOGNITION_THRESHOLD = 0.55
 
+# Seconds a request waits for background startup before getting a 503
+STARTUP_WAIT_SECONDS = 60
+
+COMPONENTS = ("face_detector", "face_embedder", "database", "vector_store", "user_cache")
+
+
+def _load_component(name: str, load: Callable[[], None]) -> None:
+    """Run one startup step, recording its progress for /health."""
+    component_status[name] = "loading"
+    try:
+        load()
+    except Exception as e:
+        component_status[name] = f"failed: {e}"
+        print(f"❌ Failed to load {name}: {e}")
+        raise
+    component_status[name] = "ready"
+
+
+def _load_detector() -> None:
+    """Create the face detector (MediaPipe graphs are built lazily per thread)."""
+    global face_detector
+    if STUB_MODELS:
+        face_detector = StubFaceDetector()
+        return
+    
+    print("📷 Loading MediaPipe face detector...")
+    face_detector = FaceDetector(
+        min_detection_confidence=0.7,
+        working_size=DETECTION_MAX_SIDE
+    )
+
+
+def _load_embedder() -> None:
+    """Load the ONNX models of the configured pipeline."""
+    global face_embedder
+    if STUB_MODELS:
+        face_embedder = StubFaceEmbedder()
+        return
+    
+    print(f"🧠 Loading InsightFace embedding model ({PIPELINE_MODE} pipeline, this may take a moment)...")
+    face_embedder = FaceEmbedder(
+        model_name=INSIGHTFACE_MODEL,
+        single_pass=PIPELINE_MODE == "single_pass",
+        intra_op_threads=ONNX_INTRA_OP_THREADS,
+        cache_dir=ONNX_CACHE_DIR
+    )
+
+
+def _load_database() -> None:
+    """Open the SQLite database."""
+    global database
+    print("💾 Connecting to database...")
+    database = Database(
+        db_path="data/helloface.db",
+        embedding_dtype=EMBEDDING_STORAGE_DTYPE,
+        pool_size=DATABASE_POOL_SIZE
+    )
+
+
+def _load_vector_store() -> None:
+    """Load the vector index and reconcile it with the database."""
+    global vector_store
+    if VECTOR_SHARED_GALLERY:
+        print("🔍 Mapping shared vector gallery...")
+        vector_store = SharedVectorStore(
+            embedding_dim=512,
+            index_path="data/faiss_index",
+            snapshot_every=VECTOR_SNAPSHOT_EVERY,
+            wal_fsync=VECTOR_WAL_FSYNC,
+            multi_sample=TEMPLATE_MODE == "all",
+            sample_scoring=SAMPLE_SCORING
+        )
+    elif VECTOR_BACKEND == "numpy":
+        print("🔍 Initializing NumPy vector store...")
+        vector_store = NumpyVectorStore(
+            embedding_dim=512,
+            index_path="data/faiss_index",
+            snapshot_every=VECTOR_SNAPSHOT_EVERY,
+            wal_fsync=VECTOR_WAL_FSYNC,
+            multi_sample=TEMPLATE_MODE == "all",
+            sample_scoring=SAMPLE_SCORING
+        )
+    else:
+        print("🔍 Initializing FAISS vector store...")
+        vector_store = VectorStore(
+            embedding_dim=512,
+            index_path="data/faiss_index",
+            snapshot_every=VECTOR_SNAPSHOT_EVERY,
+            wal_fsync=VECTOR_WAL_FSYNC,
+            index_type=VECTOR_INDEX_TYPE,
+            ann_threshold=VECTOR_ANN_THRESHOLD,
+            hnsw_m=HNSW_M,
+            ef_construction=HNSW_EF_CONSTRUCTION,
+            ef_search=HNSW_EF_SEARCH,
+            nlist=IVF_NLIST,
+            nprobe=IVF_NPROBE,
+            pq_m=IVF_PQ_M,
+            multi_sample=TEMPLATE_MODE == "all",
+            sample_scoring=SAMPLE_SCORING,
+            rerank=VECTOR_RERANK,
+            exact_vectors=exact_vector_loader(database, samples=TEMPLATE_MODE == "all")
+        )
+    
+    if INDEX_SYNC_ON_STARTUP:
+        print("🩺 Checking FAISS index against database...")
+        def check() -> dict:
+            return sync_index(database, vector_store, workers=INDEX_REBUILD_WORKERS)
+        
+        # Only one of the workers sharing a gallery reconciles it
+        report = vector_store.sync_once(check) if VECTOR_SHARED_GALLERY else check()
+        if report is None:
+            print("   Already checked by another worker")
+        elif report["rebuilt"]:
+            print(f"   Rebuilt index from {report['database_users']} stored users")
+        elif report["missing"] or report["orphaned"]:
+            print(f"   Re-indexed {report['missing']} missing users, removed {report['orphaned']} orphaned embeddings")
+
+
+def _warm_user_cache() -> None:
+    """Create the user cache and fill it from the database."""
+    global user_cache
+    print("🗂️  Warming user cache...")
+    user_cache = UserCache(database, max_size=USER_CACHE_SIZE)
+    print(f"   Cached {user_cache.warm()} users")
+
+
+def _load_storage() -> None:
+    """Load the database, then the components that read from it."""
+    _load_component("database", _load_database)
+    _load_component("vector_store", _load_vector_store)
+    _load_component("user_cache", _warm_user_cache)
+
+
+async def _load_components() -> None:
+    """Load models and storage, independent components concurrently on worker threads."""
+    global metrics
+    start = time.perf_counter()
+    
+    # Model loading and index reading mostly run in C++ without the GIL, so they overlap
+    await asyncio.gather(
+        asyncio.to_thread(_load_component, "face_detector", _load_detector),
+        asyncio.to_thread(_load_component, "face_embedder", _load_embedder),
+        asyncio.to_thread(_load_storage)
+    )
+    
+    if METRICS_ENABLED:
+        print("📈 Instrumenting pipeline stages for /metrics...")
+        metrics = Metrics()
+        for component in (face_detector, face_embedder, database, vector_store):
+            component.instrument(metrics.timer)
+        metrics.gauge("gallery_embeddings", "Embeddings in the vector index.", vector_store.get_total_embeddings)
+        metrics.gauge("inference_queue_depth", "Requests waiting for an inference thread.",
+                      lambda: inference_executor.get_stats()["queue_depth"])
+        metrics.gauge("inference_active", "Inference threads busy.", lambda: inference_executor.get_stats()["active"])
+        metrics.gauge("inference_rejected_total", "Requests rejected because the inference queue was full.",
+                      lambda: inference_executor.get_stats()["rejected"], kind="counter")
+    
+    print(f"✅ HelloFace backend ready in {time.perf_counter() - start:.1f}s!")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle manager for loading models on startup."""
-    global face_detector, face_embedder, vector_store, database
+    global inference_executor, recognition_batcher, startup_task
     
     print("🚀 Initializing HelloFace backend...")
     
-    # Initialize components
-    print("📷 Loading MediaPipe face detector...")
-    face_detector = FaceDetector(min_detection_confidence=0.7)
-    
-    print("🧠 Loading InsightFace embedding model (this may take a moment)...")
-    face_embedder = FaceEmbedder(model_name='buffalo_l')
-    
-    print("🔍 Initializing FAISS vector store...")
-    vector_store = VectorStore(embedding_dim=512, index_path="data/faiss_index")
+    print(f"⚙️  Starting inference executor ({INFERENCE_WORKERS} workers)...")
+    inference_executor = InferenceExecutor(
+        max_workers=INFERENCE_WORKERS,
+        max_queue_size=INFERENCE_QUEUE_SIZE
+    )
+    recognition_batcher = MicroBatcher(
+        _embed_and_search,
+        inference_executor,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS
+    )
     
-    print("💾 Connecting to database...")
-    database = Database(db_path="data/helloface.db")
+    if STUB_MODELS:
+        print("🧪 Using stub face detector and embedder (no models loaded)...")
     
-    print("✅ HelloFace backend ready!")
+    component_status.update({name: "pending" for name in COMPONENTS})
+    if BACKGROUND_STARTUP:
+        # Serve /health right away; other requests wait for the components they need
+        print("⏳ Loading components in the background, see /health for progress...")
+        startup_task = asyncio.create_task(_load_components())
+    else:
+        await _load_components()
     
     yield
     
     # Cleanup on shutdown
     print("👋 Shutting down HelloFace backend...")
+    if startup_task is not None:
+        # Loading threads cannot be interrupted, so let them finish first
+        with suppress(Exception):
+            await startup_task
+        startup_task = None
+    inference_executor.shutdown()
+    if vector_store is not None:
+        vector_store.close()
 
 
 # Create FastAPI app
@@ -70,6 +294,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Sampling profiler for requests sent with the profiling token and/or slow requests
+if PROFILING_TOKEN or SLOW_REQUEST_PROFILE_MS:
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=profile_store,
+        token=PROFILING_TOKEN,
+        interval_ms=PROFILE_INTERVAL_MS,
+        slow_ms=SLOW_REQUEST_PROFILE_MS,
+        slow_interval_ms=SLOW_REQUEST_SAMPLE_MS
+    )
+
 
 @app.get("/", tags=["Root"])
 async def root():
@@ -83,16 +318,208 @@ async def root():
 
 @app.get("/health", response_model=HealthResponse, tags=["Health"])
 async def health_check():
-    """Health check endpoint."""
+    """Health check endpoint, with the startup progress of each component."""
+    states = list(component_status.values())
+    if any(state.startswith("failed") for state in states):
+        health = "unhealthy"
+    elif any(state != "ready" for state in states):
+        health = "starting"
+    else:
+        health = "healthy"
+    
     return HealthResponse(
-        status="healthy",
+        status=health,
+        ready=bool(states) and health == "healthy",
+        components=dict(component_status),
         models_loaded=face_detector is not None and face_embedder is not None,
         database_connected=database is not None,
         vector_store_ready=vector_store is not None
     )
 
 
-@app.post("/enroll", response_model=EnrollResponse, tags=["Enrollment"])
+async def _wait_until_ready() -> None:
+    """Hold a request until background startup has loaded every component."""
+    if startup_task is None:
+        return
+    
+    if not startup_task.done():
+        try:
+            await asyncio.wait_for(asyncio.shield(startup_task), STARTUP_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is still starting up. Please retry shortly.",
+                headers={"Retry-After": "5"}
+            )
+        except Exception:
+            pass
+    
+    if startup_task.exception() is not None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server failed to start. See /health for details."
+        )
+
+
+def _upload_openapi(fields: dict) -> dict:
+    """Build the OpenAPI request body for a /v2 image upload endpoint."""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"image": {"type": "string", "format": "binary"}, **fields},
+                        "required": ["image", *fields]
+                    }
+                },
+                "application/octet-stream": {
+                    "schema": {"type": "string", "format": "binary"}
+                }
+            }
+        }
+    }
+
+
+async def _read_upload(request: Request) -> Tuple[bytes, dict]:
+    """
+    Read an image uploaded as multipart/form-data or as the raw request body.
+    
+    Multipart uploads carry the file in the "image" field and other values as
+    form fields. Raw uploads (application/octet-stream, image/*) carry other
+    values as query parameters.
+    
+    Returns:
+        Tuple (image_bytes, fields)
+    """
+    content_type = request.headers.get("content-type", "")
+    
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Missing 'image' file field."
+            )
+        image_bytes = await upload.read()
+        fields = {key: value for key, value in form.items() if isinstance(value, str)}
+    else:
+        image_bytes = await request.body()
+        fields = dict(request.query_params)
+    
+    if not image_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Empty image upload."
+        )
+    
+    return image_bytes, fields
+
+
+def _detect_faces(image: Union[str, bytes]) -> List[Tuple[np.ndarray, dict]]:
+    """Detect faces in a base64 string (JSON API) or raw image bytes (/v2 upload API)."""
+    try:
+        if isinstance(image, str):
+            return face_detector.detect_from_base64(image, align=face_embedder.single_pass)
+        return face_detector.detect_from_bytes(image, align=face_embedder.single_pass)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not decode image. Please upload a JPEG or PNG file."
+        )
+
+
+def _embed_single_face(image: Union[str, bytes]) -> np.ndarray:
+    """Detect the one face of an enrollment image and embed it."""
+    # Detect faces
+    faces = _detect_faces(image)
+    
+    if len(faces) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No face detected in image. Please ensure your face is clearly visible."
+        )
+    
+    if len(faces) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Multiple faces detected. Please ensure only one face is in the image."
+        )
+    
+    # Get face crop
+    face_crop, bbox = faces[0]
+    
+    # Generate embedding
+    embedding = face_embedder.get_embedding(face_crop)
+    
+    if embedding is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to generate face embedding. Please try with a clearer image."
+        )
+    
+    return embedding
+
+
+def _enroll_user(name: str, email: str, image: Union[str, bytes]) -> EnrollResponse:
+    """Blocking enrollment work, run on the inference executor."""
+    # Check if email already exists (confirmed, it may have been deleted through another worker)
+    existing_user = user_cache.get_user_by_email(email, confirm=True)
+    if existing_user:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"User with email {email} already enrolled"
+        )
+    
+    embedding = _embed_single_face(image)
+    
+    # Store in database (without embedding for now)
+    user = database.create_user(
+        name=name,
+        email=email,
+        embedding=embedding
+    )
+    
+    # Add to vector store
+    vector_store.add_embedding(user.id, embedding)
+    user_cache.add(user)
+    
+    return EnrollResponse(
+        user_id=user.id,
+        name=user.name,
+        email=user.email,
+        enrolled_at=user.enrolled_at,
+        message=f"User {user.name} enrolled successfully!"
+    )
+
+
+async def _enroll(name: str, email: str, image: Union[str, bytes]) -> EnrollResponse:
+    """Run enrollment on the inference executor and map errors to HTTP responses."""
+    try:
+        return await inference_executor.run(_enroll_user, name, email, image)
+        
+    except ExecutorBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy. Please try again shortly."
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Enrollment failed: {str(e)}"
+        )
+
+
+@app.post(
+    "/enroll",
+    response_model=EnrollResponse,
+    tags=["Enrollment"],
+    dependencies=[Depends(_wait_until_ready)]
+)
 async def enroll_user(request: EnrollRequest):
     """
     Enroll a new user with their face.
@@ -101,70 +528,297 @@ async def enroll_user(request: EnrollRequest):
     - Generates face embedding
     - Stores in database and vector store
     """
+    return await _enroll(request.name, request.email, request.image)
+
+
+@app.post(
+    "/v2/enroll",
+    response_model=EnrollResponse,
+    tags=["Enrollment"],
+    dependencies=[Depends(_wait_until_ready)],
+    openapi_extra=_upload_openapi({"name": {"type": "string"}, "email": {"type": "string"}})
+)
+async def enroll_user_upload(request: Request):
+    """
+    Enroll a new user from a raw JPEG/PNG upload.
+    
+    - multipart/form-data with an "image" file plus "name" and "email" fields, or
+    - the image as the request body (application/octet-stream) with
+      "name" and "email" query parameters
+    """
+    image_bytes, fields = await _read_upload(request)
+    
     try:
-        # Check if email already exists
-        existing_user = database.get_user_by_email(request.email)
-        if existing_user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"User with email {request.email} already enrolled"
-            )
-        
-        # Detect faces
-        faces = face_detector.detect_from_base64(request.image)
-        
-        if len(faces) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No face detected in image. Please ensure your face is clearly visible."
-            )
-        
-        if len(faces) > 1:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Multiple faces detected. Please ensure only one face is in the image."
-            )
-        
-        # Get face crop
-        face_crop, bbox = faces[0]
-        
-        # Generate embedding
-        embedding = face_embedder.get_embedding(face_crop)
+        form = EnrollForm(**fields)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=e.errors(include_url=False, include_context=False)
+        )
+    
+    return await _enroll(form.name, form.email, image_bytes)
+
+
+async def _save_archive(request: Request) -> str:
+    """
+    Stream an uploaded zip/tar archive to a temporary file.
+    
+    The archive is the "archive" field of a multipart/form-data upload or
+    the raw request body.
+    
+    Returns:
+        Path of the temporary file
+    """
+    fd, path = tempfile.mkstemp(suffix=".upload")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if request.headers.get("content-type", "").startswith("multipart/form-data"):
+                form = await request.form()
+                upload = form.get("archive")
+                if upload is None or isinstance(upload, str):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Missing 'archive' file field."
+                    )
+                # The form spooled large uploads to disk; copy it without blocking the event loop
+                await asyncio.to_thread(shutil.copyfileobj, upload.file, f)
+            else:
+                async for chunk in request.stream():
+                    f.write(chunk)
         
-        if embedding is None:
+        if not zipfile.is_zipfile(path) and not tarfile.is_tarfile(path):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Failed to generate face embedding. Please try with a clearer image."
+                detail="Upload a zip or tar archive of photos with a manifest.csv."
             )
-        
-        # Store in database (without embedding for now)
-        user = database.create_user(
-            name=request.name,
-            email=request.email,
-            embedding=embedding.tolist()
+        return path
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+@app.post(
+    "/enroll/bulk",
+    response_model=BulkEnrollJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Enrollment"],
+    dependencies=[Depends(_wait_until_ready)],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"archive": {"type": "string", "format": "binary"}},
+                        "required": ["archive"]
+                    }
+                },
+                "application/octet-stream": {
+                    "schema": {"type": "string", "format": "binary"}
+                }
+            }
+        }
+    }
+)
+async def bulk_enroll_upload(request: Request):
+    """
+    Start enrolling a zip/tar archive of labelled photos in the background.
+    
+    - The archive holds the photos and a manifest.csv with the columns file, name, email
+    - Upload it as the request body or as the "archive" field of multipart/form-data
+    - Already enrolled emails are skipped, so a failed import can be uploaded again
+    - Poll GET /enroll/bulk/{job_id} for progress and per-photo errors
+    """
+    archive_path = await _save_archive(request)
+    
+    prune_jobs(bulk_enroll_jobs)
+    if any(job.is_running() for job in bulk_enroll_jobs.values()):
+        os.remove(archive_path)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A bulk enrollment is already running."
         )
-        
-        # Add to vector store
-        vector_store.add_embedding(user.id, embedding)
-        
-        return EnrollResponse(
+    
+    job = BulkEnrollJob(
+        archive_path,
+        face_detector=face_detector,
+        face_embedder=face_embedder,
+        database=database,
+        vector_store=vector_store,
+        user_cache=user_cache,
+        workers=BULK_ENROLL_WORKERS,
+        batch_size=BULK_ENROLL_BATCH_SIZE
+    )
+    bulk_enroll_jobs[job.id] = job
+    job.start()
+    
+    return BulkEnrollJobResponse(**job.to_dict())
+
+
+@app.get("/enroll/bulk/{job_id}", response_model=BulkEnrollJobResponse, tags=["Enrollment"])
+async def get_bulk_enroll_job(job_id: str):
+    """Get the progress of a bulk enrollment and the photos that failed."""
+    job = bulk_enroll_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Bulk enrollment job {job_id} not found"
+        )
+    return BulkEnrollJobResponse(**job.to_dict())
+
+
+def _count_outcome(outcome: str, count: int = 1) -> None:
+    """Count recognition outcomes when metrics are enabled."""
+    if metrics is not None and count:
+        metrics.recognitions.inc(outcome, count)
+
+
+def _detect_recognition_face(image: Union[str, bytes]) -> Union[RecognizeResponse, Tuple[np.ndarray, dict]]:
+    """
+    Blocking detection step of recognition, run on the inference executor.
+    
+    Returns:
+        Tuple (face_crop, bounding_box) of the first face, or a
+        RecognizeResponse if recognition cannot continue
+    """
+    # Check if any users enrolled
+    if vector_store.get_total_embeddings() == 0:
+        _count_outcome("no_users")
+        return RecognizeResponse(
+            recognized=False,
+            match=None,
+            message="No users enrolled yet. Please enroll users first."
+        )
+    
+    # Detect faces
+    faces = _detect_faces(image)
+    
+    if len(faces) == 0:
+        _count_outcome("no_face")
+        return RecognizeResponse(
+            recognized=False,
+            match=None,
+            message="No face detected in image."
+        )
+    
+    # Use first detected face
+    return faces[0]
+
+
+def _embed_and_search(face_crops: List[np.ndarray]) -> List[Optional[List[Tuple[int, float]]]]:
+    """
+    Embed face crops from concurrent requests and search them in one batch.
+    
+    Returns:
+        Search results per crop, or None where no embedding could be generated
+    """
+    # Generate embeddings
+    embeddings = face_embedder.get_embeddings_batch(face_crops)
+    
+    valid = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+    results = [None] * len(face_crops)
+    
+    # Search vector store
+    if valid:
+        query = np.stack([embeddings[i] for i in valid])
+        for i, matches in zip(valid, vector_store.search_batch(query, k=1)):
+            results[i] = matches
+    
+    return results
+
+
+def _build_recognize_response(results: Optional[List[Tuple[int, float]]], bbox: dict) -> RecognizeResponse:
+    """Blocking match step of recognition (threshold + user lookup)."""
+    if results is None:
+        _count_outcome("no_embedding")
+        return RecognizeResponse(
+            recognized=False,
+            match=None,
+            message="Failed to generate face embedding."
+        )
+    
+    if not results:
+        _count_outcome("unknown")
+        return RecognizeResponse(
+            recognized=False,
+            match=None,
+            message="No match found."
+        )
+    
+    # Get best match
+    user_id, confidence = results[0]
+    
+    # Check threshold
+    if confidence < RECOGNITION_THRESHOLD:
+        _count_outcome("unknown")
+        return RecognizeResponse(
+            recognized=False,
+            match=None,
+            message=f"Unknown face (confidence: {confidence:.2f}, threshold: {RECOGNITION_THRESHOLD})"
+        )
+    
+    # Get user info
+    user = user_cache.get_user(user_id)
+    
+    if not user:
+        _count_outcome("unknown")
+        return RecognizeResponse(
+            recognized=False,
+            match=None,
+            message="User not found in database."
+        )
+    
+    _count_outcome("recognized")
+    return RecognizeResponse(
+        recognized=True,
+        match=FaceMatch(
             user_id=user.id,
             name=user.name,
             email=user.email,
-            enrolled_at=user.enrolled_at,
-            message=f"User {user.name} enrolled successfully!"
-        )
+            confidence=min(confidence, 1.0),  # Float rounding can exceed 1 for identical faces
+            bounding_box=bbox
+        ),
+        message=f"Recognized: {user.name}"
+    )
+
+
+async def _recognize(image: Union[str, bytes]) -> RecognizeResponse:
+    """
+    Run recognition and map errors to HTTP responses.
+    
+    Embedding and search are batched with concurrent requests.
+    """
+    try:
+        detected = await inference_executor.run(_detect_recognition_face, image)
+        if isinstance(detected, RecognizeResponse):
+            return detected
+        
+        face_crop, bbox = detected
+        results = await recognition_batcher.submit(face_crop)
+        
+        return await inference_executor.run(_build_recognize_response, results, bbox)
         
+    except ExecutorBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy. Please try again shortly."
+        )
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Enrollment failed: {str(e)}"
+            detail=f"Recognition failed: {str(e)}"
         )
 
 
-@app.post("/recognize", response_model=RecognizeResponse, tags=["Recognition"])
+@app.post(
+    "/recognize",
+    response_model=RecognizeResponse,
+    tags=["Recognition"],
+    dependencies=[Depends(_wait_until_ready)]
+)
 async def recognize_face(request: RecognizeRequest):
     """
     Recognize a face in the provided image.
@@ -174,81 +828,95 @@ async def recognize_face(request: RecognizeRequest):
     - Searches vector store for match
     - Returns user info if confidence above threshold
     """
-    try:
-        # Check if any users enrolled
-        if vector_store.get_total_embeddings() == 0:
-            return RecognizeResponse(
-                recognized=False,
-                match=None,
-                message="No users enrolled yet. Please enroll users first."
-            )
-        
-        # Detect faces
-        faces = face_detector.detect_from_base64(request.image)
-        
-        if len(faces) == 0:
-            return RecognizeResponse(
-                recognized=False,
-                match=None,
-                message="No face detected in image."
-            )
-        
-        # Use first detected face
-        face_crop, bbox = faces[0]
-        
-        # Generate embedding
-        embedding = face_embedder.get_embedding(face_crop)
-        
-        if embedding is None:
-            return RecognizeResponse(
-                recognized=False,
-                match=None,
-                message="Failed to generate face embedding."
-            )
-        
-        # Search vector store
-        results = vector_store.search(embedding, k=1)
-        
-        if not results:
-            return RecognizeResponse(
-                recognized=False,
-                match=None,
-                message="No match found."
-            )
-        
-        # Get best match
-        user_id, confidence = results[0]
-        
-        # Check threshold
-        if confidence < RECOGNITION_THRESHOLD:
-            return RecognizeResponse(
-                recognized=False,
-                match=None,
-                message=f"Unknown face (confidence: {confidence:.2f}, threshold: {RECOGNITION_THRESHOLD})"
-            )
-        
-        # Get user info
-        user = database.get_user(user_id)
-        
-        if not user:
-            return RecognizeResponse(
-                recognized=False,
-                match=None,
-                message="User not found in database."
-            )
-        
-        return RecognizeResponse(
-            recognized=True,
-            match=FaceMatch(
+    return await _recognize(request.image)
+
+
+@app.post(
+    "/v2/recognize",
+    response_model=RecognizeResponse,
+    tags=["Recognition"],
+    dependencies=[Depends(_wait_until_ready)],
+    openapi_extra=_upload_openapi({})
+)
+async def recognize_face_upload(request: Request):
+    """
+    Recognize a face in a raw JPEG/PNG upload.
+    
+    Send the image as an "image" file field (multipart/form-data) or as the
+    request body (application/octet-stream).
+    """
+    image_bytes, _ = await _read_upload(request)
+    return await _recognize(image_bytes)
+
+
+def _recognize_all_faces(image: Union[str, bytes]) -> MultiRecognizeResponse:
+    """Blocking multi-face recognition, run on the inference executor."""
+    # Check if any users enrolled
+    if vector_store.get_total_embeddings() == 0:
+        _count_outcome("no_users")
+        return MultiRecognizeResponse(
+            faces_detected=0,
+            message="No users enrolled yet. Please enroll users first."
+        )
+    
+    # Detect faces
+    faces = _detect_faces(image)
+    
+    if len(faces) == 0:
+        _count_outcome("no_face")
+        return MultiRecognizeResponse(
+            faces_detected=0,
+            message="No face detected in image."
+        )
+    
+    # Embed all faces in one batch and search them with one query matrix
+    results = _embed_and_search([face_crop for face_crop, _ in faces])
+    
+    # Keep the best match of each face above the threshold
+    best = {}
+    for i, matches in enumerate(results):
+        if matches and matches[0][1] >= RECOGNITION_THRESHOLD:
+            best[i] = matches[0]
+    
+    # Get info of all matched users in one query
+    users = user_cache.get_users(list({user_id for user_id, _ in best.values()}))
+    
+    face_matches = []
+    for i, (user_id, confidence) in best.items():
+        user = users.get(user_id)
+        if user:
+            face_matches.append(FaceMatch(
                 user_id=user.id,
                 name=user.name,
                 email=user.email,
-                confidence=confidence,
-                bounding_box=bbox
-            ),
-            message=f"Recognized: {user.name}"
-        )
+                confidence=min(confidence, 1.0),
+                bounding_box=faces[i][1]
+            ))
+    
+    failed = sum(matches is None for matches in results)
+    _count_outcome("recognized", len(face_matches))
+    _count_outcome("no_embedding", failed)
+    _count_outcome("unknown", len(faces) - len(face_matches) - failed)
+    
+    return MultiRecognizeResponse(
+        faces_detected=len(faces),
+        matches=face_matches,
+        message=f"Recognized {len(face_matches)} of {len(faces)} faces"
+    )
+
+
+async def _recognize_all(image: Union[str, bytes]) -> MultiRecognizeResponse:
+    """Run multi-face recognition and map errors to HTTP responses."""
+    try:
+        return await inference_executor.run(_recognize_all_faces, image)
         
+    except ExecutorBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy. Please try again shortly."
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -256,27 +924,95 @@ async def recognize_face(request: RecognizeRequest):
         )
 
 
-@app.get("/users", response_model=UsersListResponse, tags=["Users"])
-async def get_users():
-    """Get list of all enrolled users."""
+@app.post(
+    "/recognize/all",
+    response_model=MultiRecognizeResponse,
+    tags=["Recognition"],
+    dependencies=[Depends(_wait_until_ready)]
+)
+async def recognize_all_faces(request: RecognizeRequest):
+    """
+    Recognize every face in the provided image.
+    
+    - Detects all faces in image
+    - Generates their embeddings in one batch
+    - Searches vector store for all of them at once
+    - Returns a match with bounding box for each face above threshold
+    """
+    return await _recognize_all(request.image)
+
+
+@app.post(
+    "/v2/recognize/all",
+    response_model=MultiRecognizeResponse,
+    tags=["Recognition"],
+    dependencies=[Depends(_wait_until_ready)],
+    openapi_extra=_upload_openapi({})
+)
+async def recognize_all_faces_upload(request: Request):
+    """
+    Recognize every face in a raw JPEG/PNG upload.
+    
+    Send the image as an "image" file field (multipart/form-data) or as the
+    request body (application/octet-stream).
+    """
+    image_bytes, _ = await _read_upload(request)
+    return await _recognize_all(image_bytes)
+
+
+def _stream_users(cursor: Optional[int]):
+    """Yield every user after the cursor as one JSON line."""
+    for user_id, name, email, enrolled_at in database.iter_user_summaries(after_id=cursor):
+        yield json.dumps({
+            "user_id": user_id,
+            "name": name,
+            "email": email,
+            "enrolled_at": enrolled_at.isoformat() if enrolled_at else None
+        }) + "\n"
+
+
+@app.get(
+    "/users",
+    response_model=UsersListResponse,
+    tags=["Users"],
+    dependencies=[Depends(_wait_until_ready)]
+)
+def get_users(
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_PAGE_MAX),
+    cursor: Optional[int] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """
+    Get enrolled users in enrollment order, one page at a time.
+    
+    - Pass the returned next_cursor as cursor to get the next page
+    - format=ndjson streams all users after the cursor, one JSON object per line
+    """
     try:
-        users = database.get_all_users()
+        if format == "ndjson":
+            return StreamingResponse(_stream_users(cursor), media_type="application/x-ndjson")
+        
+        # Only the listed columns are loaded, not the encrypted embeddings.
+        # One extra row tells whether there is a next page.
+        users = database.get_user_summaries(limit=limit + 1, newest_first=False, after_id=cursor)
+        next_cursor = users[limit - 1][0] if len(users) > limit else None
         
         user_responses = [
             UserResponse(
-                user_id=user.id,
-                name=user.name,
-                email=user.email,
-                enrolled_at=user.enrolled_at
+                user_id=user_id,
+                name=name,
+                email=email,
+                enrolled_at=enrolled_at
             )
-            for user in users
+            for user_id, name, email, enrolled_at in users[:limit]
         ]
         
         return UsersListResponse(
             users=user_responses,
-            total=len(user_responses)
+            total=database.get_user_count(),
+            next_cursor=next_cursor
         )
-        
+    
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -284,8 +1020,106 @@ async def get_users():
         )
 
 
-@app.delete("/users/{user_id}", response_model=DeleteResponse, tags=["Users"])
-async def delete_user(user_id: int):
+def _add_user_sample(user_id: int, image: Union[str, bytes]) -> SampleResponse:
+    """Blocking work of adding a face sample, run on the inference executor."""
+    if not user_cache.get_user(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User {user_id} not found"
+        )
+    
+    embedding = _embed_single_face(image)
+    
+    try:
+        result = database.add_face_sample(
+            user_id,
+            embedding,
+            template_method="medoid" if TEMPLATE_MODE == "medoid" else "mean",
+            max_samples=min(MAX_SAMPLES_PER_USER, MAX_SAMPLE_SLOTS)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User {user_id} not found"
+        )
+    
+    # Index the new sample itself, or replace the user's aggregated template
+    slot, template = result
+    if vector_store.multi_sample:
+        vector_store.add_embedding(user_id, embedding, slot=slot)
+    else:
+        vector_store.add_embedding(user_id, template)
+    
+    return SampleResponse(
+        user_id=user_id,
+        samples=slot + 1,
+        template_mode=TEMPLATE_MODE,
+        message=f"Face sample {slot + 1} added."
+    )
+
+
+async def _add_sample(user_id: int, image: Union[str, bytes]) -> SampleResponse:
+    """Run sample addition on the inference executor and map errors to HTTP responses."""
+    try:
+        return await inference_executor.run(_add_user_sample, user_id, image)
+        
+    except ExecutorBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy. Please try again shortly."
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Adding face sample failed: {str(e)}"
+        )
+
+
+@app.post(
+    "/users/{user_id}/samples",
+    response_model=SampleResponse,
+    tags=["Users"],
+    dependencies=[Depends(_wait_until_ready)]
+)
+async def add_user_sample(user_id: int, request: SampleRequest):
+    """
+    Add another face capture to an enrolled user.
+    
+    - Detects and embeds the face in the provided image
+    - Re-aggregates the user's template, or indexes the sample itself
+      (TEMPLATE_MODE=all)
+    """
+    return await _add_sample(user_id, request.image)
+
+
+@app.post(
+    "/v2/users/{user_id}/samples",
+    response_model=SampleResponse,
+    tags=["Users"],
+    dependencies=[Depends(_wait_until_ready)],
+    openapi_extra=_upload_openapi({})
+)
+async def add_user_sample_upload(user_id: int, request: Request):
+    """Add another face capture to an enrolled user from a raw JPEG/PNG upload."""
+    image_bytes, _ = await _read_upload(request)
+    return await _add_sample(user_id, image_bytes)
+
+
+@app.delete(
+    "/users/{user_id}",
+    response_model=DeleteResponse,
+    tags=["Users"],
+    dependencies=[Depends(_wait_until_ready)]
+)
+def delete_user(user_id: int):
     """
     Delete a user and their face embedding.
     
@@ -294,7 +1128,7 @@ async def delete_user(user_id: int):
     """
     try:
         # Check if user exists
-        user = database.get_user(user_id)
+        user = user_cache.get_user(user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -305,13 +1139,20 @@ async def delete_user(user_id: int):
         vector_store.remove_embedding(user_id)
         
         # Remove from database
-        database.delete_user(user_id)
+        deleted = database.delete_user(user_id)
+        user_cache.remove(user_id)
+        if not deleted:
+            # Already deleted through another worker
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"User with ID {user_id} not found"
+            )
         
         return DeleteResponse(
             message=f"User {user.name} deleted successfully",
             user_id=user_id
         )
-        
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -321,16 +1162,62 @@ async def delete_user(user_id: int):
         )
 
 
-@app.get("/stats", tags=["Statistics"])
-async def get_stats():
-    """Get system statistics."""
+def _require_admin_token(request: Request) -> None:
+    """Allow only requests carrying the admin token in the X-Admin-Token header."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Admin operations are disabled. Set ADMIN_TOKEN to enable them."
+        )
+    
+    if not hmac.compare_digest(request.headers.get("x-admin-token", "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid admin token."
+        )
+
+
+def _collect_stats() -> dict:
+    """Gather the statistics reported by /stats (blocking database and index reads)."""
+    return {
+        "total_users": database.get_user_count(),
+        "total_embeddings": vector_store.get_total_embeddings(),
+        "recognition_threshold": RECOGNITION_THRESHOLD,
+        "embedding_dimension": 512,
+        "inference_executor": inference_executor.get_stats(),
+        "recognition_batcher": recognition_batcher.get_stats(),
+        "vector_index": vector_store.get_stats(),
+        "user_cache": user_cache.get_stats()
+    }
+
+
+@app.get(
+    "/stats",
+    tags=["Statistics"],
+    dependencies=[Depends(_wait_until_ready)]
+)
+async def get_stats(request: Request, benchmark: bool = False):
+    """
+    Get system statistics.
+    
+    With benchmark=true (requires the admin token in the X-Admin-Token
+    header), the vector index recall and latency are measured at several
+    search settings first.
+    """
+    if benchmark:
+        _require_admin_token(request)
+    
     try:
-        return {
-            "total_users": database.get_user_count(),
-            "total_embeddings": vector_store.get_total_embeddings(),
-            "recognition_threshold": RECOGNITION_THRESHOLD,
-            "embedding_dimension": 512
-        }
+        if benchmark:
+            # Not on the inference executor, so recognition keeps all its workers
+            await asyncio.to_thread(vector_store.benchmark)
+        
+        return await asyncio.to_thread(_collect_stats)
+    except ExecutorBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy. Please try again shortly."
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -338,6 +1225,70 @@ async def get_stats():
         )
 
 
+@app.get(
+    "/metrics",
+    tags=["Statistics"],
+    response_class=PlainTextResponse,
+    dependencies=[Depends(_wait_until_ready)]
+)
+async def get_metrics():
+    """
+    Prometheus metrics: latency histograms per pipeline stage, recognition
+    outcome counters, gallery size and inference queue gauges.
+    
+    Enabled with METRICS_ENABLED=true; each uvicorn worker reports its own.
+    """
+    if metrics is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Metrics are disabled. Set METRICS_ENABLED=true to enable them."
+        )
+    
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+
+def _require_profiling_token(request: Request) -> None:
+    """Allow only requests carrying the profiling token in the X-Profile header."""
+    if not PROFILING_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profiling is disabled. Set PROFILING_TOKEN to enable it."
+        )
+    
+    if not hmac.compare_digest(request.headers.get("x-profile", "").encode(), PROFILING_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid profiling token."
+        )
+
+
+@app.get("/profiles", tags=["Profiling"])
+async def list_profiles(request: Request):
+    """List stored profiles, newest first (requires the X-Profile token)."""
+    _require_profiling_token(request)
+    return {"profiles": profile_store.ids()}
+
+
+@app.get("/profiles/{profile_id}", response_class=PlainTextResponse, tags=["Profiling"])
+async def get_profile(profile_id: str, request: Request):
+    """
+    Download a profile as collapsed stacks (requires the X-Profile token).
+    
+    Render it with flamegraph.pl, inferno-flamegraph or speedscope.app.
+    """
+    _require_profiling_token(request)
+    
+    path = profile_store.path(profile_id)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {profile_id} not found"
+        )
+    
+    with open(path) as f:
+        return PlainTextResponse(f.read())
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,175 @@
+"""Prometheus metrics: per-stage latency histograms, outcome counters and gauges."""
+import time
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Prometheus text exposition format served by /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds (seconds) of the stage latency buckets, from decoding a small
+# JPEG to a two-pass embedding on a busy CPU
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+RECOGNITION_OUTCOMES = ("recognized", "unknown", "no_face", "no_embedding", "no_users")
+
+
+def _format(value: float) -> str:
+    """Format a sample value or bucket bound as Prometheus expects."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative histogram with one series per value of a single label."""
+
+    def __init__(self, name: str, help: str, label: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Initialize histogram.
+
+        Args:
+            name: Metric name
+            help: Description shown by Prometheus
+            label: Name of the label distinguishing series
+            buckets: Sorted bucket upper bounds (+Inf is implicit)
+        """
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+
+        self.lock = Lock()
+        # label value -> (per-bucket counts with +Inf last, sum)
+        self.series: Dict[str, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, label_value: str, value: float) -> None:
+        """Record one observation."""
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        """Lines of the text exposition format."""
+        with self.lock:
+            snapshot = {label_value: (list(counts), total[0]) for label_value, (counts, total) in self.series.items()}
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{_format(bound)}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {_format(total)}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {cumulative}')
+        return lines
+
+
+class Counter:
+    """Monotonic counter with one series per value of a single label."""
+
+    def __init__(self, name: str, help: str, label: str, label_values: Iterable[str] = ()):
+        """
+        Initialize counter.
+
+        Args:
+            name: Metric name (should end in _total)
+            help: Description shown by Prometheus
+            label: Name of the label distinguishing series
+            label_values: Series exported as 0 before their first increment
+        """
+        self.name = name
+        self.help = help
+        self.label = label
+
+        self.lock = Lock()
+        self.values: Dict[str, int] = {label_value: 0 for label_value in label_values}
+
+    def inc(self, label_value: str, amount: int = 1) -> None:
+        """Increment one series."""
+        with self.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self) -> List[str]:
+        """Lines of the text exposition format."""
+        with self.lock:
+            values = dict(self.values)
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_value, value in sorted(values.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return lines
+
+
+class Metrics:
+    """
+    The backend's metrics registry.
+
+    Stage histograms are fed by timer(), which components use to wrap their
+    hot methods when instrumented; nothing is wrapped (and nothing is timed)
+    unless metrics are enabled. Gauges are read from callbacks at scrape time.
+    """
+
+    def __init__(self, prefix: str = "helloface"):
+        """
+        Initialize registry.
+
+        Args:
+            prefix: Prefix of every metric name
+        """
+        self.prefix = prefix
+        self.stage_seconds = Histogram(
+            f"{prefix}_stage_duration_seconds", "Time spent in each recognition pipeline stage.", "stage"
+        )
+        self.recognitions = Counter(
+            f"{prefix}_recognitions_total", "Recognition outcomes, per face (no_face and no_users per image).",
+            "outcome", RECOGNITION_OUTCOMES
+        )
+        self.gauges: List[Tuple[str, str, str, Callable[[], float]]] = []
+
+    def timer(self, stage: str, function: Callable) -> Callable:
+        """
+        Wrap a function so each call is observed in the stage histogram.
+
+        Args:
+            stage: Value of the "stage" label
+            function: Function (usually a bound method) to time
+
+        Returns:
+            The timed function
+        """
+        observe = self.stage_seconds.observe
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+
+        return timed
+
+    def gauge(self, name: str, help: str, read: Callable[[], float], kind: str = "gauge") -> None:
+        """
+        Export a value read at scrape time.
+
+        Args:
+            name: Metric name, without the prefix
+            help: Description shown by Prometheus
+            read: Callback returning the current value
+            kind: "gauge", or "counter" for a monotonic count kept elsewhere
+        """
+        self.gauges.append((f"{self.prefix}_{name}", help, kind, read))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = self.stage_seconds.render() + self.recognitions.render()
+        for name, help, kind, read in self.gauges:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {_format(read())}"]
+        return "\n".join(lines) + "\n"
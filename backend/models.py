@@ -1,16 +1,33 @@
 """Pydantic models for request/response validation."""
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 
-class EnrollRequest(BaseModel):
-    """Request model for user enrollment."""
+class EnrollForm(BaseModel):
+    """User fields for enrollment (sent alongside a raw image upload)."""
     name: str = Field(..., min_length=1, max_length=100, description="User's full name")
     email: EmailStr = Field(..., description="User's email address")
+
+
+class EnrollRequest(EnrollForm):
+    """Request model for user enrollment."""
+    image: str = Field(..., description="Base64 encoded image")
+
+
+class SampleRequest(BaseModel):
+    """Request model for adding a face sample to a user."""
     image: str = Field(..., description="Base64 encoded image")
 
 
+class SampleResponse(BaseModel):
+    """Response model for an added face sample."""
+    user_id: int
+    samples: int = Field(..., description="Face samples the user now has")
+    template_mode: str
+    message: str
+
+
 class EnrollResponse(BaseModel):
     """Response model for successful enrollment."""
     user_id: int
@@ -41,6 +58,34 @@ class RecognizeResponse(BaseModel):
     message: str
 
 
+class MultiRecognizeResponse(BaseModel):
+    """Response model for recognizing every face in an image."""
+    faces_detected: int
+    matches: List[FaceMatch] = []
+    message: str
+
+
+class BulkEnrollError(BaseModel):
+    """A photo of a bulk enrollment that could not be enrolled."""
+    file: str
+    email: str
+    status: str
+    error: Optional[str] = None
+
+
+class BulkEnrollJobResponse(BaseModel):
+    """Progress of a bulk enrollment job."""
+    job_id: str
+    status: str = Field(..., description="queued, running, completed or failed")
+    message: str = ""
+    total: int = Field(0, description="Photos processed so far")
+    enrolled: int = 0
+    exists: int = Field(0, description="Skipped because the email is already enrolled")
+    failed: int = 0
+    errors: List[BulkEnrollError] = []
+    elapsed_seconds: float = 0.0
+
+
 class UserResponse(BaseModel):
     """Response model for user information."""
     user_id: int
@@ -53,6 +98,7 @@ class UsersListResponse(BaseModel):
     """Response model for list of users."""
     users: List[UserResponse]
     total: int
+    next_cursor: Optional[int] = Field(None, description="Pass as cursor to get the next page (null on the last page)")
 
 
 class DeleteResponse(BaseModel):
@@ -64,6 +110,11 @@ class DeleteResponse(BaseModel):
 class HealthResponse(BaseModel):
     """Response model for health check."""
     status: str
+    ready: bool = Field(False, description="Every component is loaded and requests are served")
+    components: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Startup progress per component: pending, loading, ready or failed: <error>"
+    )
     models_loaded: bool
     database_connected: bool
     vector_store_ready: bool
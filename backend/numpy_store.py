@@ -0,0 +1,493 @@
+"""Exact vector store in plain NumPy, an alternative to FAISS for small and medium galleries."""
+import math
+import os
+import time
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rwlock import ReadWriteLock
+from templates import MAX_SAMPLE_SLOTS, SAMPLE_KEY_BITS, SAMPLE_SCORINGS, SAMPLE_FETCH_FACTOR, sample_key
+from wal import WriteAheadLog, OP_ADD
+
+
+# Rows allocated for an empty gallery; the capacity doubles whenever it is full
+INITIAL_CAPACITY = 1024
+
+# Dead rows are compacted away once they make up this fraction of the used rows
+COMPACT_RATIO = 0.25
+
+# Queries scored per matrix multiplication (bounds the size of the score matrix)
+QUERY_BLOCK = 64
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Select the k highest scores of each row, best first.
+
+    Args:
+        scores: Matrix of shape (n_rows, n_columns)
+        k: Columns to select per row (at most n_columns)
+
+    Returns:
+        Tuple (scores, column indices), each of shape (n_rows, k)
+    """
+    if k < scores.shape[1]:
+        # Linear-time selection, only the k selected columns are sorted
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+    selected = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-selected, axis=1, kind='stable')
+    return np.take_along_axis(selected, order, axis=1), np.take_along_axis(columns, order, axis=1)
+
+
+class NumpyVectorStore:
+    """
+    Exact vector store over one contiguous float32 matrix, without FAISS.
+
+    Embeddings are rows of a preallocated matrix whose capacity doubles when
+    it fills up, so adds are amortized O(1). Searches score a block of
+    queries with one matrix multiplication and select the top k with
+    argpartition. Removed rows are flagged dead in a bitmap and skipped; the
+    matrix is compacted once COMPACT_RATIO of its rows are dead. Changes go
+    to a write-ahead log like VectorStore's, with a snapshot (.npz) written
+    in the background every snapshot_every changes.
+
+    Offers the same methods as VectorStore.
+    """
+
+    def __init__(self, embedding_dim: int = 512, index_path: str = "data/faiss_index",
+                 snapshot_every: int = 1000, wal_fsync: bool = False,
+                 multi_sample: bool = False, sample_scoring: str = "max"):
+        """
+        Initialize the store and load its snapshot and log.
+
+        Args:
+            embedding_dim: Dimension of embeddings (512 for ArcFace)
+            index_path: Path prefix of the snapshot (.npz) and log (.npz.wal)
+            snapshot_every: Logged changes between background snapshots
+            wal_fsync: fsync the log after every change (survives OS crashes)
+            multi_sample: Index every sample of a user instead of one vector per user
+            sample_scoring: Per-user score over samples (one of SAMPLE_SCORINGS)
+        """
+        if sample_scoring not in SAMPLE_SCORINGS:
+            raise ValueError(f"Unknown sample scoring '{sample_scoring}', expected one of {SAMPLE_SCORINGS}")
+
+        self.embedding_dim = embedding_dim
+        self.snapshot_path = index_path + ".npz"
+        self.wal_path = index_path + ".npz.wal"
+        self.snapshot_every = snapshot_every
+        self.wal_fsync = wal_fsync
+        self.multi_sample = multi_sample
+        self.sample_scoring = sample_scoring
+
+        # Same locking as VectorStore: parallel searches, changes in log order
+        self.lock = ReadWriteLock()
+        self.write_lock = Lock()
+        self.snapshot_lock = Lock()
+        self.snapshot_thread: Optional[Thread] = None
+        self.last_benchmark: Optional[dict] = None
+
+        self._reset(INITIAL_CAPACITY)
+        self._load()
+
+    def _reset(self, capacity: int) -> None:
+        """Start an empty matrix of a given capacity (write lock must be held)."""
+        self.vectors = np.zeros((capacity, self.embedding_dim), dtype='float32')
+        self.ids = np.full(capacity, -1, dtype='int64')
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.size = 0  # Rows in use, dead or alive
+        self.dead = 0
+        self.rows: Dict[int, int] = {}  # Key -> row of live embeddings
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the matrix to hold at least rows rows (write lock must be held)."""
+        capacity = len(self.vectors)
+        if rows <= capacity:
+            return
+
+        capacity = max(rows, 2 * capacity)
+        vectors = np.zeros((capacity, self.embedding_dim), dtype='float32')
+        vectors[:self.size] = self.vectors[:self.size]
+        ids = np.full(capacity, -1, dtype='int64')
+        ids[:self.size] = self.ids[:self.size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.vectors, self.ids, self.alive = vectors, ids, alive
+
+    def _upsert_many(self, keys: np.ndarray, vectors: np.ndarray) -> None:
+        """Add or overwrite embeddings of unique keys (write lock must be held)."""
+        rows = np.array([self.rows.get(key, -1) for key in keys.tolist()], dtype='int64')
+        existing = rows >= 0
+        if existing.any():
+            self.vectors[rows[existing]] = vectors[existing]
+
+        new_keys, new_vectors = keys[~existing], vectors[~existing]
+        n = len(new_keys)
+        if not n:
+            return
+
+        self._reserve(self.size + n)
+        end = self.size + n
+        self.vectors[self.size:end] = new_vectors
+        self.ids[self.size:end] = new_keys
+        self.alive[self.size:end] = True
+        self.rows.update(zip(new_keys.tolist(), range(self.size, end)))
+        self.size = end
+
+    def _remove(self, key: int) -> None:
+        """Mark a key's row dead (write lock must be held)."""
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self.dead += 1
+
+    def _compact(self) -> None:
+        """Move live rows to the front of the matrix (write lock must be held)."""
+        keep = self.alive[:self.size]
+        n = int(keep.sum())
+        self.vectors[:n] = self.vectors[:self.size][keep]
+        self.ids[:n] = self.ids[:self.size][keep]
+        self.ids[n:self.size] = -1
+        self.alive[:n] = True
+        self.alive[n:self.size] = False
+        self.rows = dict(zip(self.ids[:n].tolist(), range(n)))
+        self.size, self.dead = n, 0
+
+    def add_embedding(self, user_id: int, embedding: np.ndarray, slot: int = 0) -> None:
+        """
+        Add a face embedding, replacing any existing one for the user.
+
+        Args:
+            user_id: User ID to associate with embedding
+            embedding: Face embedding vector (512-dim, L2 normalized)
+            slot: Sample slot of the user (multi_sample only)
+        """
+        self.add_embeddings(np.array([user_id]), embedding.reshape(1, -1),
+                            slots=np.array([slot]) if self.multi_sample else None)
+
+    def add_embeddings(self, user_ids: np.ndarray, embeddings: np.ndarray, snapshot: bool = False,
+                       slots: Optional[np.ndarray] = None) -> None:
+        """
+        Add several face embeddings with one log write.
+
+        Args:
+            user_ids: User IDs (unique)
+            embeddings: Matrix of shape (n, embedding_dim), L2 normalized
+            snapshot: Write a snapshot now (bulk imports) instead of once
+                snapshot_every changes are logged
+            slots: Sample slot per user (multi_sample only, default 0)
+        """
+        if not len(user_ids):
+            return
+
+        keys = np.asarray(user_ids, dtype='int64')
+        vectors = np.ascontiguousarray(embeddings, dtype='float32').reshape(len(keys), self.embedding_dim)
+        if self.multi_sample:
+            keys = (keys << SAMPLE_KEY_BITS) | (0 if slots is None else np.asarray(slots, dtype='int64'))
+
+        with self.write_lock:
+            # Log before applying so the change survives a crash
+            self.wal.append_adds(keys, vectors)
+            with self.lock.write():
+                self._upsert_many(keys, vectors)
+
+        if snapshot:
+            self.snapshot()
+        else:
+            self._maybe_snapshot()
+
+    def remove_embedding(self, user_id: int) -> bool:
+        """
+        Remove embedding (every sample with multi_sample) by user_id.
+
+        Returns:
+            True if removed, False if not found
+        """
+        with self.write_lock:
+            keys = self._user_keys(user_id)
+            if not keys:
+                return False
+
+            for key in keys:
+                self.wal.append_remove(key)
+            with self.lock.write():
+                for key in keys:
+                    self._remove(key)
+                if self.dead > COMPACT_RATIO * self.size:
+                    self._compact()
+
+        self._maybe_snapshot()
+        return True
+
+    def _user_keys(self, user_id: int) -> List[int]:
+        """Keys holding a user's vectors (write or read lock must be held)."""
+        if not self.multi_sample:
+            return [user_id] if user_id in self.rows else []
+
+        # Sample slots are assigned from 0 without gaps
+        keys = []
+        for slot in range(MAX_SAMPLE_SLOTS):
+            key = sample_key(user_id, slot)
+            if key not in self.rows:
+                break
+            keys.append(key)
+        return keys
+
+    def get_total_embeddings(self) -> int:
+        """Get total number of embeddings in the store."""
+        return len(self.rows)
+
+    def search(self, query_embedding: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        """
+        Search for most similar embeddings.
+
+        Args:
+            query_embedding: Query face embedding
+            k: Number of nearest neighbors to return
+
+        Returns:
+            List of tuples (user_id, similarity_score)
+        """
+        return self.search_batch(query_embedding.reshape(1, -1), k)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 1) -> List[List[Tuple[int, float]]]:
+        """
+        Search for most similar embeddings of several queries.
+
+        Args:
+            query_embeddings: Query matrix of shape (n_queries, embedding_dim)
+            k: Number of nearest neighbors to return per query
+
+        Returns:
+            One list of tuples (user_id, similarity_score) per query; with
+            multi_sample, one entry per user scored by sample_scoring
+        """
+        queries = np.ascontiguousarray(query_embeddings, dtype='float32')
+        with self.lock.read():
+            results = []
+            for start in range(0, len(queries), QUERY_BLOCK):
+                results.extend(self._search(queries[start:start + QUERY_BLOCK], k))
+            return results
+
+    def _search(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """Search a block of queries (read lock must be held)."""
+        total = len(self.rows)
+        k = min(k, total)
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        # Cosine similarity of normalized vectors; dead rows can never be selected
+        scores = queries @ self.vectors[:self.size].T
+        if self.dead:
+            scores[:, ~self.alive[:self.size]] = -np.inf
+
+        fetch = k * SAMPLE_FETCH_FACTOR if self.multi_sample else k
+        while True:
+            similarities, rows = top_k(scores, min(fetch, total))
+            results = [
+                self._collect(query, query_similarities, self.ids[query_rows], k)
+                for query, query_similarities, query_rows in zip(queries, similarities, rows)
+            ]
+            if fetch >= total or all(len(r) == k for r in results):
+                return results
+
+            # Other samples of the same users crowded out users, search deeper
+            fetch *= 2
+
+    def _collect(self, query: np.ndarray, similarities: np.ndarray, keys: np.ndarray,
+                 k: int) -> List[Tuple[int, float]]:
+        """Convert one query's best keys to (user_id, similarity) per user."""
+        users = {}
+        for similarity, key in zip(similarities.tolist(), keys.tolist()):
+            user_id = key >> SAMPLE_KEY_BITS if self.multi_sample else key
+            if user_id not in users:
+                users[user_id] = similarity
+
+        if self.multi_sample and self.sample_scoring == "mean":
+            for user_id in users:
+                rows = [self.rows[key] for key in self._user_keys(user_id)]
+                users[user_id] = float(np.mean(self.vectors[rows] @ query))
+            return sorted(users.items(), key=lambda r: r[1], reverse=True)[:k]
+
+        return list(users.items())[:k]
+
+    def get_ids(self) -> np.ndarray:
+        """Get the user IDs that have an embedding (sample keys with multi_sample)."""
+        with self.lock.read():
+            return self._ids()
+
+    def _ids(self) -> np.ndarray:
+        """Live keys, sorted (lock must be held)."""
+        return np.sort(self.ids[:self.size][self.alive[:self.size]])
+
+    def _maybe_snapshot(self) -> None:
+        """Start a background snapshot once enough changes are logged."""
+        if self.wal.records < self.snapshot_every:
+            return
+        if self.snapshot_thread is not None and self.snapshot_thread.is_alive():
+            return
+
+        self.snapshot_thread = Thread(target=self.snapshot, name="vector-snapshot", daemon=True)
+        self.snapshot_thread.start()
+
+    def snapshot(self) -> None:
+        """Write the live embeddings to disk and drop the log records they contain."""
+        with self.snapshot_lock:
+            # Copy state while changes wait (searches continue), write it to disk without the locks
+            with self.write_lock, self.lock.read():
+                keep = self.alive[:self.size]
+                ids = self.ids[:self.size][keep]
+                vectors = self.vectors[:self.size][keep]
+                seq = self.wal.seq
+                wal_offset = self.wal.tell()
+
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, ids=ids, vectors=vectors, seq=np.array(seq, dtype='int64'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            self.wal.truncate_before(wal_offset)
+
+    def _load(self) -> None:
+        """Load the snapshot and replay the write-ahead log."""
+        seq = 0
+        if os.path.exists(self.snapshot_path):
+            try:
+                with np.load(self.snapshot_path) as snapshot:
+                    ids, vectors, seq = snapshot['ids'], snapshot['vectors'], int(snapshot['seq'])
+                self._reset(max(INITIAL_CAPACITY, len(ids)))
+                self._upsert_many(ids, vectors)
+                print(f"Loaded NumPy vector store with {len(ids)} embeddings")
+            except Exception as e:
+                print(f"Error loading vector snapshot: {e}. Starting with empty store.")
+                # Keep the unreadable snapshot for inspection instead of overwriting it
+                os.replace(self.snapshot_path, self.snapshot_path + ".corrupt")
+                self._reset(INITIAL_CAPACITY)
+                seq = 0
+
+        # Replay changes made since the snapshot
+        self.wal = WriteAheadLog(self.wal_path, self.embedding_dim, fsync=self.wal_fsync)
+        records = self.wal.replay(after_seq=seq)
+
+        added = {}
+        for op, key, vector in records:
+            if op == OP_ADD:
+                added[key] = vector
+                continue
+
+            # Flush pending adds before applying a removal
+            self._add_entries(added)
+            added = {}
+            self._remove(key)
+        self._add_entries(added)
+        if self.dead > COMPACT_RATIO * self.size:
+            self._compact()
+
+        if records:
+            print(f"Replayed {len(records)} vector store changes from write-ahead log")
+
+    def _add_entries(self, entries: dict) -> None:
+        """Bulk upsert {key: vector}."""
+        if entries:
+            self._upsert_many(np.fromiter(entries.keys(), dtype='int64', count=len(entries)),
+                              np.stack(list(entries.values())))
+
+    def rebuild(self, user_ids: Optional[np.ndarray] = None, embeddings: Optional[np.ndarray] = None) -> None:
+        """
+        Compact the matrix, or replace the whole gallery, then snapshot it.
+
+        Args:
+            user_ids: Replace the whole gallery with these keys (default: keep the current one)
+            embeddings: Embeddings of user_ids, shape (n, embedding_dim)
+        """
+        with self.write_lock, self.lock.write():
+            if user_ids is None:
+                self._compact()
+            else:
+                ids = np.asarray(user_ids, dtype='int64')
+                self._reset(max(INITIAL_CAPACITY, len(ids)))
+                self._upsert_many(ids, np.ascontiguousarray(embeddings, dtype='float32').reshape(len(ids), -1))
+
+        self.snapshot()
+
+    def clear(self) -> None:
+        """Clear all embeddings from the store."""
+        self.rebuild(np.zeros(0, dtype='int64'), np.zeros((0, self.embedding_dim), dtype='float32'))
+
+    def benchmark(self, n_queries: int = 100, k: int = 10, noise: float = 0.5) -> dict:
+        """
+        Measure search latency for single and batched queries. Search is exact, so recall is 1.
+
+        Args:
+            n_queries: Number of queries
+            k: Neighbors requested per query
+            noise: Norm of the noise added to each enrolled embedding used as a query
+
+        Returns:
+            Dict with the index type and one recall/latency point
+        """
+        with self.lock.read():
+            ids = self._ids()
+            result = {"index_type": "numpy", "embeddings": len(ids), "points": []}
+            if len(ids):
+                rng = np.random.default_rng()
+                picked = rng.choice(ids, size=min(n_queries, len(ids)), replace=False)
+                queries = self.vectors[[self.rows[int(key)] for key in picked]]
+                queries = queries + rng.standard_normal(queries.shape).astype('float32') * noise / math.sqrt(self.embedding_dim)
+                queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+                start = time.perf_counter()
+                for query in queries:
+                    self._search(query.reshape(1, -1), k)
+                single = (time.perf_counter() - start) * 1000 / len(queries)
+
+                start = time.perf_counter()
+                for block in range(0, len(queries), QUERY_BLOCK):
+                    self._search(queries[block:block + QUERY_BLOCK], k)
+                batched = (time.perf_counter() - start) * 1000 / len(queries)
+
+                result["points"].append({
+                    "recall_at_1": 1.0,
+                    f"recall_at_{k}": 1.0,
+                    "latency_ms": single,
+                    "batched_latency_ms": batched
+                })
+
+        self.last_benchmark = result
+        return result
+
+    def get_stats(self) -> dict:
+        """Get store statistics."""
+        stats = {
+            "index_type": "numpy",
+            "embeddings": len(self.rows),
+            "capacity": len(self.vectors),
+            "dead_vectors": self.dead,
+            "bytes_per_vector": self.embedding_dim * 4,
+            "multi_sample": self.multi_sample
+        }
+        if self.multi_sample:
+            stats["sample_scoring"] = self.sample_scoring
+        stats["benchmark"] = self.last_benchmark
+        return stats
+
+    def instrument(self, timer) -> None:
+        """Time searches (single queries go through search_batch), see Metrics.timer."""
+        self.search_batch = timer("search", self.search_batch)
+
+    def close(self) -> None:
+        """Wait for background snapshots, write a final one and close the log."""
+        if self.snapshot_thread is not None:
+            self.snapshot_thread.join()
+
+        if self.wal.records:
+            self.snapshot()
+
+        self.wal.close()
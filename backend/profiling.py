@@ -0,0 +1,252 @@
+"""Sampling profiler for live requests, writing flamegraph-compatible collapsed stacks."""
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+
+# Leaf frames of threads that are blocked waiting for work, left out of profiles
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+# Sampler threads, never included in their own or each other's profiles
+PROFILER_THREADS = {"profiler", "rolling-profiler"}
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+# Requests to these paths (the profile download API) are never profiled
+UNPROFILED_PREFIX = "/profiles"
+
+
+def _frame_name(frame) -> str:
+    """Name a frame as "function (file:first line)", without ';' separators."""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+def sample_stacks() -> List[str]:
+    """
+    Take one sample of every busy thread.
+
+    Returns:
+        Collapsed stacks "thread;outer frame;...;leaf frame"
+    """
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = []
+    for ident, frame in sys._current_frames().items():
+        if names.get(ident) in PROFILER_THREADS:
+            continue
+        if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_LEAVES:
+            continue
+
+        frames = []
+        while frame is not None:
+            frames.append(_frame_name(frame))
+            frame = frame.f_back
+        frames.append(names.get(ident, str(ident)))
+        stacks.append(";".join(reversed(frames)))
+    return stacks
+
+
+class StackSampler:
+    """
+    Samples every thread at a fixed interval while one request runs.
+
+    A request's work hops between the event loop and executor threads, so
+    the whole process is sampled rather than the request's own threads;
+    other requests running at the same time show up under their threads.
+    """
+
+    def __init__(self, interval: float = 0.001):
+        """
+        Initialize sampler.
+
+        Args:
+            interval: Seconds between samples
+        """
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        """Start sampling."""
+        self.thread.start()
+
+    def stop(self) -> Counter:
+        """Stop sampling and return sample counts per collapsed stack."""
+        self.stopped.set()
+        self.thread.join()
+        return self.counts
+
+    def _run(self) -> None:
+        """Sample until stopped."""
+        while not self.stopped.wait(self.interval):
+            self.counts.update(sample_stacks())
+
+
+class RollingSampler:
+    """
+    Samples every thread continuously, keeping the last window seconds.
+
+    When a request turns out to be slow, the samples taken while it ran are
+    pulled out of the ring. Samples of other requests running at the same
+    time are included too; their stacks show up under their own threads.
+    """
+
+    def __init__(self, interval: float = 0.01, window: float = 60.0):
+        """
+        Initialize sampler.
+
+        Args:
+            interval: Seconds between samples
+            window: Seconds of samples kept
+        """
+        self.interval = interval
+        self.samples: "deque[Tuple[float, List[str]]]" = deque(maxlen=max(1, int(window / interval)))
+        self.thread = threading.Thread(target=self._run, name="rolling-profiler", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        """Sample forever."""
+        while True:
+            self.samples.append((time.monotonic(), sample_stacks()))
+            time.sleep(self.interval)
+
+    def between(self, start: float, end: float) -> Counter:
+        """Sample counts per collapsed stack taken between two time.monotonic() times."""
+        counts: Counter = Counter()
+        for taken, stacks in list(self.samples):
+            if start <= taken <= end:
+                counts.update(stacks)
+        return counts
+
+
+class ProfileStore:
+    """Directory of collapsed-stack profiles, keeping the newest ones."""
+
+    def __init__(self, directory: str = "data/profiles", keep: int = 100):
+        """
+        Initialize store.
+
+        Args:
+            directory: Where profiles are written
+            keep: Profiles kept before the oldest are deleted
+        """
+        self.directory = directory
+        self.keep = keep
+
+    @staticmethod
+    def new_id(kind: str) -> str:
+        """Unique, time-ordered profile id."""
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{kind}-{uuid.uuid4().hex[:8]}"
+
+    def path(self, profile_id: str) -> Optional[str]:
+        """Path of a stored profile, or None if there is no such profile."""
+        path = os.path.join(self.directory, f"{os.path.basename(profile_id)}.folded")
+        return path if os.path.exists(path) else None
+
+    def ids(self) -> List[str]:
+        """Ids of stored profiles, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name[:-len(".folded")] for name in os.listdir(self.directory) if name.endswith(".folded")),
+                      reverse=True)
+
+    def save(self, profile_id: str, counts: Counter) -> None:
+        """Write a profile as "stack count" lines (flamegraph.pl, speedscope, inferno)."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{profile_id}.folded"), "w") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+        for old in self.ids()[self.keep:]:
+            os.remove(os.path.join(self.directory, f"{old}.folded"))
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests on demand.
+
+    A request carrying "X-Profile: <token>" runs with a StackSampler; its
+    profile id is returned in the X-Profile-Id response header. With a
+    RollingSampler, requests slower than slow_ms are saved as well. Both
+    profiles cover every thread of the process while the request ran.
+    Stopping the sampler and writing profiles happen on worker threads,
+    off the event loop.
+    """
+
+    def __init__(self, app, store: ProfileStore, token: str = "", interval_ms: float = 1.0,
+                 slow_ms: float = 0.0, slow_interval_ms: float = 10.0):
+        """
+        Initialize middleware.
+
+        Args:
+            app: ASGI app to wrap
+            store: Where profiles are saved
+            token: Secret X-Profile header value ("" = on-demand profiling off)
+            interval_ms: Sampling interval of on-demand profiles
+            slow_ms: Save profiles of requests slower than this (0 = off)
+            slow_interval_ms: Sampling interval of the rolling sampler
+        """
+        self.app = app
+        self.store = store
+        self.token = token.encode()
+        self.interval = interval_ms / 1000
+        self.slow = slow_ms / 1000
+        self.rolling = RollingSampler(slow_interval_ms / 1000) if slow_ms else None
+
+    async def __call__(self, scope, receive, send):
+        """Profile HTTP requests that ask for it, or time them for the slow-request sampler."""
+        if scope["type"] != "http" or scope["path"].startswith(UNPROFILED_PREFIX):
+            return await self.app(scope, receive, send)
+
+        if self.token and hmac.compare_digest(dict(scope["headers"]).get(PROFILE_HEADER, b""), self.token):
+            return await self._profile(scope, receive, send)
+
+        if self.rolling is None:
+            return await self.app(scope, receive, send)
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            end = time.monotonic()
+            if end - start > self.slow:
+                profile_id = self.store.new_id("slow")
+                await asyncio.to_thread(self._save_slow, profile_id, start, end)
+                print(f"🐢 {scope['method']} {scope['path']} took {(end - start) * 1000:.0f}ms, profile {profile_id}")
+
+    async def _profile(self, scope, receive, send):
+        """Run one request under a StackSampler and save its profile."""
+        profile_id = self.store.new_id("request")
+
+        async def send_with_id(message: Dict) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(PROFILE_ID_HEADER, profile_id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            await asyncio.to_thread(self._save_request, profile_id, sampler)
+
+    def _save_request(self, profile_id: str, sampler: StackSampler) -> None:
+        """Stop an on-demand sampler and save its profile."""
+        self.store.save(profile_id, sampler.stop())
+
+    def _save_slow(self, profile_id: str, start: float, end: float) -> None:
+        """Save the rolling samples taken while a slow request ran."""
+        self.store.save(profile_id, self.rolling.between(start, end))
@@ -0,0 +1,50 @@
+"""Reader/writer lock letting searches run in parallel."""
+from contextlib import contextmanager
+from threading import Condition, Lock
+
+
+class ReadWriteLock:
+    """
+    Lock held by any number of readers at once, or by a single writer.
+
+    Writers take priority: once a writer waits, new readers wait behind it,
+    so a steady stream of searches cannot starve enrollments. Not reentrant.
+    """
+
+    def __init__(self):
+        """Initialize an unheld lock."""
+        self.condition = Condition(Lock())
+        self.readers = 0
+        self.writing = False
+        self.waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """Hold the lock shared with other readers."""
+        with self.condition:
+            while self.writing or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Hold the lock exclusively."""
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writing or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
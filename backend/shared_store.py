@@ -0,0 +1,701 @@
+"""Vector gallery memory-mapped read-only by every server process."""
+import fcntl
+import glob
+import math
+import os
+import struct
+import time
+import uuid
+from contextlib import contextmanager
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from numpy_store import top_k
+from rwlock import ReadWriteLock
+from templates import MAX_SAMPLE_SLOTS, SAMPLE_KEY_BITS, SAMPLE_SCORINGS, SAMPLE_FETCH_FACTOR, sample_key
+from wal import HEADER, MAGIC, VERSION, RECORD, OP_ADD, OP_REMOVE
+
+try:
+    import faiss
+except ImportError:
+    # Searched with NumPy instead
+    faiss = None
+
+
+# Gallery file header: magic, format version, embedding dimension, generation, vector count.
+# Sorted int64 IDs start at DATA_OFFSET, followed by the float32 vector matrix.
+GALLERY_HEADER = struct.Struct('<6sHIQQ')
+GALLERY_MAGIC = b'HFGAL\x00'
+GALLERY_VERSION = 1
+DATA_OFFSET = 64
+
+# Rows copied at a time when writing a new generation
+WRITE_CHUNK = 8192
+
+# (op, index key, vector or None)
+Record = Tuple[int, int, Optional[np.ndarray]]
+
+
+class Gallery:
+    """One generation of the gallery file, memory-mapped read-only."""
+
+    def __init__(self, path: str, embedding_dim: int):
+        """
+        Open and map a gallery file.
+
+        Raises:
+            ValueError: If the file is not a gallery of embedding_dim vectors
+        """
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            magic, version, dim, self.generation, count = GALLERY_HEADER.unpack(f.read(GALLERY_HEADER.size))
+        if magic != GALLERY_MAGIC or version != GALLERY_VERSION or dim != embedding_dim:
+            raise ValueError(f"Incompatible gallery file: {path}")
+
+        self.file_id = (stat.st_dev, stat.st_ino)
+        self.nbytes = stat.st_size
+        if count:
+            # Pages are shared through the page cache by every process mapping the file
+            mapped = np.memmap(path, dtype=np.uint8, mode='r')
+            self.ids = np.frombuffer(mapped, dtype='<i8', count=count, offset=DATA_OFFSET)
+            self.vectors = np.frombuffer(mapped, dtype='<f4', count=count * dim,
+                                         offset=DATA_OFFSET + 8 * count).reshape(count, dim)
+        else:
+            self.ids = np.zeros(0, dtype='int64')
+            self.vectors = np.zeros((0, dim), dtype='float32')
+
+    def position(self, key: int) -> int:
+        """Row of a key, or -1 if the generation doesn't contain it."""
+        row = int(np.searchsorted(self.ids, key))
+        return row if row < len(self.ids) and self.ids[row] == key else -1
+
+
+def write_gallery(path: str, embedding_dim: int, generation: int, ids: np.ndarray,
+                  rows: Iterator[np.ndarray]) -> None:
+    """
+    Write a gallery file.
+
+    Args:
+        path: File to write (replaced by the caller with os.replace)
+        embedding_dim: Dimension of the vectors
+        generation: Generation number stored in the header
+        ids: Sorted index keys
+        rows: Chunks of vectors in the order of ids
+    """
+    with open(path, 'wb') as f:
+        f.seek(DATA_OFFSET)
+        f.write(np.ascontiguousarray(ids, dtype='<i8').data)
+        for chunk in rows:
+            f.write(np.ascontiguousarray(chunk, dtype='<f4').data)
+        f.seek(0)
+        f.write(GALLERY_HEADER.pack(GALLERY_MAGIC, GALLERY_VERSION, embedding_dim, generation, len(ids)))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class SharedVectorStore:
+    """
+    Exact vector store shared by several processes (e.g. uvicorn workers).
+
+    The gallery is a file of sorted IDs and float32 vectors that every
+    process maps read-only, so its memory is shared through the page cache
+    instead of copied per worker. Changes are appended, under an exclusive
+    file lock, to the log of the current generation; every process tails
+    that log before searching and keeps the logged changes in a small
+    in-memory delta. Once snapshot_every changes are logged, the gallery and
+    log are merged into a new generation, which the other processes map on
+    their next search.
+
+    Offers the same methods as VectorStore for main.py and index_sync, with
+    exact (flat) search only.
+    """
+
+    def __init__(self, embedding_dim: int = 512, index_path: str = "data/faiss_index",
+                 snapshot_every: int = 1000, wal_fsync: bool = False,
+                 multi_sample: bool = False, sample_scoring: str = "max"):
+        """
+        Open (or create) the shared gallery.
+
+        Args:
+            embedding_dim: Dimension of embeddings (512 for ArcFace)
+            index_path: Path prefix of the gallery, log and lock files
+            snapshot_every: Logged changes before a new generation is written
+            wal_fsync: fsync the log after every change (survives OS crashes)
+            multi_sample: Index every sample of a user instead of one vector per user
+            sample_scoring: Per-user score over samples (one of SAMPLE_SCORINGS)
+        """
+        if sample_scoring not in SAMPLE_SCORINGS:
+            raise ValueError(f"Unknown sample scoring '{sample_scoring}', expected one of {SAMPLE_SCORINGS}")
+
+        self.embedding_dim = embedding_dim
+        self.gallery_path = index_path + ".gallery"
+        self.lock_path = index_path + ".gallery.lock"
+        self.sync_path = index_path + ".gallery.sync"
+        self.snapshot_every = snapshot_every
+        self.wal_fsync = wal_fsync
+        self.multi_sample = multi_sample
+        self.sample_scoring = sample_scoring
+        self.record_size = RECORD.size + embedding_dim * 4
+
+        # Protects this process's view (searches share it); the file lock serializes
+        # writers across processes
+        self.lock = ReadWriteLock()
+        self.snapshot_lock = Lock()
+        self.snapshot_thread: Optional[Thread] = None
+        self.last_benchmark: Optional[dict] = None
+
+        self.gallery: Optional[Gallery] = None
+        self.log = None
+        self.log_offset = 0
+        self.log_size = 0  # Log file size at the last read
+        self.log_records = 0
+        self.delta: Dict[int, np.ndarray] = {}  # Logged additions
+        self.hidden = set()  # Gallery keys removed or replaced by the log
+        self.delta_matrix: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        with self.lock.write(), self._file_lock():
+            self._recover()
+            self._open_generation()
+
+        print(f"Mapped shared gallery generation {self.gallery.generation} "
+              f"with {self.get_total_embeddings()} embeddings")
+
+    def _log_path(self, generation: int) -> str:
+        """Log file of a generation."""
+        return f"{self.gallery_path}.{generation}.log"
+
+    def _tmp_path(self, generation: int) -> str:
+        """Unique file a generation is written to before it is installed."""
+        return f"{self.gallery_path}.{generation}.{uuid.uuid4().hex}.tmp"
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold the exclusive cross-process write lock."""
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def sync_once(self, sync: Callable[[], dict]) -> Optional[dict]:
+        """
+        Run a startup check of the gallery against the database in one process.
+
+        Workers starting together queue on a file lock; the first runs the
+        check and the others skip it, since the gallery they then map is
+        already reconciled. A worker starting later (a restart) checks again.
+
+        Args:
+            sync: The check, e.g. index_sync.sync_index bound to this store
+
+        Returns:
+            The check's report, or None if another process ran it meanwhile
+        """
+        started = time.time()
+        with open(self.sync_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            last_sync = float(f.read() or 0)
+            if last_sync >= started:
+                return None
+
+            report = sync()
+            f.truncate(0)
+            f.write(repr(time.time()))
+            return report
+
+    def _recover(self) -> None:
+        """Create the first generation, or clean up after a crash (file lock must be held)."""
+        if not os.path.exists(self.gallery_path):
+            self._publish(0, np.zeros(0, dtype='int64'), iter(()))
+            return
+
+        generation = Gallery(self.gallery_path, self.embedding_dim).generation
+        if not os.path.exists(self._log_path(generation)):
+            # Logged changes are lost; the startup index check re-adds them from the database
+            self._write_log(generation, b'')
+
+        # Files of older generations left by a crash during compaction
+        for path in glob.glob(self.gallery_path + ".*.log") + glob.glob(self.gallery_path + ".*.tmp"):
+            try:
+                if int(path[len(self.gallery_path) + 1:].split(".")[0]) < generation:
+                    os.remove(path)
+            except ValueError:
+                pass
+
+    def _write_log(self, generation: int, records: bytes) -> None:
+        """Create the log of a generation holding encoded records."""
+        path = self._log_path(generation)
+        with open(path + ".tmp", 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.embedding_dim) + records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _publish(self, generation: int, ids: np.ndarray, rows: Iterator[np.ndarray],
+                 records: bytes = b'') -> None:
+        """Write a generation, its log and make it current (file lock must be held)."""
+        tmp_path = self._tmp_path(generation)
+        write_gallery(tmp_path, self.embedding_dim, generation, ids, rows)
+        self._install(generation, tmp_path, records)
+
+    def _install(self, generation: int, tmp_path: str, records: bytes = b'') -> None:
+        """Make a written gallery file current (file lock must be held)."""
+        # The log must exist before processes can see its gallery
+        self._write_log(generation, records)
+        os.replace(tmp_path, self.gallery_path)
+        if generation and os.path.exists(self._log_path(generation - 1)):
+            os.remove(self._log_path(generation - 1))
+
+    def _open_generation(self) -> None:
+        """Map the current gallery file and read its log (write lock must be held)."""
+        for _ in range(10):
+            gallery = Gallery(self.gallery_path, self.embedding_dim)
+            try:
+                log = open(self._log_path(gallery.generation), 'rb')
+                break
+            except FileNotFoundError:
+                # Replaced by a newer generation in the meantime
+                continue
+        else:
+            raise RuntimeError(f"No log for the current generation of {self.gallery_path}")
+
+        magic, version, dim = HEADER.unpack(log.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or dim != self.embedding_dim:
+            raise ValueError(f"Incompatible gallery log: {log.name}")
+
+        if self.log is not None:
+            self.log.close()
+        self.gallery, self.log = gallery, log
+        self.log_offset = HEADER.size
+        self.log_size = 0
+        self.log_records = 0
+        self.delta, self.hidden, self.delta_matrix = {}, set(), None
+        self._read_log()
+
+    def _stale(self) -> bool:
+        """Check, without reading the log, whether another process changed the gallery (lock must be held)."""
+        stat = os.stat(self.gallery_path)
+        return (stat.st_dev, stat.st_ino) != self.gallery.file_id or \
+            os.fstat(self.log.fileno()).st_size != self.log_size
+
+    @contextmanager
+    def _fresh(self):
+        """Hold the read lock on an up-to-date view, taking the write lock only to refresh it."""
+        with self.lock.read():
+            stale = self._stale()
+        if stale:
+            with self.lock.write():
+                self._refresh()
+        with self.lock.read():
+            yield
+
+    def _refresh(self) -> None:
+        """Pick up a new generation and changes logged by other processes (write lock must be held)."""
+        stat = os.stat(self.gallery_path)
+        if (stat.st_dev, stat.st_ino) != self.gallery.file_id:
+            self._open_generation()
+        else:
+            self._read_log()
+
+    def _read_log(self) -> None:
+        """Apply complete records appended to the log since the last read (write lock must be held)."""
+        size = self.log_size = os.fstat(self.log.fileno()).st_size
+        if size <= self.log_offset:
+            return
+
+        self.log.seek(self.log_offset)
+        data = self.log.read(size - self.log_offset)
+        pos = 0
+        while pos + RECORD.size <= len(data):
+            _, op, key = RECORD.unpack_from(data, pos)
+            end = pos + (self.record_size if op == OP_ADD else RECORD.size)
+            if op not in (OP_ADD, OP_REMOVE) or end > len(data):
+                # Torn record being (or crashed while being) written
+                break
+
+            if self.gallery.position(key) >= 0:
+                self.hidden.add(key)
+            if op == OP_ADD:
+                self.delta[key] = np.frombuffer(data, dtype='<f4', count=self.embedding_dim,
+                                                offset=pos + RECORD.size)
+            else:
+                self.delta.pop(key, None)
+            self.log_records += 1
+            pos = end
+
+        if pos:
+            self.log_offset += pos
+            self.delta_matrix = None
+
+    def _append(self, records: List[Record]) -> None:
+        """Log changes and apply them (write lock and file lock must be held, view refreshed)."""
+        path = self._log_path(self.gallery.generation)
+        data = b''.join(
+            RECORD.pack(self.log_records + i + 1, op, key) +
+            (np.ascontiguousarray(vector, dtype='<f4').tobytes() if op == OP_ADD else b'')
+            for i, (op, key, vector) in enumerate(records)
+        )
+
+        with open(path, 'r+b') as f:
+            # Drop a torn record of a writer that crashed
+            f.truncate(self.log_offset)
+            f.seek(self.log_offset)
+            f.write(data)
+            f.flush()
+            if self.wal_fsync:
+                os.fsync(f.fileno())
+
+        self._read_log()
+
+    def _change(self, records: List[Record]) -> None:
+        """Log changes from this process and schedule compaction."""
+        with self.lock.write(), self._file_lock():
+            self._refresh()
+            self._append(records)
+        self._maybe_snapshot()
+
+    def add_embedding(self, user_id: int, embedding: np.ndarray, slot: int = 0) -> None:
+        """
+        Add a face embedding, replacing any existing one for the user.
+
+        Args:
+            user_id: User ID to associate with embedding
+            embedding: Face embedding vector (512-dim, L2 normalized)
+            slot: Sample slot of the user (multi_sample only)
+        """
+        key = sample_key(user_id, slot) if self.multi_sample else user_id
+        self._change([(OP_ADD, key, embedding.reshape(-1))])
+
+    def add_embeddings(self, user_ids: np.ndarray, embeddings: np.ndarray, snapshot: bool = False,
+                       slots: Optional[np.ndarray] = None) -> None:
+        """
+        Add several face embeddings with one log write.
+
+        Args:
+            user_ids: User IDs (unique)
+            embeddings: Matrix of shape (n, embedding_dim), L2 normalized
+            snapshot: Write a new generation now (bulk imports)
+            slots: Sample slot per user (multi_sample only, default 0)
+        """
+        if not len(user_ids):
+            return
+
+        keys = np.asarray(user_ids, dtype='int64')
+        if self.multi_sample:
+            keys = (keys << SAMPLE_KEY_BITS) | (0 if slots is None else np.asarray(slots, dtype='int64'))
+        self._change([(OP_ADD, int(key), vector) for key, vector in zip(keys, embeddings)])
+
+        if snapshot:
+            self.snapshot()
+
+    def remove_embedding(self, user_id: int) -> bool:
+        """
+        Remove embedding (every sample with multi_sample) by user_id.
+
+        Returns:
+            True if removed, False if not found
+        """
+        with self.lock.write(), self._file_lock():
+            self._refresh()
+            keys = self._user_keys(user_id)
+            if not keys:
+                return False
+            self._append([(OP_REMOVE, key, None) for key in keys])
+
+        self._maybe_snapshot()
+        return True
+
+    def _contains(self, key: int) -> bool:
+        """Check whether a key has a vector (lock must be held)."""
+        return key in self.delta or (key not in self.hidden and self.gallery.position(key) >= 0)
+
+    def _vector(self, key: int) -> np.ndarray:
+        """Current vector of a key (lock must be held)."""
+        if key in self.delta:
+            return self.delta[key]
+        return self.gallery.vectors[self.gallery.position(key)]
+
+    def _user_keys(self, user_id: int) -> List[int]:
+        """Keys holding a user's vectors (lock must be held)."""
+        if not self.multi_sample:
+            return [user_id] if self._contains(user_id) else []
+
+        # Sample slots are assigned from 0 without gaps
+        keys = []
+        for slot in range(MAX_SAMPLE_SLOTS):
+            key = sample_key(user_id, slot)
+            if not self._contains(key):
+                break
+            keys.append(key)
+        return keys
+
+    def get_total_embeddings(self) -> int:
+        """Get total number of embeddings in the gallery."""
+        with self._fresh():
+            return self._total()
+
+    def _total(self) -> int:
+        """Number of live embeddings (lock must be held)."""
+        return len(self.gallery.ids) - len(self.hidden) + len(self.delta)
+
+    def search(self, query_embedding: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        """
+        Search for most similar embeddings.
+
+        Args:
+            query_embedding: Query face embedding
+            k: Number of nearest neighbors to return
+
+        Returns:
+            List of tuples (user_id, similarity_score)
+        """
+        return self.search_batch(query_embedding.reshape(1, -1), k)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 1) -> List[List[Tuple[int, float]]]:
+        """
+        Search for most similar embeddings of several queries.
+
+        Args:
+            query_embeddings: Query matrix of shape (n_queries, embedding_dim)
+            k: Number of nearest neighbors to return per query
+
+        Returns:
+            One list of tuples (user_id, similarity_score) per query; with
+            multi_sample, one entry per user scored by sample_scoring
+        """
+        with self._fresh():
+            return self._search(np.ascontiguousarray(query_embeddings, dtype='float32'), k)
+
+    def _search(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """Search the gallery and the delta (lock must be held)."""
+        total = self._total()
+        k = min(k, total)
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        fetch = k * SAMPLE_FETCH_FACTOR if self.multi_sample else k
+        while True:
+            hits = self._hits(queries, min(fetch, total))
+            results = [self._collect(query, query_hits, k) for query, query_hits in zip(queries, hits)]
+            if fetch >= total or all(len(r) == k for r in results):
+                return results
+
+            # Other samples of the same users crowded out users, search deeper
+            fetch *= 2
+
+    def _hits(self, queries: np.ndarray, fetch: int) -> List[List[Tuple[float, int]]]:
+        """Best (similarity, key) pairs per query from the gallery and the delta, best first."""
+        hits = [[] for _ in range(len(queries))]
+
+        n_gallery = len(self.gallery.ids)
+        if n_gallery:
+            # Over-fetch by the number of hidden rows so enough live ones remain
+            n_fetch = min(fetch + len(self.hidden), n_gallery)
+            if faiss is not None:
+                distances, rows = faiss.knn(queries, self.gallery.vectors, n_fetch, faiss.METRIC_INNER_PRODUCT)
+            else:
+                distances, rows = top_k(queries @ self.gallery.vectors.T, n_fetch)
+            for query_hits, query_distances, query_rows in zip(hits, distances, rows):
+                keys = self.gallery.ids[query_rows[query_rows >= 0]]
+                query_hits.extend((float(d), int(key)) for d, key in zip(query_distances, keys)
+                                  if int(key) not in self.hidden)
+
+        if self.delta:
+            if self.delta_matrix is None:
+                # Concurrent searches may both build it; they build the same matrix
+                self.delta_matrix = (np.fromiter(self.delta.keys(), dtype='int64', count=len(self.delta)),
+                                     np.stack(list(self.delta.values())))
+            keys, vectors = self.delta_matrix
+            similarities = queries @ vectors.T
+            for query_hits, query_similarities in zip(hits, similarities):
+                query_hits.extend(zip(query_similarities.tolist(), keys.tolist()))
+
+        for query_hits in hits:
+            query_hits.sort(reverse=True)
+            del query_hits[fetch:]
+        return hits
+
+    def _collect(self, query: np.ndarray, hits: List[Tuple[float, int]], k: int) -> List[Tuple[int, float]]:
+        """Convert one query's hits to (user_id, similarity) per user."""
+        similarities = {}
+        for similarity, key in hits:
+            user_id = key >> SAMPLE_KEY_BITS if self.multi_sample else key
+            if user_id not in similarities:
+                similarities[user_id] = similarity
+
+        if self.multi_sample and self.sample_scoring == "mean":
+            for user_id in similarities:
+                samples = np.stack([self._vector(key) for key in self._user_keys(user_id)])
+                similarities[user_id] = float(np.mean(samples @ query))
+            return sorted(similarities.items(), key=lambda r: r[1], reverse=True)[:k]
+
+        return list(similarities.items())[:k]
+
+    def get_ids(self) -> np.ndarray:
+        """Get the user IDs that have an embedding (sample keys with multi_sample)."""
+        with self._fresh():
+            return self._ids()
+
+    def _ids(self) -> np.ndarray:
+        """Live keys, sorted (lock must be held)."""
+        ids = self.gallery.ids
+        if self.hidden:
+            ids = ids[~np.isin(ids, np.fromiter(self.hidden, dtype='int64'))]
+        if self.delta:
+            ids = np.union1d(ids, np.fromiter(self.delta.keys(), dtype='int64'))
+        return np.asarray(ids, dtype='int64')
+
+    def _maybe_snapshot(self) -> None:
+        """Start writing a new generation in the background once enough changes are logged."""
+        if self.log_records < self.snapshot_every:
+            return
+        if self.snapshot_thread is not None and self.snapshot_thread.is_alive():
+            return
+
+        self.snapshot_thread = Thread(target=self.snapshot, name="gallery-snapshot", daemon=True)
+        self.snapshot_thread.start()
+
+    def snapshot(self) -> None:
+        """
+        Merge the gallery and its log into a new generation.
+
+        The new gallery file is written without holding the lock, so searches
+        and (other processes') changes continue meanwhile; records logged in
+        the meantime are carried over to the new generation's log.
+        """
+        with self.snapshot_lock:
+            with self.lock.write(), self._file_lock():
+                self._refresh()
+                if not self.log_records:
+                    return
+                gallery, delta = self.gallery, dict(self.delta)
+                offset = self.log_offset
+                ids = self._ids()
+
+            generation = gallery.generation + 1
+            tmp_path = self._tmp_path(generation)
+            start = time.perf_counter()
+            write_gallery(tmp_path, self.embedding_dim, generation, ids, self._rows_of(gallery, delta, ids))
+
+            with self.lock.write(), self._file_lock():
+                self._refresh()
+                if self.gallery.generation != gallery.generation:
+                    # Another process compacted first
+                    os.remove(tmp_path)
+                    return
+
+                with open(self._log_path(gallery.generation), 'rb') as f:
+                    f.seek(offset)
+                    newer = f.read(self.log_offset - offset)
+                self._install(generation, tmp_path, newer)
+                self._open_generation()
+
+            print(f"Wrote shared gallery generation {generation} with {len(ids)} embeddings "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+    def _rows_of(self, gallery: Gallery, delta: Dict[int, np.ndarray], ids: np.ndarray) -> Iterator[np.ndarray]:
+        """Vectors of sorted keys in chunks, from a gallery generation overlaid with a delta."""
+        for start in range(0, len(ids), WRITE_CHUNK):
+            keys = ids[start:start + WRITE_CHUNK]
+            chunk = np.empty((len(keys), self.embedding_dim), dtype='float32')
+            if len(gallery.ids):
+                rows = np.minimum(np.searchsorted(gallery.ids, keys), len(gallery.ids) - 1)
+                chunk[:] = gallery.vectors[rows]
+            for i, key in enumerate(keys.tolist()):
+                if key in delta:
+                    chunk[i] = delta[key]
+            yield chunk
+
+    def rebuild(self, user_ids: Optional[np.ndarray] = None, embeddings: Optional[np.ndarray] = None) -> None:
+        """
+        Write a new generation, replacing the whole gallery when user_ids are given.
+
+        Args:
+            user_ids: Index keys of the new gallery (default: keep the current one)
+            embeddings: Embeddings of user_ids, shape (n, embedding_dim)
+        """
+        if user_ids is None:
+            self.snapshot()
+            return
+
+        ids = np.asarray(user_ids, dtype='int64')
+        order = np.argsort(ids, kind='stable')
+        vectors = np.ascontiguousarray(embeddings, dtype='float32').reshape(len(ids), self.embedding_dim)
+        ids, vectors = ids[order], vectors[order]
+
+        with self.snapshot_lock, self.lock.write(), self._file_lock():
+            self._refresh()
+            self._publish(self.gallery.generation + 1, ids,
+                          (vectors[start:start + WRITE_CHUNK] for start in range(0, len(ids), WRITE_CHUNK)))
+            self._open_generation()
+
+    def clear(self) -> None:
+        """Clear all embeddings from the gallery."""
+        self.rebuild(np.zeros(0, dtype='int64'), np.zeros((0, self.embedding_dim), dtype='float32'))
+
+    def benchmark(self, n_queries: int = 100, k: int = 10, noise: float = 0.5) -> dict:
+        """
+        Measure search latency. Search is exact, so recall is 1.
+
+        Args:
+            n_queries: Number of queries
+            k: Neighbors requested per query
+            noise: Norm of the noise added to each enrolled embedding used as a query
+
+        Returns:
+            Dict with the index type and one recall/latency point
+        """
+        with self._fresh():
+            ids = self._ids()
+            result = {"index_type": "shared", "embeddings": len(ids), "points": []}
+            if len(ids):
+                rng = np.random.default_rng()
+                picked = rng.choice(ids, size=min(n_queries, len(ids)), replace=False)
+                queries = np.stack([self._vector(int(key)) for key in picked])
+                queries = queries + rng.standard_normal(queries.shape).astype('float32') * noise / math.sqrt(self.embedding_dim)
+                queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+                start = time.perf_counter()
+                for query in queries:
+                    self._search(query.reshape(1, -1), k)
+                result["points"].append({
+                    "recall_at_1": 1.0,
+                    f"recall_at_{k}": 1.0,
+                    "latency_ms": (time.perf_counter() - start) * 1000 / len(queries)
+                })
+
+        self.last_benchmark = result
+        return result
+
+    def get_stats(self) -> dict:
+        """Get gallery statistics."""
+        with self._fresh():
+            stats = {
+                "index_type": "shared",
+                "embeddings": self._total(),
+                "generation": self.gallery.generation,
+                "mapped_bytes": self.gallery.nbytes,
+                "log_records": self.log_records,
+                "bytes_per_vector": self.embedding_dim * 4,
+                "multi_sample": self.multi_sample
+            }
+        if self.multi_sample:
+            stats["sample_scoring"] = self.sample_scoring
+        stats["benchmark"] = self.last_benchmark
+        return stats
+
+    def instrument(self, timer) -> None:
+        """Time searches (single queries go through search_batch), see Metrics.timer."""
+        self.search_batch = timer("search", self.search_batch)
+
+    def close(self) -> None:
+        """Wait for a background snapshot and unmap the gallery."""
+        if self.snapshot_thread is not None:
+            self.snapshot_thread.join()
+
+        with self.lock.write():
+            if self.log is not None:
+                self.log.close()
+                self.log = None
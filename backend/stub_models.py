@@ -0,0 +1,75 @@
+"""Model-free stand-ins for FaceDetector and FaceEmbedder, for load testing."""
+import base64
+import binascii
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+CROP_SIZE = 112
+
+
+class StubFaceDetector:
+    """
+    Finds exactly one face in any non-empty image, without decoding it.
+
+    The crop is pseudo-random but seeded by the image bytes, so the same
+    upload always yields the same crop (and the same stub embedding).
+    """
+
+    def detect_from_base64(self, base64_image: str, align: bool = False) -> List[Tuple[np.ndarray, dict]]:
+        """Detect the stub face of a base64 encoded image."""
+        # Remove data URL prefix if present
+        if ',' in base64_image:
+            base64_image = base64_image.split(',')[1]
+
+        try:
+            return self.detect_from_bytes(base64.b64decode(base64_image), align=align)
+        except binascii.Error:
+            raise ValueError("Could not decode image")
+
+    def detect_from_bytes(self, image_bytes: bytes, align: bool = False) -> List[Tuple[np.ndarray, dict]]:
+        """
+        Detect the stub face of raw encoded image bytes.
+
+        Raises:
+            ValueError: If the upload is empty
+        """
+        if not image_bytes:
+            raise ValueError("Could not decode image")
+
+        rng = np.random.default_rng(zlib.crc32(image_bytes))
+        crop = rng.integers(0, 256, (CROP_SIZE, CROP_SIZE, 3), dtype=np.uint8)
+        return [(crop, {'x': 0, 'y': 0, 'width': CROP_SIZE, 'height': CROP_SIZE})]
+
+    def instrument(self, timer) -> None:
+        """Time the stub detection, see Metrics.timer."""
+        self.detect_from_bytes = timer("detect", self.detect_from_bytes)
+
+
+class StubFaceEmbedder:
+    """Maps each crop to a deterministic random unit vector."""
+
+    def __init__(self, embedding_size: int = 512):
+        """
+        Initialize embedder.
+
+        Args:
+            embedding_size: Dimension of the generated embeddings
+        """
+        self.single_pass = True
+        self.embedding_size = embedding_size
+
+    def get_embedding(self, face_image: np.ndarray) -> Optional[np.ndarray]:
+        """Generate the L2 normalized stub embedding of a face crop."""
+        rng = np.random.default_rng(zlib.crc32(np.ascontiguousarray(face_image).tobytes()))
+        embedding = rng.standard_normal(self.embedding_size).astype('float32')
+        return embedding / np.linalg.norm(embedding)
+
+    def get_embeddings_batch(self, face_images: list) -> list:
+        """Generate stub embeddings for multiple faces."""
+        return [self.get_embedding(face_image) for face_image in face_images]
+
+    def instrument(self, timer) -> None:
+        """Time the stub embedding, see Metrics.timer."""
+        self.get_embedding = timer("embed", self.get_embedding)
@@ -0,0 +1,48 @@
+"""Aggregation of several face samples into one identity template."""
+import numpy as np
+
+
+# How a user's samples are represented in the vector index:
+#   "mean"   - one vector per user, the normalized mean of their samples
+#   "medoid" - one vector per user, the sample most similar to the others
+#   "all"    - every sample, scored per user at search time
+TEMPLATE_MODES = ("mean", "medoid", "all")
+
+# With "all", index IDs are user_id << SAMPLE_KEY_BITS | slot
+SAMPLE_KEY_BITS = 8
+MAX_SAMPLE_SLOTS = 1 << SAMPLE_KEY_BITS
+
+# Per-user scoring of samples: best matching sample, or mean over all samples
+SAMPLE_SCORINGS = ("max", "mean")
+
+# Searches over samples fetch this many hits per requested user
+SAMPLE_FETCH_FACTOR = 8
+
+
+def sample_key(user_id: int, slot: int) -> int:
+    """Index ID of a user's sample."""
+    return (user_id << SAMPLE_KEY_BITS) | slot
+
+
+def aggregate_embeddings(embeddings: np.ndarray, method: str = "mean") -> np.ndarray:
+    """
+    Combine a user's sample embeddings into one L2 normalized template.
+
+    Args:
+        embeddings: Matrix of shape (n_samples, embedding_dim), L2 normalized
+        method: "mean" or "medoid"
+
+    Returns:
+        Template embedding (float32)
+    """
+    embeddings = np.asarray(embeddings, dtype='float32')
+
+    if method == "medoid":
+        # Highest total cosine similarity to the other samples
+        template = embeddings[int(np.argmax((embeddings @ embeddings.T).sum(axis=1)))]
+    elif method == "mean":
+        template = embeddings.mean(axis=0)
+    else:
+        raise ValueError(f"Unknown template method '{method}'")
+
+    return template / np.linalg.norm(template)
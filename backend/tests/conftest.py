@@ -0,0 +1,17 @@
+"""Helpers and fixtures shared by the vector store tests."""
+import numpy as np
+import pytest
+
+
+DIM = 8
+
+
+def random_embeddings(n, seed=0):
+    """Generate L2 normalized random embeddings."""
+    embeddings = np.random.default_rng(seed).standard_normal((n, DIM)).astype('float32')
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "faiss_index")
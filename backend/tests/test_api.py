@@ -1,4 +1,6 @@
 """Unit tests for API endpoints."""
+import base64
+import json
 import pytest
 from fastapi.testclient import TestClient
 import sys
@@ -7,11 +9,40 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import main
 from main import app
+from stub_models import StubFaceDetector
 
 client = TestClient(app)
 
 
+class MultiFaceDetector(StubFaceDetector):
+    """Stub detector finding one face per b"|" separated part of the image."""
+    
+    def detect_from_bytes(self, image_bytes, align=False):
+        if not image_bytes:
+            raise ValueError("Could not decode image")
+        faces = []
+        for part in image_bytes.split(b"|"):
+            faces += super().detect_from_bytes(part, align)
+        return faces
+
+
+@pytest.fixture
+def stub_client(tmp_path, monkeypatch):
+    """Client of a backend with an empty database and index under tmp_path, using the stub models."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "STUB_MODELS", True)
+    
+    with TestClient(app) as client:
+        yield client
+
+
+def upload(client, path, image, **params):
+    """POST raw image bytes to a /v2 endpoint."""
+    return client.post(path, content=image, params=params, headers={"Content-Type": "application/octet-stream"})
+
+
 def test_root_endpoint():
     """Test root endpoint."""
     response = client.get("/")
@@ -48,3 +79,143 @@ def test_get_users():
 
 # Note: Full enrollment and recognition tests require actual images
 # These would be integration tests with test images
+
+
+def test_v2_recognize_rejects_empty_upload():
+    """Test raw upload endpoint rejects an empty body."""
+    response = client.post(
+        "/v2/recognize",
+        content=b"",
+        headers={"Content-Type": "application/octet-stream"}
+    )
+    assert response.status_code == 400
+
+
+def test_stats_benchmark_requires_admin_token(monkeypatch):
+    """Test the index benchmark is refused without the admin token."""
+    import main
+    
+    assert client.get("/stats?benchmark=true").status_code == 404
+    
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    response = client.get("/stats?benchmark=true", headers={"X-Admin-Token": "wrong"})
+    assert response.status_code == 403
+
+
+def test_v2_multipart_enroll_and_recognize(stub_client):
+    """Test a photo enrolled as a multipart upload is recognized from the same upload."""
+    photo = {"image": ("alice.jpg", b"alice photo", "image/jpeg")}
+    
+    response = stub_client.post("/v2/enroll", files=photo, data={"name": "Alice", "email": "alice@example.com"})
+    assert response.status_code == 200
+    user_id = response.json()["user_id"]
+    
+    response = stub_client.post("/v2/recognize", files=photo)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["recognized"]
+    assert data["match"]["user_id"] == user_id
+    assert data["match"]["name"] == "Alice"
+    
+    response = stub_client.post("/v2/recognize", files={"image": ("bob.jpg", b"bob photo", "image/jpeg")})
+    assert response.status_code == 200
+    assert not response.json()["recognized"]
+    
+    # Form fields are validated like the JSON API's
+    response = stub_client.post("/v2/enroll", files=photo, data={"name": "Alice"})
+    assert response.status_code == 422
+
+
+def test_recognize_all_faces(stub_client, monkeypatch):
+    """Test every face is embedded in one batch and gets its own result."""
+    for name in ("alice", "bob"):
+        assert upload(stub_client, "/v2/enroll", name.encode(), name=name, email=f"{name}@example.com").status_code == 200
+    
+    monkeypatch.setattr(main, "face_detector", MultiFaceDetector())
+    batch_sizes = []
+    embed_batch = main.face_embedder.get_embeddings_batch
+    
+    def recording_batch(face_images):
+        batch_sizes.append(len(face_images))
+        return embed_batch(face_images)
+    
+    monkeypatch.setattr(main.face_embedder, "get_embeddings_batch", recording_batch)
+    
+    group = b"alice|stranger|bob"
+    for response in (
+        upload(stub_client, "/v2/recognize/all", group),
+        stub_client.post("/recognize/all", json={"image": base64.b64encode(group).decode()})
+    ):
+        assert response.status_code == 200
+        data = response.json()
+        assert data["faces_detected"] == 3
+        assert sorted(match["name"] for match in data["matches"]) == ["alice", "bob"]
+        assert all(match["bounding_box"] for match in data["matches"])
+    
+    assert batch_sizes == [3, 3]
+
+
+def test_recognize_all_rejects_empty_image(stub_client):
+    """Test an empty image is a bad request on both multi-face endpoints."""
+    assert upload(stub_client, "/v2/enroll", b"alice", name="alice", email="alice@example.com").status_code == 200
+    
+    assert upload(stub_client, "/v2/recognize/all", b"").status_code == 400
+    assert stub_client.post("/recognize/all", json={"image": ""}).status_code == 400
+
+
+def test_users_pagination(stub_client):
+    """Test next_cursor pages through users in enrollment order until the last page."""
+    for name in ("alice", "bob", "carol"):
+        assert upload(stub_client, "/v2/enroll", name.encode(), name=name, email=f"{name}@example.com").status_code == 200
+    
+    first = stub_client.get("/users", params={"limit": 2}).json()
+    assert [user["name"] for user in first["users"]] == ["alice", "bob"]
+    assert first["total"] == 3
+    assert first["next_cursor"] == first["users"][-1]["user_id"]
+    
+    last = stub_client.get("/users", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [user["name"] for user in last["users"]] == ["carol"]
+    assert last["next_cursor"] is None
+    
+    assert stub_client.get("/users", params={"cursor": "abc"}).status_code == 422
+
+
+def test_users_ndjson_stream(stub_client):
+    """Test format=ndjson streams one JSON object per user after the cursor."""
+    for name in ("alice", "bob"):
+        assert upload(stub_client, "/v2/enroll", name.encode(), name=name, email=f"{name}@example.com").status_code == 200
+    
+    response = stub_client.get("/users", params={"format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    users = [json.loads(line) for line in response.text.splitlines()]
+    assert [user["email"] for user in users] == ["alice@example.com", "bob@example.com"]
+    
+    response = stub_client.get("/users", params={"format": "ndjson", "cursor": users[0]["user_id"]})
+    assert [json.loads(line)["name"] for line in response.text.splitlines()] == ["bob"]
+
+
+def test_add_user_samples(stub_client, monkeypatch):
+    """Test samples are added through both endpoints until the per-user limit."""
+    monkeypatch.setattr(main, "MAX_SAMPLES_PER_USER", 3)
+    user_id = upload(stub_client, "/v2/enroll", b"alice", name="alice", email="alice@example.com").json()["user_id"]
+    
+    # The enrollment photo is the first sample
+    response = stub_client.post(f"/users/{user_id}/samples", json={"image": base64.b64encode(b"alice again").decode()})
+    assert response.status_code == 200
+    assert response.json()["samples"] == 2
+    
+    response = upload(stub_client, f"/v2/users/{user_id}/samples", b"alice once more")
+    assert response.status_code == 200
+    assert response.json()["samples"] == 3
+    
+    response = upload(stub_client, f"/v2/users/{user_id}/samples", b"alice one too many")
+    assert response.status_code == 400
+    assert "3 face samples" in response.json()["detail"]
+
+
+def test_add_sample_to_unknown_user(stub_client):
+    """Test adding a sample to a user that does not exist is not found."""
+    response = stub_client.post("/users/999/samples", json={"image": base64.b64encode(b"nobody").decode()})
+    assert response.status_code == 404
+    assert upload(stub_client, "/v2/users/999/samples", b"nobody").status_code == 404
@@ -0,0 +1,31 @@
+"""Unit tests for request micro-batching."""
+import asyncio
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batcher import MicroBatcher
+from executor import InferenceExecutor
+
+
+def test_concurrent_items_share_a_batch():
+    """Test that concurrent submits are processed together and fanned back out."""
+    executor = InferenceExecutor(max_workers=1)
+    batch_sizes = []
+    
+    def process_batch(items):
+        batch_sizes.append(len(items))
+        return [item * 2 for item in items]
+    
+    batcher = MicroBatcher(process_batch, executor, max_batch_size=4, max_wait_ms=50)
+    
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+    
+    assert asyncio.run(scenario()) == [0, 2, 4, 6, 8, 10]
+    assert batch_sizes == [4, 2]
+    assert batcher.get_stats()["batches"] == 2
+    assert not batcher.tasks
+    executor.shutdown()
@@ -0,0 +1,159 @@
+"""Tests for bulk enrollment."""
+import io
+import pytest
+import numpy as np
+import tarfile
+import zipfile
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_enroll import FINISHED_JOB_TTL, MAX_FINISHED_JOBS, BulkEnrollJob, bulk_enroll, iter_photos, prune_jobs
+from database import Database
+from vector_store import VectorStore
+
+
+MANIFEST = "file,name,email\nalice.jpg,Alice,alice@example.com\nbob.jpg,Bob,bob@example.com\nmissing.jpg,Eve,eve@example.com\n"
+
+
+class FakeDetector:
+    """Detects one face per image, none in images starting with b'none'."""
+    
+    def detect_from_bytes(self, image_bytes, align=False):
+        if image_bytes.startswith(b"none"):
+            return []
+        return [(image_bytes, {})]
+
+
+class FakeEmbedder:
+    """Embeds an image as a vector seeded by its bytes."""
+    
+    single_pass = True
+    
+    def get_embedding(self, face_image):
+        embedding = np.random.default_rng(len(face_image)).normal(size=512).astype('float32')
+        return embedding / np.linalg.norm(embedding)
+
+
+def write_photos(directory):
+    """Write the manifest and photos of the tests."""
+    (directory / "manifest.csv").write_text(MANIFEST)
+    (directory / "alice.jpg").write_bytes(b"alice")
+    (directory / "bob.jpg").write_bytes(b"none of a face")
+
+
+@pytest.mark.parametrize("kind", ["dir", "zip", "tar"])
+def test_iter_photos(tmp_path, kind):
+    """Test reading labelled photos from a directory and archives."""
+    photos_dir = tmp_path / "export"
+    photos_dir.mkdir()
+    write_photos(photos_dir)
+    
+    source = str(photos_dir)
+    if kind == "zip":
+        source = str(tmp_path / "photos.zip")
+        with zipfile.ZipFile(source, "w") as archive:
+            for path in photos_dir.iterdir():
+                archive.write(path, f"export/{path.name}")
+    elif kind == "tar":
+        source = str(tmp_path / "photos.tar.gz")
+        with tarfile.open(source, "w:gz") as archive:
+            archive.add(photos_dir, "export")
+    
+    photos = {email: (name, image) for _, name, email, image in iter_photos(source)}
+    assert photos == {
+        "alice@example.com": ("Alice", b"alice"),
+        "bob@example.com": ("Bob", b"none of a face"),
+        "eve@example.com": ("Eve", None)
+    }
+
+
+def test_bulk_enroll_reports_and_resumes(tmp_path):
+    """Test that photos are enrolled, failures reported and reruns skip enrolled users."""
+    write_photos(tmp_path)
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    vector_store = VectorStore(embedding_dim=512, index_path=str(tmp_path / "faiss_index"))
+    
+    results = []
+    counts = bulk_enroll(iter_photos(str(tmp_path)), FakeDetector(), FakeEmbedder(), database,
+                         vector_store, workers=2, batch_size=2, on_result=results.append)
+    
+    assert counts == {"total": 3, "enrolled": 1, "exists": 0, "failed": 2}
+    assert {r["email"]: r.get("error") for r in results if r["status"] == "failed"} == {
+        "bob@example.com": "No face detected",
+        "eve@example.com": "File not found"
+    }
+    assert database.get_user_count() == 1
+    assert vector_store.get_total_embeddings() == 1
+    
+    # The snapshot holds the import, nothing is left to replay
+    assert vector_store.wal.records == 0
+    
+    counts = bulk_enroll(iter_photos(str(tmp_path)), FakeDetector(), FakeEmbedder(), database, vector_store)
+    assert counts["exists"] == 1 and counts["enrolled"] == 0
+    vector_store.close()
+
+
+def test_failed_photo_does_not_claim_its_email(tmp_path):
+    """Test a later photo of an email is enrolled when an earlier one has no face."""
+    (tmp_path / "manifest.csv").write_text(
+        "file,name,email\nblurry.jpg,Carol,carol@example.com\n"
+        "carol.jpg,Carol,carol@example.com\nagain.jpg,Carol,carol@example.com\n"
+    )
+    (tmp_path / "blurry.jpg").write_bytes(b"none visible")
+    (tmp_path / "carol.jpg").write_bytes(b"carol")
+    (tmp_path / "again.jpg").write_bytes(b"carol again")
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    vector_store = VectorStore(embedding_dim=512, index_path=str(tmp_path / "faiss_index"))
+    
+    results = []
+    bulk_enroll(iter_photos(str(tmp_path)), FakeDetector(), FakeEmbedder(), database,
+                vector_store, on_result=results.append)
+    
+    assert {r["file"]: r["status"] for r in results} == {
+        "blurry.jpg": "failed",
+        "carol.jpg": "enrolled",
+        "again.jpg": "exists"
+    }
+    assert database.get_user_count() == 1
+    vector_store.close()
+
+
+def test_tar_is_read_in_one_pass(tmp_path, monkeypatch):
+    """Test a tar is opened once, as a stream, with photos before and after the manifest."""
+    source = str(tmp_path / "photos.tar.gz")
+    with tarfile.open(source, "w:gz") as archive:
+        for name, data in [("alice.jpg", b"alice"), ("manifest.csv", MANIFEST.encode()), ("bob.jpg", b"bob")]:
+            info = tarfile.TarInfo(f"export/{name}")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    
+    modes = []
+    open_tar = tarfile.open
+    
+    def recording_open(name, mode="r", **kwargs):
+        modes.append(mode)
+        return open_tar(name, mode, **kwargs)
+    
+    monkeypatch.setattr(tarfile, "open", recording_open)
+    
+    photos = [(path, image) for path, _, _, image in iter_photos(source)]
+    assert photos == [("export/alice.jpg", b"alice"), ("export/bob.jpg", b"bob"), ("export/missing.jpg", None)]
+    # Besides tarfile.is_tarfile peeking at the first header, only one streaming pass
+    assert modes.count("r|*") == 1 and "r:*" not in modes
+
+
+def test_prune_jobs_forgets_old_finished_jobs():
+    """Test finished jobs expire and are capped, while running jobs are kept."""
+    jobs = {}
+    for finished_at in [0.0] + [1000.0] * (MAX_FINISHED_JOBS + 1) + [None]:
+        job = BulkEnrollJob("unused.zip")
+        job.finished_at = finished_at
+        jobs[job.id] = job
+    ids = list(jobs)
+    
+    prune_jobs(jobs, now=FINISHED_JOB_TTL + 500.0)
+    
+    # The expired job and the oldest one over the cap are gone; the running one stays
+    assert list(jobs) == ids[2:]
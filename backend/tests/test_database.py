@@ -0,0 +1,180 @@
+"""Unit tests for database embedding storage."""
+import json
+import numpy as np
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, FaceSample, User
+
+
+def random_embedding(seed=0):
+    """Generate an L2 normalized 512-dim embedding."""
+    embedding = np.random.default_rng(seed).standard_normal(512).astype('float32')
+    return embedding / np.linalg.norm(embedding)
+
+
+def test_binary_embedding_round_trip(tmp_path):
+    """Test that embeddings are stored as compact encrypted float32 bytes."""
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    embedding = random_embedding()
+    
+    encrypted = database.encrypt_embedding(embedding)
+    
+    assert len(encrypted) < 2200
+    assert np.array_equal(database.decrypt_embedding(encrypted), embedding)
+
+
+def test_float16_storage(tmp_path):
+    """Test that float16 storage halves the size at reduced precision."""
+    database = Database(db_path=str(tmp_path / "helloface.db"), embedding_dtype="float16")
+    embedding = random_embedding()
+    
+    encrypted = database.encrypt_embedding(embedding)
+    
+    assert len(encrypted) < 1100
+    assert np.allclose(database.decrypt_embedding(encrypted), embedding, atol=1e-3)
+
+
+def test_tampered_embedding_is_rejected(tmp_path):
+    """Test that modified ciphertext fails authentication."""
+    from cryptography.exceptions import InvalidTag
+    
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    encrypted = bytearray(database.encrypt_embedding(random_embedding()))
+    encrypted[-1] ^= 1
+    
+    with pytest.raises(InvalidTag):
+        database.decrypt_embedding(bytes(encrypted))
+
+
+def test_legacy_rows_are_migrated(tmp_path):
+    """Test that JSON-in-Fernet rows stay readable and are converted."""
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    embedding = random_embedding()
+    legacy = database.cipher.fernet.encrypt(json.dumps(embedding.tolist()).encode())
+    
+    session = database.get_session()
+    session.add(User(name="Old", email="old@example.com", embedding_encrypted=legacy))
+    session.commit()
+    session.close()
+    database.create_user(name="New", email="new@example.com", embedding=embedding)
+    
+    assert np.array_equal(database.decrypt_embedding(legacy), embedding)
+    assert database.migrate_embeddings() == 1
+    assert database.migrate_embeddings() == 0
+    
+    stored = database.get_user_by_email("old@example.com").embedding_encrypted
+    assert len(stored) < len(legacy)
+    assert np.array_equal(database.decrypt_embedding(stored), embedding)
+
+
+def test_legacy_face_samples_are_migrated(tmp_path):
+    """Test that a legacy embedding copied into sample 0 is converted with the users."""
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    embedding = random_embedding()
+    legacy = database.cipher.fernet.encrypt(json.dumps(embedding.tolist()).encode())
+    
+    session = database.get_session()
+    user = User(name="Old", email="old@example.com", embedding_encrypted=legacy)
+    session.add(user)
+    session.commit()
+    user_id = user.id
+    session.close()
+    
+    # Sample 0 is the legacy enrollment embedding; the user row gets the new aggregate
+    database.add_face_sample(user_id, random_embedding(1))
+    assert database.migrate_embeddings() == 1
+    assert database.migrate_embeddings() == 0
+    
+    session = database.get_session()
+    stored = session.query(FaceSample).filter(FaceSample.slot == 0).one().embedding_encrypted
+    session.close()
+    assert len(stored) < len(legacy)
+    assert np.array_equal(database.decrypt_embedding(stored), embedding)
+
+
+def test_wal_mode_and_bulk_operations(tmp_path):
+    """Test that connections use WAL mode and bulk create/get/delete work."""
+    from sqlalchemy import text
+    
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    with database.engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+    
+    users = database.create_users([
+        (f"User {i}", f"user{i}@example.com", random_embedding(i)) for i in range(5)
+    ])
+    ids = [user.id for user in users]
+    
+    assert database.get_user_count() == 5
+    assert set(database.get_users_by_ids(ids[:3])) == set(ids[:3])
+    assert database.delete_users(ids[:2] + [999]) == 2
+    assert [user_id for user_id, *_ in database.get_user_summaries(newest_first=False)] == ids[2:]
+
+
+def test_keyset_pagination(tmp_path):
+    """Test that users are listed page by page and streamed in chunks."""
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    ids = [user.id for user in database.create_users([
+        (f"User {i}", f"user{i}@example.com", None) for i in range(7)
+    ])]
+    
+    page = database.get_user_summaries(limit=3, newest_first=False, after_id=ids[2])
+    assert [row[0] for row in page] == ids[3:6]
+    
+    streamed = list(database.iter_user_summaries(after_id=ids[0], chunk_size=2))
+    assert [row[0] for row in streamed] == ids[1:]
+    assert streamed[0][1:3] == ("User 1", "user1@example.com")
+
+
+def test_face_samples_are_aggregated(tmp_path):
+    """Test that added samples are stored and the user's embedding becomes their mean."""
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    first, second = random_embedding(1), random_embedding(2)
+    user = database.create_user(name="Jane Doe", email="jane@example.com", embedding=first)
+    
+    slot, template = database.add_face_sample(user.id, second, max_samples=2)
+    
+    mean = (first + second) / np.linalg.norm(first + second)
+    assert slot == 1
+    np.testing.assert_allclose(template, mean, atol=1e-6)
+    np.testing.assert_allclose(database.decrypt_embedding(database.get_user(user.id).embedding_encrypted), mean, atol=1e-6)
+    assert sorted(database.get_sample_slots()) == [(user.id, 0), (user.id, 1)]
+    assert [(user_id, slot) for rows in database.iter_encrypted_samples() for user_id, slot, _ in rows] == \
+        [(user.id, 0), (user.id, 1)]
+    
+    with pytest.raises(ValueError):
+        database.add_face_sample(user.id, first, max_samples=2)
+    
+    database.delete_user(user.id)
+    assert database.get_sample_slots() == []
+
+
+def test_concurrent_face_samples_take_distinct_slots(tmp_path, monkeypatch):
+    """Test that a sample stored by a concurrent request between read and write is retried."""
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    first, second, third = random_embedding(1), random_embedding(2), random_embedding(3)
+    user = database.create_user(name="Jane Doe", email="jane@example.com", embedding=first)
+    
+    encrypt = database.encrypt_embedding
+    raced = []
+    
+    def encrypt_racing(embedding):
+        # Another request stores its sample after this one picked its slot
+        if not raced:
+            raced.append(True)
+            monkeypatch.setattr(database, "encrypt_embedding", encrypt)
+            assert database.add_face_sample(user.id, third)[0] == 1
+        return encrypt(embedding)
+    
+    monkeypatch.setattr(database, "encrypt_embedding", encrypt_racing)
+    slot, template = database.add_face_sample(user.id, second)
+    
+    assert slot == 2
+    mean = (first + second + third) / np.linalg.norm(first + second + third)
+    np.testing.assert_allclose(template, mean, atol=1e-6)
+    assert sorted(database.get_sample_slots()) == [(user.id, 0), (user.id, 1), (user.id, 2)]
@@ -0,0 +1,47 @@
+"""Unit tests for the inference executor."""
+import asyncio
+import threading
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from executor import InferenceExecutor, ExecutorBusyError
+
+
+def test_run_returns_result():
+    """Test that jobs run on the pool and metrics are recorded."""
+    executor = InferenceExecutor(max_workers=2, max_queue_size=4)
+    
+    result = asyncio.run(executor.run(lambda a, b: a + b, 2, b=3))
+    
+    assert result == 5
+    stats = executor.get_stats()
+    assert stats["completed"] == 1
+    assert stats["queue_depth"] == 0
+    assert stats["wait_ms"]["max"] >= 0
+    executor.shutdown()
+
+
+def test_run_rejects_when_queue_full():
+    """Test that jobs beyond the queue bound are rejected."""
+    executor = InferenceExecutor(max_workers=1, max_queue_size=1)
+    release = threading.Event()
+    
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(executor.run(lambda: "queued"))
+        await asyncio.sleep(0.05)
+        
+        with pytest.raises(ExecutorBusyError):
+            await executor.run(lambda: "rejected")
+        
+        release.set()
+        return await running, await queued
+    
+    assert asyncio.run(scenario()) == (True, "queued")
+    assert executor.get_stats()["rejected"] == 1
+    executor.shutdown()
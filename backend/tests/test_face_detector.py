@@ -0,0 +1,49 @@
+"""Unit tests for face cropping and alignment."""
+import io
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from PIL import Image
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_detector import FaceDetector
+
+
+def make_detection(xmin, ymin, width, height, keypoint):
+    """Build a MediaPipe-like detection with all keypoints at one (relative) point."""
+    return SimpleNamespace(location_data=SimpleNamespace(
+        relative_bounding_box=SimpleNamespace(xmin=xmin, ymin=ymin, width=width, height=height),
+        relative_keypoints=[SimpleNamespace(x=keypoint[0], y=keypoint[1]) for _ in range(6)]
+    ))
+
+
+def test_degenerate_landmarks_fall_back_to_resized_crop():
+    """Test coincident landmarks give a plain 112x112 crop instead of an error."""
+    image = np.random.default_rng(0).integers(0, 256, (200, 200, 3), dtype=np.uint8)
+    assert FaceDetector.align_face(image, np.full((5, 2), 50, dtype=np.float32)) is None
+    
+    detector = FaceDetector()
+    crop = detector._crop_face(image, make_detection(0.25, 0.25, 0.5, 0.5, (0.5, 0.5)), align=True)
+    assert crop.shape == (112, 112, 3)
+
+
+def test_detection_outside_image_is_dropped():
+    """Test a detection clipped to nothing yields no crop."""
+    image = np.zeros((200, 200, 3), dtype=np.uint8)
+    detector = FaceDetector()
+    
+    assert detector._crop_face(image, make_detection(1.2, 1.2, 0.0, 0.0, (1.2, 1.2)), align=True) is None
+
+
+def test_decompression_bomb_is_rejected_as_undecodable(monkeypatch):
+    """Test an image over Pillow's pixel limit raises ValueError, not a server error."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(buffer, format="PNG")
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    
+    with pytest.raises(ValueError):
+        FaceDetector().decode_bytes(buffer.getvalue())
@@ -0,0 +1,76 @@
+"""Unit tests for rebuilding the FAISS index from the database."""
+import numpy as np
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from vector_store import VectorStore
+from index_sync import sync_index
+
+
+DIM = 8
+
+
+def make_gallery(tmp_path, n_users):
+    """Create a database of n_users with stored embeddings and an empty vector store."""
+    embeddings = np.random.default_rng(0).standard_normal((n_users, DIM)).astype('float32')
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    for i, embedding in enumerate(embeddings):
+        database.create_user(name=f"User {i}", email=f"user{i}@example.com", embedding=embedding.tolist())
+    
+    vector_store = VectorStore(embedding_dim=DIM, index_path=str(tmp_path / "faiss_index"))
+    return database, vector_store, embeddings
+
+
+def test_lost_index_is_rebuilt_from_database(tmp_path):
+    """Test that an empty index is rebuilt from the stored embeddings in parallel."""
+    database, vector_store, embeddings = make_gallery(tmp_path, 25)
+    
+    report = sync_index(database, vector_store, chunk_size=10, workers=2)
+    
+    assert report["rebuilt"]
+    assert vector_store.get_total_embeddings() == 25
+    assert vector_store.search(embeddings[7])[0][0] == 8
+    
+    # The rebuilt index is persisted
+    reopened = VectorStore(embedding_dim=DIM, index_path=str(tmp_path / "faiss_index"))
+    assert reopened.get_total_embeddings() == 25
+
+
+def test_missing_and_orphaned_entries_are_repaired(tmp_path):
+    """Test that missing users are re-indexed and unknown IDs are removed."""
+    database, vector_store, embeddings = make_gallery(tmp_path, 5)
+    vector_store.add_embeddings(np.arange(1, 5), embeddings[:4])
+    vector_store.add_embedding(99, embeddings[0])
+    
+    report = sync_index(database, vector_store)
+    
+    assert report["missing"] == 1
+    assert report["orphaned"] == 1
+    assert not report["rebuilt"]
+    assert sorted(vector_store.get_ids().tolist()) == [1, 2, 3, 4, 5]
+    assert vector_store.search(embeddings[4])[0][0] == 5
+
+
+def test_multi_sample_index_is_rebuilt_from_samples(tmp_path):
+    """Test that a multi-sample index is rebuilt with every stored face sample."""
+    database, _, embeddings = make_gallery(tmp_path, 5)
+    user_id = database.get_user_ids()[0]
+    database.add_face_sample(user_id, embeddings[1])
+    
+    vector_store = VectorStore(embedding_dim=DIM, index_path=str(tmp_path / "multi_index"), multi_sample=True)
+    report = sync_index(database, vector_store, workers=1)
+    
+    assert report["rebuilt"]
+    assert vector_store.get_total_embeddings() == 6
+    assert vector_store.search(embeddings[0], k=1)[0][0] == user_id
+    
+    # An orphaned sample (user deleted behind the index's back) is dropped
+    database.delete_user(user_id)
+    sync_index(database, vector_store, workers=1)
+    assert vector_store.get_total_embeddings() == 4
@@ -0,0 +1,75 @@
+"""Unit tests for the Prometheus metrics registry."""
+import pytest
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from metrics import Metrics
+
+
+def test_timer_fills_cumulative_histogram_buckets():
+    """Test timed calls, including failing ones, land in the stage histogram."""
+    metrics = Metrics()
+    metrics.stage_seconds.observe("search", 0.003)
+    metrics.stage_seconds.observe("search", 2.0)
+    
+    def fail():
+        raise ValueError("boom")
+    
+    with pytest.raises(ValueError):
+        metrics.timer("decode", fail)()
+    assert metrics.timer("decode", lambda x: x * 2)(21) == 42
+    
+    text = metrics.render()
+    assert '# TYPE helloface_stage_duration_seconds histogram' in text
+    assert 'helloface_stage_duration_seconds_bucket{stage="search",le="0.0025"} 0' in text
+    assert 'helloface_stage_duration_seconds_bucket{stage="search",le="0.005"} 1' in text
+    assert 'helloface_stage_duration_seconds_bucket{stage="search",le="+Inf"} 2' in text
+    assert 'helloface_stage_duration_seconds_sum{stage="search"} 2.003' in text
+    assert 'helloface_stage_duration_seconds_count{stage="decode"} 2' in text
+
+
+def test_counters_and_gauges_render():
+    """Test outcome counters start at zero and gauges are read at scrape time."""
+    metrics = Metrics()
+    size = [3]
+    metrics.gauge("gallery_embeddings", "Embeddings in the vector index.", lambda: size[0])
+    metrics.recognitions.inc("recognized", 2)
+    size[0] = 5
+    
+    text = metrics.render()
+    assert 'helloface_recognitions_total{outcome="recognized"} 2' in text
+    assert 'helloface_recognitions_total{outcome="no_face"} 0' in text
+    assert "# TYPE helloface_gallery_embeddings gauge\nhelloface_gallery_embeddings 5\n" in text
+
+
+def test_metrics_endpoint_reports_pipeline_stages(tmp_path, monkeypatch):
+    """Test /metrics is 404 when disabled and exposes stage timings when enabled."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "STUB_MODELS", True)
+    
+    with TestClient(main.app) as client:
+        assert client.get("/metrics").status_code == 404
+    
+    monkeypatch.setattr(main, "METRICS_ENABLED", True)
+    monkeypatch.setattr(main, "metrics", None)
+    with TestClient(main.app) as client:
+        upload = {"content": b"face", "headers": {"Content-Type": "application/octet-stream"}}
+        client.post("/v2/recognize", **upload)
+        client.post("/v2/enroll", params={"name": "Ada", "email": "ada@example.com"}, **upload)
+        client.post("/v2/recognize", **upload)
+        
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+    
+    for stage in ("detect", "embed", "search", "db_write"):
+        assert f'helloface_stage_duration_seconds_count{{stage="{stage}"}}' in text
+    assert 'helloface_recognitions_total{outcome="no_users"} 1' in text
+    assert 'helloface_recognitions_total{outcome="recognized"} 1' in text
+    assert "helloface_gallery_embeddings 1" in text
@@ -0,0 +1,74 @@
+"""Unit tests for the NumPy vector store."""
+import numpy as np
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import DIM, random_embeddings
+from numpy_store import NumpyVectorStore, top_k, INITIAL_CAPACITY
+
+
+def test_top_k_returns_best_columns_in_order():
+    """Test the argpartition top-k selection."""
+    scores = np.array([[0.1, 0.9, 0.5, 0.7], [0.3, 0.2, 0.8, 0.1]], dtype='float32')
+    values, columns = top_k(scores, 2)
+    assert columns.tolist() == [[1, 3], [2, 0]]
+    assert values.ravel().tolist() == pytest.approx([0.9, 0.7, 0.8, 0.3])
+    
+    assert top_k(scores, 4)[1][0].tolist() == [1, 3, 2, 0]
+
+
+def test_search_matches_brute_force_after_growth_and_deletes(index_path):
+    """Test exact results across matrix growth, removals and compaction."""
+    n = INITIAL_CAPACITY + 200
+    embeddings = random_embeddings(n)
+    store = NumpyVectorStore(embedding_dim=DIM, index_path=index_path, snapshot_every=10 ** 6)
+    store.add_embeddings(np.arange(1, n + 1), embeddings[:n])
+    assert store.get_stats()["capacity"] >= n
+    
+    removed = set(range(1, n + 1, 3))
+    for user_id in removed:
+        assert store.remove_embedding(user_id)
+    assert not store.remove_embedding(1)
+    assert store.dead <= 0.25 * store.size
+    
+    queries = random_embeddings(5, seed=1)
+    live = np.array([user_id for user_id in range(1, n + 1) if user_id not in removed])
+    expected = live[np.argsort(-(queries @ embeddings[live - 1].T), axis=1)[:, :3]]
+    results = store.search_batch(queries, k=3)
+    assert [[user_id for user_id, _ in hits] for hits in results] == expected.tolist()
+    assert store.get_total_embeddings() == len(live)
+
+
+def test_changes_survive_restart(index_path):
+    """Test that snapshots and logged changes are reloaded."""
+    embeddings = random_embeddings(4, seed=2)
+    store = NumpyVectorStore(embedding_dim=DIM, index_path=index_path)
+    store.add_embeddings(np.array([1, 2]), embeddings[:2], snapshot=True)
+    store.add_embedding(3, embeddings[2])
+    store.add_embedding(1, embeddings[3])
+    store.remove_embedding(2)
+    
+    reopened = NumpyVectorStore(embedding_dim=DIM, index_path=index_path)
+    assert reopened.get_ids().tolist() == [1, 3]
+    assert reopened.search(embeddings[3])[0] == (1, pytest.approx(1.0))
+
+
+@pytest.mark.parametrize("scoring", ["max", "mean"])
+def test_multi_sample_users_are_scored_per_user(index_path, scoring):
+    """Test that several samples of a user are searched and removed as one user."""
+    a, b, c = random_embeddings(3, seed=3)
+    store = NumpyVectorStore(embedding_dim=DIM, index_path=index_path, multi_sample=True, sample_scoring=scoring)
+    store.add_embedding(1, a)
+    store.add_embedding(1, b, slot=1)
+    store.add_embedding(2, c)
+    
+    scores = dict(store.search(b, k=2))
+    expected = 1.0 if scoring == "max" else (1.0 + float(np.dot(a, b))) / 2
+    assert scores[1] == pytest.approx(expected, abs=1e-5)
+    
+    assert store.remove_embedding(1)
+    assert [user_id for user_id, _ in store.search(b, k=2)] == [2]
@@ -0,0 +1,109 @@
+"""Unit tests for the request profiler."""
+import time
+from collections import Counter
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from profiling import ProfileStore, ProfilingMiddleware, StackSampler
+
+
+def busy_work(seconds):
+    """Spin the CPU for a while."""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def profiled_app(store, **options):
+    """Small app with a slow endpoint (run on the threadpool) behind the profiler."""
+    app = FastAPI()
+    
+    @app.get("/work")
+    def work():
+        busy_work(0.1)
+        return {"done": True}
+    
+    @app.get("/fast")
+    def fast():
+        return {"done": True}
+    
+    app.add_middleware(ProfilingMiddleware, store=store, **options)
+    return app
+
+
+def test_sampler_captures_busy_threads_only():
+    """Test collapsed stacks name the thread and its frames, skipping idle threads."""
+    sampler = StackSampler(interval=0.001)
+    sampler.start()
+    busy_work(0.05)
+    counts = sampler.stop()
+    
+    busy = [stack for stack in counts if "busy_work" in stack]
+    assert busy and all(stack.startswith("MainThread;") for stack in busy)
+    assert not any(stack.split(";")[-1].startswith(("wait (threading.py", "select (selectors.py")) for stack in counts)
+
+
+def test_request_with_token_is_profiled(tmp_path):
+    """Test only requests with the right X-Profile token are profiled."""
+    store = ProfileStore(str(tmp_path), keep=2)
+    client = TestClient(profiled_app(store, token="secret"))
+    
+    assert "x-profile-id" not in client.get("/work").headers
+    assert "x-profile-id" not in client.get("/work", headers={"X-Profile": "wrong"}).headers
+    assert store.ids() == []
+    
+    response = client.get("/work", headers={"X-Profile": "secret"})
+    assert response.json() == {"done": True}
+    profile_id = response.headers["x-profile-id"]
+    assert store.ids() == [profile_id]
+    
+    with open(store.path(profile_id)) as f:
+        lines = f.read().splitlines()
+    assert any("busy_work" in line for line in lines)
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+    
+    # Only the newest profiles are kept
+    for _ in range(3):
+        client.get("/fast", headers={"X-Profile": "secret"})
+    assert len(store.ids()) == 2
+
+
+def test_slow_requests_are_profiled_by_rolling_sampler(tmp_path):
+    """Test requests above the latency threshold get a profile, fast ones do not."""
+    store = ProfileStore(str(tmp_path))
+    client = TestClient(profiled_app(store, slow_ms=50, slow_interval_ms=2))
+    
+    client.get("/fast")
+    assert store.ids() == []
+    
+    client.get("/work")
+    profile_id, = store.ids()
+    assert "-slow-" in profile_id
+    with open(store.path(profile_id)) as f:
+        assert "busy_work" in f.read()
+
+
+def test_profile_api_requires_token(tmp_path, monkeypatch):
+    """Test /profiles is 404 when disabled, 403 without the token."""
+    client = TestClient(main.app)
+    assert client.get("/profiles").status_code == 404
+    
+    store = ProfileStore(str(tmp_path))
+    store.save("20260101-000000-request-abcd1234", Counter({"MainThread;main (x.py:1)": 3}))
+    monkeypatch.setattr(main, "PROFILING_TOKEN", "secret")
+    monkeypatch.setattr(main, "profile_store", store)
+    
+    assert client.get("/profiles", headers={"X-Profile": "nope"}).status_code == 403
+    assert client.get("/profiles", headers={"X-Profile": "secret"}).json() == {
+        "profiles": ["20260101-000000-request-abcd1234"]
+    }
+    response = client.get("/profiles/20260101-000000-request-abcd1234", headers={"X-Profile": "secret"})
+    assert response.text == "MainThread;main (x.py:1) 3\n"
+    assert client.get("/profiles/../../etc/passwd", headers={"X-Profile": "secret"}).status_code == 404
@@ -0,0 +1,119 @@
+"""Unit tests for the vector gallery shared between processes."""
+import numpy as np
+import pytest
+import threading
+import time
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import DIM, random_embeddings
+from shared_store import SharedVectorStore
+
+
+def test_changes_are_visible_to_other_stores(index_path):
+    """Test that a store sees changes logged by another store on the same files."""
+    embeddings = random_embeddings(4)
+    writer = SharedVectorStore(embedding_dim=DIM, index_path=index_path)
+    reader = SharedVectorStore(embedding_dim=DIM, index_path=index_path)
+    
+    writer.add_embeddings(np.array([1, 2, 3]), embeddings[:3])
+    assert reader.search(embeddings[1])[0] == (2, pytest.approx(1.0))
+    
+    reader.remove_embedding(2)
+    reader.add_embedding(3, embeddings[3])
+    assert writer.get_ids().tolist() == [1, 3]
+    assert writer.search(embeddings[3])[0] == (3, pytest.approx(1.0))
+
+
+def test_snapshot_publishes_new_generation(index_path):
+    """Test that compaction maps a new generation in every store without losing changes."""
+    embeddings = random_embeddings(30, seed=1)
+    first = SharedVectorStore(embedding_dim=DIM, index_path=index_path)
+    second = SharedVectorStore(embedding_dim=DIM, index_path=index_path)
+    first.add_embeddings(np.arange(1, 21), embeddings[:20])
+    
+    first.snapshot()
+    second.add_embeddings(np.arange(21, 31), embeddings[20:])
+    second.remove_embedding(5)
+    
+    stats = first.get_stats()
+    assert stats["generation"] == 1
+    assert stats["embeddings"] == 29
+    assert stats["log_records"] == 11
+    assert first.search(embeddings[4])[0][0] != 5
+    
+    second.snapshot()
+    assert first.get_stats()["generation"] == 2
+    assert first.get_stats()["log_records"] == 0
+    assert not os.path.exists(index_path + ".gallery.1.log")
+    
+    reopened = SharedVectorStore(embedding_dim=DIM, index_path=index_path)
+    assert reopened.get_total_embeddings() == 29
+    assert reopened.search(embeddings[25])[0] == (26, pytest.approx(1.0))
+
+
+def test_torn_log_record_is_ignored_and_overwritten(index_path):
+    """Test that a partially written record is skipped by readers and dropped by the next writer."""
+    embeddings = random_embeddings(2, seed=2)
+    store = SharedVectorStore(embedding_dim=DIM, index_path=index_path)
+    store.add_embedding(1, embeddings[0])
+    
+    with open(index_path + ".gallery.0.log", 'ab') as f:
+        f.write(b'\x05\x00\x00')
+    
+    reader = SharedVectorStore(embedding_dim=DIM, index_path=index_path)
+    assert reader.get_ids().tolist() == [1]
+    
+    reader.add_embedding(2, embeddings[1])
+    assert store.get_ids().tolist() == [1, 2]
+
+
+def test_rebuild_replaces_gallery(index_path):
+    """Test that a rebuild from stored embeddings replaces the gallery and its log."""
+    embeddings = random_embeddings(3, seed=3)
+    store = SharedVectorStore(embedding_dim=DIM, index_path=index_path, multi_sample=True)
+    store.add_embedding(9, embeddings[0])
+    
+    store.rebuild(np.array([(2 << 8) | 1, 2 << 8, 1 << 8]), embeddings)
+    assert store.get_total_embeddings() == 3
+    assert [user_id for user_id, _ in store.search(embeddings[0], k=5)] == [2, 1]
+    assert store.remove_embedding(2)
+    assert store.get_ids().tolist() == [1 << 8]
+
+
+def test_searches_share_the_lock(index_path):
+    """Test that a search is not blocked by another search holding the view."""
+    store = SharedVectorStore(embedding_dim=DIM, index_path=index_path)
+    store.add_embeddings(np.array([1, 2]), random_embeddings(2))
+    
+    results = []
+    with store._fresh():
+        thread = threading.Thread(target=lambda: results.append(store.search(random_embeddings(1)[0])))
+        thread.start()
+        thread.join(timeout=5)
+    
+    assert results
+
+
+def test_startup_sync_runs_once_for_workers_starting_together(index_path):
+    """Test that workers waiting for another worker's startup sync skip their own."""
+    first = SharedVectorStore(embedding_dim=DIM, index_path=index_path)
+    second = SharedVectorStore(embedding_dim=DIM, index_path=index_path)
+    runs = []
+    thread = threading.Thread(target=lambda: runs.append(second.sync_once(lambda: "second")))
+    
+    def second_worker_starts():
+        # The second worker starts while the first is still checking
+        thread.start()
+        time.sleep(0.2)
+        return "first"
+    
+    assert first.sync_once(second_worker_starts) == "first"
+    thread.join(timeout=5)
+    assert runs == [None]
+    
+    # A worker started later checks again
+    assert second.sync_once(lambda: "restart") == "restart"
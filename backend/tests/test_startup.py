@@ -0,0 +1,114 @@
+"""Unit tests for concurrent startup, readiness reporting and the ONNX graph cache."""
+import threading
+import numpy as np
+import onnx
+import onnxruntime
+from onnx import TensorProto, helper
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from face_embedder import FaceEmbedder
+
+
+def test_background_startup_reports_progress_and_holds_requests(tmp_path, monkeypatch):
+    """Test /health answers while loading and other requests wait for it to finish."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "STUB_MODELS", True)
+    monkeypatch.setattr(main, "BACKGROUND_STARTUP", True)
+    
+    release = threading.Event()
+    load_embedder = main._load_embedder
+    
+    def slow_embedder():
+        release.wait(10)
+        load_embedder()
+    
+    monkeypatch.setattr(main, "_load_embedder", slow_embedder)
+    
+    with TestClient(main.app) as client:
+        health = client.get("/health").json()
+        assert health["status"] == "starting"
+        assert not health["ready"]
+        assert health["components"]["face_embedder"] == "loading"
+        
+        release.set()
+        response = client.post(
+            "/v2/recognize",
+            content=b"image bytes",
+            headers={"Content-Type": "application/octet-stream"}
+        )
+        assert response.status_code == 200
+        
+        health = client.get("/health").json()
+        assert health["status"] == "healthy"
+        assert health["ready"]
+        assert set(health["components"].values()) == {"ready"}
+
+
+def test_failed_component_is_reported(tmp_path, monkeypatch):
+    """Test a component failing in background startup makes requests return 503."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "STUB_MODELS", True)
+    monkeypatch.setattr(main, "BACKGROUND_STARTUP", True)
+    
+    def broken_database():
+        raise RuntimeError("disk full")
+    
+    monkeypatch.setattr(main, "_load_database", broken_database)
+    monkeypatch.setattr(main, "vector_store", None)
+    
+    with TestClient(main.app) as client:
+        response = client.get("/stats")
+        assert response.status_code == 503
+        
+        health = client.get("/health").json()
+        assert health["status"] == "unhealthy"
+        assert health["components"]["database"] == "failed: disk full"
+        assert health["components"]["vector_store"] == "pending"
+
+
+def test_onnx_cache_round_trip(tmp_path, monkeypatch):
+    """Test the optimized graph is saved once, then served from with identical outputs."""
+    graph = helper.make_graph(
+        [helper.make_node("MatMul", ["input", "weight"], ["output"])],
+        "tiny",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 4])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, 2])],
+        [helper.make_tensor("weight", TensorProto.FLOAT, [4, 2], np.arange(8, dtype=np.float32))]
+    )
+    model_file = str(tmp_path / "tiny.onnx")
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8), model_file)
+    
+    # Only the session options are needed, not the InsightFace models
+    embedder = FaceEmbedder.__new__(FaceEmbedder)
+    embedder.intra_op_threads = 1
+    embedder.cache_dir = str(tmp_path / "cache")
+    
+    # Record which file and optimization level each session is created with
+    created = []
+    session_class = onnxruntime.InferenceSession
+    
+    def recording_session(path, sess_options=None, **kwargs):
+        created.append((os.path.dirname(path), sess_options.graph_optimization_level))
+        return session_class(path, sess_options=sess_options, **kwargs)
+    
+    monkeypatch.setattr(onnxruntime, "InferenceSession", recording_session)
+    
+    x = np.ones((1, 4), dtype=np.float32)
+    first = embedder._create_session(model_file).run(None, {"input": x})[0]
+    cached = os.listdir(embedder.cache_dir)
+    assert len(cached) == 1 and cached[0].startswith("tiny-")
+    
+    second = embedder._create_session(model_file).run(None, {"input": x})[0]
+    assert os.listdir(embedder.cache_dir) == cached
+    np.testing.assert_array_equal(first, second)
+    
+    # One throwaway session saved the graph; both serving sessions load it with every optimization
+    levels = onnxruntime.GraphOptimizationLevel
+    extended, full = levels.ORT_ENABLE_EXTENDED, levels.ORT_ENABLE_ALL
+    assert created == [(str(tmp_path), extended), (embedder.cache_dir, full), (embedder.cache_dir, full)]
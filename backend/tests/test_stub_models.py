@@ -0,0 +1,54 @@
+"""Unit tests for the load-testing model stubs."""
+import base64
+import pytest
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from stub_models import StubFaceDetector, StubFaceEmbedder
+
+
+def test_stub_embeddings_are_deterministic_per_image():
+    """Test the same upload always maps to the same unit embedding."""
+    detector = StubFaceDetector()
+    embedder = StubFaceEmbedder()
+    
+    crop, bbox = detector.detect_from_bytes(b"image one")[0]
+    same = embedder.get_embedding(detector.detect_from_base64(base64.b64encode(b"image one").decode())[0][0])
+    other = embedder.get_embedding(detector.detect_from_bytes(b"image two")[0][0])
+    
+    embedding = embedder.get_embedding(crop)
+    assert embedding.shape == (512,)
+    assert float(embedding @ embedding) == pytest.approx(1.0)
+    assert (embedding == same).all()
+    assert float(embedding @ other) < 0.5
+    
+    with pytest.raises(ValueError):
+        detector.detect_from_bytes(b"")
+
+
+def test_app_enrolls_and_recognizes_with_stub_models(tmp_path, monkeypatch):
+    """Test the full API runs on stub models, with data in a temp directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "STUB_MODELS", True)
+    
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/v2/enroll",
+            content=b"face of ada",
+            params={"name": "Ada", "email": "ada@example.com"},
+            headers={"Content-Type": "application/octet-stream"}
+        )
+        assert response.status_code == 200
+        user_id = response.json()["user_id"]
+        
+        response = client.post("/v2/recognize", content=b"face of ada",
+                               headers={"Content-Type": "application/octet-stream"})
+        assert response.json()["recognized"]
+        assert response.json()["match"]["user_id"] == user_id
+        
+        assert client.delete(f"/users/{user_id}").status_code == 200
@@ -0,0 +1,72 @@
+"""Unit tests for the user metadata cache."""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from user_cache import UserCache
+
+
+def make_database(tmp_path, n_users):
+    """Create a database with n_users users."""
+    database = Database(db_path=str(tmp_path / "helloface.db"))
+    for i in range(n_users):
+        database.create_user(name=f"User {i}", email=f"user{i}@example.com")
+    return database
+
+
+def test_warm_cache_serves_lookups_without_database(tmp_path):
+    """Test that warmed users are served from memory and misses are read through."""
+    database = make_database(tmp_path, 3)
+    cache = UserCache(database, max_size=10)
+    assert cache.warm() == 3
+    
+    assert cache.get_user(1).name == "User 0"
+    assert cache.get_user_by_email("user2@example.com").id == 3
+    assert cache.get_user(99) is None
+    assert cache.get_user_by_email("nobody@example.com") is None
+    
+    stats = cache.get_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+
+
+def test_lru_eviction_and_delete(tmp_path):
+    """Test that the least recently used user is evicted and deletes are dropped."""
+    database = make_database(tmp_path, 3)
+    cache = UserCache(database, max_size=2)
+    cache.warm()
+    
+    # Only the two newest users fit
+    assert set(cache.users) == {2, 3}
+    
+    cache.get_user(2)
+    cache.add(database.create_user(name="User 3", email="user3@example.com"))
+    assert set(cache.users) == {2, 4}
+    assert cache.get_stats()["evictions"] == 1
+    
+    # Evicted users are read through from the database
+    assert cache.get_users([1, 2])[1].email == "user0@example.com"
+    
+    cache.remove(2)
+    assert 2 not in cache.users
+    assert cache.get_user_by_email("user1@example.com").id == 2
+
+
+def test_confirmed_email_lookup_drops_users_deleted_elsewhere(tmp_path):
+    """Test that a user deleted through another worker's cache frees their email."""
+    database = make_database(tmp_path, 2)
+    cache = UserCache(database, max_size=10)
+    other_worker = UserCache(database, max_size=10)
+    cache.warm()
+    
+    other_worker.remove(1)
+    database.delete_user(1)
+    
+    # Unconfirmed lookups trust the cache
+    assert cache.get_user_by_email("user0@example.com").id == 1
+    assert cache.get_user_by_email("user0@example.com", confirm=True) is None
+    assert 1 not in cache.users
+    assert cache.get_user_by_email("user1@example.com", confirm=True).id == 2
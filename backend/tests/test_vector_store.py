@@ -0,0 +1,275 @@
+"""Unit tests for the FAISS vector store."""
+import numpy as np
+import pytest
+import sys
+import os
+import threading
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import DIM, random_embeddings
+from vector_store import VectorStore
+
+
+def test_changes_recovered_from_log_without_snapshot(index_path):
+    """Test that adds and removes are replayed from the write-ahead log."""
+    embeddings = random_embeddings(3)
+    store = VectorStore(embedding_dim=DIM, index_path=index_path, snapshot_every=100)
+    for user_id, embedding in enumerate(embeddings, start=1):
+        store.add_embedding(user_id, embedding)
+    store.remove_embedding(2)
+    
+    # No snapshot written yet, everything lives in the log
+    assert not os.path.exists(index_path)
+    
+    reopened = VectorStore(embedding_dim=DIM, index_path=index_path, snapshot_every=100)
+    assert reopened.get_total_embeddings() == 2
+    assert reopened.search(embeddings[2])[0][0] == 3
+    assert reopened.search(embeddings[1])[0][0] != 2
+
+
+def test_snapshot_truncates_log(index_path):
+    """Test that a snapshot plus later log records recover the full state."""
+    embeddings = random_embeddings(5)
+    store = VectorStore(embedding_dim=DIM, index_path=index_path, snapshot_every=100)
+    for user_id, embedding in enumerate(embeddings[:3], start=1):
+        store.add_embedding(user_id, embedding)
+    store.snapshot()
+    assert store.wal.records == 0
+    
+    for user_id, embedding in enumerate(embeddings[3:], start=4):
+        store.add_embedding(user_id, embedding)
+    
+    reopened = VectorStore(embedding_dim=DIM, index_path=index_path, snapshot_every=100)
+    assert reopened.get_total_embeddings() == 5
+    assert reopened.search(embeddings[4])[0][0] == 5
+
+
+def test_torn_log_record_is_discarded(index_path):
+    """Test that a partially written record at the end of the log is ignored."""
+    embeddings = random_embeddings(2)
+    store = VectorStore(embedding_dim=DIM, index_path=index_path, snapshot_every=100)
+    for user_id, embedding in enumerate(embeddings, start=1):
+        store.add_embedding(user_id, embedding)
+    store.wal.close()
+    
+    with open(index_path + ".wal", 'r+b') as f:
+        f.truncate(os.path.getsize(index_path + ".wal") - 5)
+    
+    reopened = VectorStore(embedding_dim=DIM, index_path=index_path, snapshot_every=100)
+    assert reopened.get_total_embeddings() == 1
+    
+    reopened.add_embedding(3, embeddings[1])
+    assert VectorStore(embedding_dim=DIM, index_path=index_path).get_total_embeddings() == 2
+
+
+def test_reenroll_replaces_embedding(index_path):
+    """Test that adding an embedding for an existing user replaces it."""
+    embeddings = random_embeddings(2)
+    store = VectorStore(embedding_dim=DIM, index_path=index_path)
+    store.add_embedding(7, embeddings[0])
+    store.add_embedding(7, embeddings[1])
+    
+    assert store.get_total_embeddings() == 1
+    assert store.search(embeddings[1])[0] == (7, pytest.approx(1.0))
+    assert store.remove_embedding(7)
+    assert not store.remove_embedding(7)
+
+
+def test_legacy_positional_index_is_migrated(index_path):
+    """Test that an IndexFlatIP with a pickled user_id list is converted to ID mapping."""
+    import faiss
+    import pickle
+    
+    embeddings = random_embeddings(3)
+    index = faiss.IndexFlatIP(DIM)
+    index.add(embeddings)
+    faiss.write_index(index, index_path)
+    with open(index_path + "_mapping.pkl", 'wb') as f:
+        pickle.dump([10, 20, 30], f)
+    
+    store = VectorStore(embedding_dim=DIM, index_path=index_path)
+    
+    assert store.search(embeddings[1])[0][0] == 20
+    assert not os.path.exists(index_path + "_mapping.pkl")
+    assert VectorStore(embedding_dim=DIM, index_path=index_path).search(embeddings[2])[0][0] == 30
+
+
+def wait_for_background(store):
+    """Wait for a background snapshot or rebuild to finish."""
+    if store.snapshot_thread is not None:
+        store.snapshot_thread.join()
+
+
+def test_switches_to_ivf_at_threshold(index_path):
+    """Test that a flat gallery is rebuilt as IVF once it reaches the threshold."""
+    embeddings = random_embeddings(300)
+    store = VectorStore(embedding_dim=DIM, index_path=index_path, index_type="ivf_flat",
+                        ann_threshold=200, nlist=4, nprobe=4)
+    for user_id, embedding in enumerate(embeddings[:199], start=1):
+        store.add_embedding(user_id, embedding)
+    wait_for_background(store)
+    assert store.index_kind == "flat"
+    
+    for user_id, embedding in enumerate(embeddings[199:], start=200):
+        store.add_embedding(user_id, embedding)
+    wait_for_background(store)
+    assert store.index_kind == "ivf_flat"
+    assert store.get_total_embeddings() == 300
+    assert store.search(embeddings[250])[0][0] == 251
+    
+    assert store.remove_embedding(251)
+    assert store.search(embeddings[250])[0][0] != 251
+    
+    store.close()
+    reopened = VectorStore(embedding_dim=DIM, index_path=index_path, index_type="ivf_flat", ann_threshold=200)
+    assert reopened.index_kind == "ivf_flat"
+    assert reopened.get_total_embeddings() == 299
+
+
+def test_hnsw_removal_and_reenroll_survive_restart(index_path):
+    """Test that HNSW tombstones and replaced embeddings are honored after reopening."""
+    embeddings = random_embeddings(4)
+    store = VectorStore(embedding_dim=DIM, index_path=index_path, index_type="hnsw", ann_threshold=0)
+    wait_for_background(store)
+    assert store.index_kind == "hnsw"
+    
+    for user_id, embedding in enumerate(embeddings[:3], start=1):
+        store.add_embedding(user_id, embedding)
+    store.remove_embedding(1)
+    store.add_embedding(2, embeddings[3])
+    wait_for_background(store)
+    store.snapshot()
+    
+    reopened = VectorStore(embedding_dim=DIM, index_path=index_path, index_type="hnsw", ann_threshold=0)
+    assert reopened.get_total_embeddings() == 2
+    assert 1 not in [user_id for user_id, _ in reopened.search(embeddings[0], k=3)]
+    assert reopened.search(embeddings[3])[0] == (2, pytest.approx(1.0))
+    
+    # The stale vector of user 2 is scored with the current one
+    for user_id, similarity in reopened.search(embeddings[1], k=2):
+        if user_id == 2:
+            assert similarity == pytest.approx(float(embeddings[1] @ embeddings[3]))
+    
+    # Compaction drops the dead vectors
+    reopened.rebuild()
+    assert reopened.index.ntotal == 2
+    assert reopened.dead == 0
+
+
+def test_benchmark_reports_recall_per_setting(index_path):
+    """Test that the benchmark sweeps the search knob and measures recall."""
+    embeddings = random_embeddings(50)
+    store = VectorStore(embedding_dim=DIM, index_path=index_path, index_type="hnsw", ann_threshold=0)
+    wait_for_background(store)
+    for user_id, embedding in enumerate(embeddings, start=1):
+        store.add_embedding(user_id, embedding)
+    
+    result = store.benchmark(n_queries=10, k=5)
+    
+    assert result["index_type"] == "hnsw"
+    assert [point["efSearch"] for point in result["points"]] == [16, 32, 64, 128, 256]
+    assert all(0.0 <= point["recall_at_5"] <= 1.0 for point in result["points"])
+    assert store.get_stats()["benchmark"] == result
+
+
+def test_benchmark_samples_large_galleries(index_path):
+    """Test that ground truth is computed over a bounded sample of the gallery."""
+    store = VectorStore(embedding_dim=DIM, index_path=index_path)
+    store.add_embeddings(np.arange(1, 101), random_embeddings(100, seed=9))
+    
+    result = store.benchmark(n_queries=10, k=5, noise=0.01, max_vectors=20)
+    
+    assert result["embeddings"] == 100
+    assert result["sampled"] == 20
+    # Only recall@1 can be measured against a sample
+    assert list(result["points"][0]) == ["recall_at_1", "latency_ms"]
+    assert result["points"][0]["recall_at_1"] == 1.0
+
+
+@pytest.mark.parametrize("scoring", ["max", "mean"])
+def test_multi_sample_users_are_scored_per_user(index_path, scoring):
+    """Test that several samples of a user are searched and removed as one user."""
+    a, b, c = random_embeddings(3, seed=3)
+    store = VectorStore(embedding_dim=DIM, index_path=index_path, multi_sample=True, sample_scoring=scoring)
+    store.add_embedding(1, a)
+    store.add_embedding(1, b, slot=1)
+    store.add_embedding(2, c)
+    
+    results = store.search(b, k=2)
+    assert [user_id for user_id, _ in results] == [1, 2] or scoring == "mean"
+    
+    scores = dict(results)
+    expected = 1.0 if scoring == "max" else (1.0 + float(np.dot(a, b))) / 2
+    assert scores[1] == pytest.approx(expected, abs=1e-5)
+    
+    assert store.remove_embedding(1)
+    assert store.get_total_embeddings() == 1
+    
+    reopened = VectorStore(embedding_dim=DIM, index_path=index_path, multi_sample=True)
+    assert [user_id for user_id, _ in reopened.search(b, k=2)] == [2]
+
+
+def test_quantized_index_reranks_with_exact_vectors(index_path):
+    """Test that int8 search results are re-scored with the exact embeddings."""
+    embeddings = random_embeddings(40, seed=5)
+    exact = {user_id: embedding for user_id, embedding in enumerate(embeddings, start=1)}
+    store = VectorStore(embedding_dim=DIM, index_path=index_path, index_type="sq_int8", ann_threshold=0,
+                        rerank=2, exact_vectors=lambda keys: {key: exact[key] for key in keys if key in exact})
+    store.add_embeddings(np.arange(1, 41), embeddings)
+    wait_for_background(store)
+    assert store.index_kind == "sq_int8"
+    
+    for user_id, similarity in store.search(embeddings[7], k=3):
+        assert similarity == pytest.approx(float(embeddings[7] @ exact[user_id]), abs=1e-6)
+    assert store.get_stats()["bytes_per_vector"] == DIM
+    
+    result = store.benchmark(n_queries=10, k=5)
+    assert result["exact_truth"]
+    assert [point["rerank"] for point in result["points"]] == [0, 2]
+    assert store.rerank == 2
+    
+    store.snapshot()
+    reopened = VectorStore(embedding_dim=DIM, index_path=index_path, index_type="sq_int8", ann_threshold=0)
+    assert reopened.index_kind == "sq_int8"
+    assert reopened.search(embeddings[7])[0][0] == 8
+
+
+def test_searches_run_in_parallel(index_path):
+    """Test that concurrent searches hold the lock at the same time."""
+    embeddings = random_embeddings(10, seed=6)
+    both_searching = threading.Barrier(2, timeout=5)
+    
+    def exact_vectors(keys):
+        # Only returns once the other search is inside the lock too
+        both_searching.wait()
+        return {}
+    
+    store = VectorStore(embedding_dim=DIM, index_path=index_path, index_type="sq_fp16", ann_threshold=0,
+                        rerank=1, exact_vectors=exact_vectors)
+    store.add_embeddings(np.arange(1, 11), embeddings)
+    wait_for_background(store)
+    
+    results = []
+    threads = [threading.Thread(target=lambda e=e: results.append(store.search(e)[0][0])) for e in embeddings[:2]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [1, 2]
+
+
+def test_search_does_not_wait_for_log_writes(index_path):
+    """Test that searches proceed while a change is being written to the log."""
+    embeddings = random_embeddings(2, seed=7)
+    store = VectorStore(embedding_dim=DIM, index_path=index_path)
+    store.add_embedding(1, embeddings[0])
+    
+    results = []
+    with store.write_lock:
+        searcher = threading.Thread(target=lambda: results.append(store.search(embeddings[0])))
+        searcher.start()
+        searcher.join(timeout=5)
+    
+    assert results == [[(1, pytest.approx(1.0))]]
@@ -0,0 +1,179 @@
+"""Process-local LRU cache of user metadata for the recognition hot path."""
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Optional
+
+from database import Database
+
+
+class CachedUser:
+    """User metadata without the encrypted embedding."""
+
+    __slots__ = ("id", "name", "email", "enrolled_at")
+
+    def __init__(self, id: int, name: str, email: str, enrolled_at: Optional[datetime] = None):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.enrolled_at = enrolled_at
+
+
+class UserCache:
+    """
+    Read-through cache of id -> user and email -> id in front of the database.
+
+    Entries are evicted least recently used first once max_size users are
+    cached, so misses fall back to the database and are cached on the way.
+    Enroll and delete must go through add() and remove() to keep it consistent.
+
+    Each process has its own cache, so with several workers a user deleted
+    through one worker stays cached in the others; answers that must be
+    exact, like whether an email is taken, pass confirm=True.
+    """
+
+    def __init__(self, database: Database, max_size: int = 100000):
+        """
+        Initialize cache.
+
+        Args:
+            database: Database to read users from on a miss
+            max_size: Maximum number of cached users
+        """
+        self.database = database
+        self.max_size = max_size
+
+        self.lock = Lock()
+        self.users: "OrderedDict[int, CachedUser]" = OrderedDict()
+        self.ids_by_email: Dict[str, int] = {}
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def warm(self) -> int:
+        """
+        Load the most recently enrolled users, up to max_size.
+
+        Returns:
+            Number of users loaded
+        """
+        rows = self.database.get_user_summaries(limit=self.max_size)
+
+        # Oldest first, so the newest users end up most recently used
+        for row in reversed(rows):
+            self.add(CachedUser(*row))
+        return len(rows)
+
+    def get_user(self, user_id: int) -> Optional[CachedUser]:
+        """Get user by ID."""
+        with self.lock:
+            user = self.users.get(user_id)
+            if user is not None:
+                self.users.move_to_end(user_id)
+                self.hits += 1
+                return user
+            self.misses += 1
+
+        user = self.database.get_user(user_id)
+        if user is None:
+            return None
+        return self.add(user)
+
+    def get_users(self, user_ids: List[int]) -> Dict[int, CachedUser]:
+        """Get several users by ID, fetching all misses with one query."""
+        found = {}
+        missing = []
+        with self.lock:
+            for user_id in user_ids:
+                user = self.users.get(user_id)
+                if user is None:
+                    missing.append(user_id)
+                    continue
+                self.users.move_to_end(user_id)
+                found[user_id] = user
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            for user_id, user in self.database.get_users_by_ids(missing).items():
+                found[user_id] = self.add(user)
+        return found
+
+    def get_user_by_email(self, email: str, confirm: bool = False) -> Optional[CachedUser]:
+        """
+        Get user by email.
+
+        Args:
+            email: Email to look up
+            confirm: Check a cached user against the database, dropping it if
+                another process deleted it
+
+        Returns:
+            The user, or None if no user has this email
+        """
+        with self.lock:
+            user_id = self.ids_by_email.get(email)
+            if user_id is not None:
+                self.users.move_to_end(user_id)
+                self.hits += 1
+                user = self.users[user_id]
+                if not confirm:
+                    return user
+            else:
+                self.misses += 1
+
+        if user_id is not None:
+            if self.database.get_user(user_id) is not None:
+                return user
+            self.remove(user_id)
+
+        user = self.database.get_user_by_email(email)
+        if user is None:
+            return None
+        return self.add(user)
+
+    def add(self, user) -> CachedUser:
+        """
+        Cache a user (a database User or CachedUser), evicting the least recently used.
+
+        Returns:
+            The cached entry
+        """
+        entry = CachedUser(user.id, user.name, user.email, user.enrolled_at)
+
+        with self.lock:
+            previous = self.users.pop(entry.id, None)
+            if previous is not None:
+                self.ids_by_email.pop(previous.email, None)
+
+            self.users[entry.id] = entry
+            self.ids_by_email[entry.email] = entry.id
+
+            while len(self.users) > self.max_size:
+                _, evicted = self.users.popitem(last=False)
+                self.ids_by_email.pop(evicted.email, None)
+                self.evictions += 1
+
+        return entry
+
+    def remove(self, user_id: int) -> None:
+        """Drop a deleted user from the cache."""
+        with self.lock:
+            user = self.users.pop(user_id, None)
+            if user is not None:
+                self.ids_by_email.pop(user.email, None)
+
+    def get_stats(self) -> dict:
+        """Get size and hit/miss statistics."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.users),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -1,60 +1,374 @@
 """Vector storage and similarity search using FAISS."""
-import faiss
+from __future__ import annotations
+
 import numpy as np
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
 import os
+import json
+import math
 import pickle
-from threading import Lock
+import time
+from threading import Lock, Thread
+
+from wal import WriteAheadLog, OP_ADD, OP_REMOVE
+from rwlock import ReadWriteLock
+from templates import MAX_SAMPLE_SLOTS, SAMPLE_KEY_BITS, SAMPLE_SCORINGS, SAMPLE_FETCH_FACTOR, sample_key
+
+try:
+    import faiss
+except ImportError:
+    # Optional with VECTOR_BACKEND=numpy
+    faiss = None
+
+
+# Supported index types:
+#   "flat"     - exact brute-force inner product search
+#   "hnsw"     - HNSW graph over full vectors (fast, memory heavy, no in-place deletes)
+#   "ivf_flat" - inverted lists over full vectors (needs training)
+#   "ivf_pq"   - inverted lists over product-quantized vectors (needs training, compact)
+#   "sq_fp16"  - exhaustive search over float16 vectors (half the memory)
+#   "sq_int8"  - exhaustive search over 8-bit scalar-quantized vectors (a quarter, needs training)
+#   "pq"       - exhaustive search over product-quantized vectors (pq_m bytes each, needs training)
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq_fp16", "sq_int8", "pq")
+
+# Embeddings the benchmark's exact ground truth is computed over; larger
+# galleries are sampled so it never exports or decrypts the whole gallery
+BENCHMARK_MAX_VECTORS = 20000
+
+# Index types storing approximate vectors, whose results can be re-ranked
+QUANTIZED_TYPES = ("ivf_pq", "sq_fp16", "sq_int8", "pq")
+
+# faiss.ScalarQuantizer code types
+SCALAR_QUANTIZERS = {
+    "sq_fp16": "QT_fp16",
+    "sq_int8": "QT_8bit"
+}
+
+# FAISS k-means wants at least this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+# HNSW indexes are rebuilt once this fraction of their vectors is dead
+HNSW_COMPACT_RATIO = 0.1
 
 
 class VectorStore:
     """FAISS-based vector store for face embeddings."""
     
-    def __init__(self, embedding_dim: int = 512, index_path: str = "data/faiss_index"):
+    def __init__(self, embedding_dim: int = 512, index_path: str = "data/faiss_index",
+                 snapshot_every: int = 1000, wal_fsync: bool = False,
+                 index_type: str = "flat", ann_threshold: int = 100000,
+                 hnsw_m: int = 32, ef_construction: int = 80, ef_search: int = 64,
+                 nlist: int = 0, nprobe: int = 16, pq_m: int = 64,
+                 multi_sample: bool = False, sample_scoring: str = "max",
+                 rerank: int = 0, exact_vectors: Optional[Callable[[List[int]], Dict[int, np.ndarray]]] = None):
         """
         Initialize FAISS vector store.
         
+        Changes are appended to a write-ahead log; a full snapshot of the index
+        is written in the background every snapshot_every changes.
+        
+        With multi_sample, each user can have up to MAX_SAMPLE_SLOTS vectors
+        (sample slots 0, 1, ...) and searches score users by their samples.
+        
+        Galleries start on an exact flat index. Once they reach ann_threshold
+        embeddings (and enough to train IVF centroids), the index is rebuilt
+        in the background as index_type.
+        
+        Quantized indexes (sq_*, pq, ivf_pq) can re-rank their candidates
+        against the exact embeddings returned by exact_vectors.
+        
         Args:
             embedding_dim: Dimension of embeddings (512 for ArcFace)
             index_path: Path to save/load FAISS index
+            snapshot_every: Logged changes between background snapshots
+            wal_fsync: fsync the log after every change (survives OS crashes)
+            index_type: Index used for large galleries (one of INDEX_TYPES)
+            ann_threshold: Gallery size at which the flat index is replaced by index_type
+            hnsw_m: HNSW graph neighbors per node
+            ef_construction: HNSW candidate list size while building
+            ef_search: HNSW candidate list size while searching (recall vs latency)
+            nlist: IVF inverted lists (0 = 4 * sqrt(gallery size))
+            nprobe: IVF lists visited per search (recall vs latency)
+            pq_m: IVF-PQ sub-quantizers (bytes per vector, must divide embedding_dim)
+            multi_sample: Index every sample of a user instead of one vector per user
+            sample_scoring: Per-user score over samples (one of SAMPLE_SCORINGS)
+            rerank: Candidates fetched per requested result and re-scored
+                with exact embeddings (0 = no re-ranking)
+            exact_vectors: Loads exact embeddings by index ID (e.g. from the database)
         """
+        if faiss is None:
+            raise ImportError("faiss-cpu is not installed, use VECTOR_BACKEND=numpy instead")
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+        if sample_scoring not in SAMPLE_SCORINGS:
+            raise ValueError(f"Unknown sample scoring '{sample_scoring}', expected one of {SAMPLE_SCORINGS}")
+        
         self.embedding_dim = embedding_dim
         self.index_path = index_path
-        self.mapping_path = index_path + "_mapping.pkl"
+        self.meta_path = index_path + "_meta.json"
+        self.legacy_mapping_path = index_path + "_mapping.pkl"
+        self.wal_path = index_path + ".wal"
+        self.snapshot_every = snapshot_every
+        self.wal_fsync = wal_fsync
+        
+        # ANN settings
+        self.index_type = index_type
+        self.ann_threshold = ann_threshold
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        
+        # Sample gallery settings
+        self.multi_sample = multi_sample
+        self.sample_scoring = sample_scoring
         
-        # Thread safety
-        self.lock = Lock()
+        # Re-ranking of quantized search results
+        self.rerank = rerank
+        self.exact_vectors = exact_vectors
         
-        # Create index (IndexFlatIP for cosine similarity with normalized vectors)
-        self.index = faiss.IndexFlatIP(embedding_dim)
+        # Thread safety: searches share the read lock and run in parallel; the
+        # write lock is only taken to change the in-memory index. write_lock
+        # keeps changes in log order without blocking searches during log writes.
+        self.lock = ReadWriteLock()
+        self.write_lock = Lock()
+        self.snapshot_lock = Lock()
+        self.snapshot_thread: Optional[Thread] = None
         
-        # Mapping from FAISS index position to user_id
-        self.id_mapping = []  # List where index = FAISS position, value = user_id
+        # HNSW graphs cannot delete vectors: removed users are tombstoned, and
+        # re-enrolled users keep their stale vectors until the next rebuild
+        self.tombstones = set()
+        self.superseded = set()
+        self.dead = 0
+        
+        # Changes made while a rebuild runs, replayed onto the new index
+        self.pending: Optional[list] = None
+        
+        # Last recall/latency measurement
+        self.last_benchmark: Optional[dict] = None
+        
+        # Start with an exact index keyed by user_id
+        self.index_kind = "flat"
+        self.index = self._create_index("flat")
         
         # Load existing index if available
         self._load_index()
     
-    def add_embedding(self, user_id: int, embedding: np.ndarray) -> None:
+    def _create_index(self, index_type: str, n_vectors: int = 0) -> faiss.Index:
         """
-        Add a face embedding to the index.
+        Create an empty index keyed by user_id.
+        
+        Args:
+            index_type: One of INDEX_TYPES
+            n_vectors: Expected gallery size (sets the IVF list count)
+        
+        Returns:
+            FAISS index; IVF indexes still need training
+        """
+        if index_type == "flat":
+            # IndexFlatIP for cosine similarity with normalized vectors,
+            # wrapped in IndexIDMap2 so FAISS IDs are user_ids
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.embedding_dim))
+        elif index_type == "hnsw":
+            hnsw = faiss.IndexHNSWFlat(self.embedding_dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            hnsw.hnsw.efConstruction = self.ef_construction
+            index = faiss.IndexIDMap2(hnsw)
+        elif index_type in SCALAR_QUANTIZERS:
+            index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(
+                self.embedding_dim, getattr(faiss.ScalarQuantizer, SCALAR_QUANTIZERS[index_type]),
+                faiss.METRIC_INNER_PRODUCT
+            ))
+        elif index_type == "pq":
+            index = faiss.IndexIDMap2(faiss.IndexPQ(self.embedding_dim, self.pq_m, 8, faiss.METRIC_INNER_PRODUCT))
+        else:
+            nlist = self._nlist(n_vectors)
+            encoding = "Flat" if index_type == "ivf_flat" else f"PQ{self.pq_m}"
+            index = faiss.index_factory(self.embedding_dim, f"IVF{nlist},{encoding}", faiss.METRIC_INNER_PRODUCT)
+            # IVF indexes take user_ids natively; the hash table direct map
+            # supports reconstruct() and cheap remove_ids() by ID
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        
+        self._apply_search_params(index, index_type)
+        return index
+    
+    def _apply_search_params(self, index: faiss.Index, index_type: str) -> None:
+        """Set the configured efSearch / nprobe on an index."""
+        param, value = self._search_param(index, index_type)
+        if param is not None:
+            faiss.ParameterSpace().set_index_parameter(index, param, value)
+    
+    def _search_param(self, index: faiss.Index, index_type: str) -> Tuple[Optional[str], Optional[int]]:
+        """Name and configured value of the recall/latency knob of an index type."""
+        if index_type == "hnsw":
+            return "efSearch", self.ef_search
+        if index_type in ("ivf_flat", "ivf_pq"):
+            return "nprobe", min(self.nprobe, index.nlist)
+        return None, None
+    
+    def _nlist(self, n_vectors: int) -> int:
+        """Number of IVF lists for a gallery size."""
+        return self.nlist or max(1, int(4 * math.sqrt(n_vectors)))
+    
+    def _min_training_size(self, index_type: str, n_vectors: int) -> int:
+        """Vectors needed to train an index type for a gallery size."""
+        if index_type == "ivf_flat":
+            return MIN_POINTS_PER_CENTROID * self._nlist(n_vectors)
+        if index_type == "ivf_pq":
+            # Each sub-quantizer has 256 centroids (8-bit codes)
+            return MIN_POINTS_PER_CENTROID * max(self._nlist(n_vectors), 256)
+        if index_type == "pq":
+            return MIN_POINTS_PER_CENTROID * 256
+        if index_type == "sq_int8":
+            # Per-dimension value ranges
+            return 1
+        return 0
+    
+    def _target_type(self, n_vectors: Optional[int] = None) -> str:
+        """Index type a gallery of n_vectors (default: current size) should use."""
+        if self.index_kind == self.index_type:
+            # Don't switch back to flat when a large gallery shrinks
+            return self.index_type
+        
+        if n_vectors is None:
+            n_vectors = self.get_total_embeddings()
+        if self.index_type != "flat" and n_vectors >= max(
+                self.ann_threshold, self._min_training_size(self.index_type, n_vectors)):
+            return self.index_type
+        return "flat"
+    
+    def _needs_rebuild(self) -> bool:
+        """Check for a pending index type switch or HNSW compaction."""
+        if self._target_type() != self.index_kind:
+            return True
+        return self.index_kind == "hnsw" and self.dead > HNSW_COMPACT_RATIO * self.index.ntotal
+    
+    def add_embedding(self, user_id: int, embedding: np.ndarray, slot: int = 0) -> None:
+        """
+        Add a face embedding to the index, replacing any existing one for the user.
         
         Args:
             user_id: User ID to associate with embedding
             embedding: Face embedding vector (512-dim, L2 normalized)
+            slot: Sample slot of the user (multi_sample only)
         """
-        with self.lock:
-            # Ensure embedding is 2D array for FAISS
-            if embedding.ndim == 1:
-                embedding = embedding.reshape(1, -1)
-            
-            # Add to FAISS index
-            self.index.add(embedding.astype('float32'))
-            
-            # Add to mapping
-            self.id_mapping.append(user_id)
-            
-            # Save to disk
-            self._save_index()
+        user_id = sample_key(user_id, slot) if self.multi_sample else user_id
+        
+        # Ensure embedding is 2D array for FAISS
+        if embedding.ndim == 1:
+            embedding = embedding.reshape(1, -1)
+        
+        with self.write_lock:
+            # Log before applying so the change survives a crash
+            self.wal.append_add(user_id, embedding)
+            with self.lock.write():
+                self._upsert(user_id, embedding.astype('float32'))
+        
+        self._maybe_snapshot()
+    
+    def add_embeddings(self, user_ids: np.ndarray, embeddings: np.ndarray, snapshot: bool = False,
+                       slots: Optional[np.ndarray] = None) -> None:
+        """
+        Add several face embeddings with one log write and one index insertion.
+        
+        Args:
+            user_ids: User IDs (unique)
+            embeddings: Matrix of shape (n, embedding_dim), L2 normalized
+            snapshot: Write a snapshot now (bulk imports) instead of once
+                snapshot_every changes are logged
+            slots: Sample slot per user (multi_sample only, default 0)
+        """
+        if not len(user_ids):
+            return
+        
+        user_ids = np.asarray(user_ids, dtype='int64')
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        if self.multi_sample:
+            user_ids = (user_ids << SAMPLE_KEY_BITS) | (0 if slots is None else np.asarray(slots, dtype='int64'))
+        
+        with self.write_lock:
+            self.wal.append_adds(user_ids, embeddings)
+            with self.lock.write():
+                self._upsert_many(user_ids, embeddings)
+        
+        if snapshot and not self._needs_rebuild():
+            self.snapshot()
+        else:
+            self._maybe_snapshot()
+    
+    def _upsert_many(self, user_ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """Add or replace several users' embeddings (lock must be held)."""
+        if self.index_kind == "hnsw":
+            for user_id, embedding in zip(user_ids, embeddings):
+                self._upsert(int(user_id), embedding.reshape(1, -1))
+            return
+        
+        self.index.remove_ids(user_ids)
+        self.index.add_with_ids(embeddings, user_ids)
+        
+        if self.pending is not None:
+            self.pending.extend((OP_ADD, int(user_id), embedding.reshape(1, -1))
+                                for user_id, embedding in zip(user_ids, embeddings))
+    
+    def _upsert(self, user_id: int, embedding: np.ndarray) -> None:
+        """Add a user's embedding to the index, replacing an existing one (lock must be held)."""
+        if self.index_kind == "hnsw":
+            # The previous vector stays in the graph; searches re-score the user
+            if user_id in self.tombstones:
+                self.tombstones.discard(user_id)
+                self.superseded.add(user_id)
+            elif self._contains(user_id):
+                self.superseded.add(user_id)
+                self.dead += 1
+        elif self._contains(user_id):
+            self.index.remove_ids(np.array([user_id], dtype='int64'))
+        
+        self.index.add_with_ids(embedding, np.array([user_id], dtype='int64'))
+        
+        if self.pending is not None:
+            self.pending.append((OP_ADD, user_id, embedding))
+    
+    def _remove(self, user_id: int) -> None:
+        """Remove a user's embedding from the index (lock must be held)."""
+        if not self._contains(user_id):
+            return
+        
+        if self.index_kind == "hnsw":
+            self.tombstones.add(user_id)
+            self.superseded.discard(user_id)
+            self.dead += 1
+        else:
+            self.index.remove_ids(np.array([user_id], dtype='int64'))
+        
+        if self.pending is not None:
+            self.pending.append((OP_REMOVE, user_id, None))
+    
+    def _user_keys(self, user_id: int) -> List[int]:
+        """Index IDs holding a user's vectors (lock must be held)."""
+        if not self.multi_sample:
+            return [user_id] if self._contains(user_id) else []
+        
+        # Sample slots are assigned from 0 without gaps
+        keys = []
+        for slot in range(MAX_SAMPLE_SLOTS):
+            key = sample_key(user_id, slot)
+            if not self._contains(key):
+                break
+            keys.append(key)
+        return keys
+    
+    def _contains(self, user_id: int) -> bool:
+        """Check whether a user has an embedding (lock must be held)."""
+        if user_id in self.tombstones:
+            return False
+        
+        # IndexIDMap2 and the IVF direct map resolve reconstruct() through an id hash map
+        try:
+            self.index.reconstruct(user_id)
+            return True
+        except RuntimeError:
+            return False
     
     def search(self, query_embedding: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
         """
@@ -63,112 +377,557 @@ class VectorStore:
         Args:
             query_embedding: Query face embedding
             k: Number of nearest neighbors to return
-            
+        
         Returns:
             List of tuples (user_id, similarity_score)
         """
-        with self.lock:
-            if self.index.ntotal == 0:
-                return []
+        # Ensure query is 2D array
+        if query_embedding.ndim == 1:
+            query_embedding = query_embedding.reshape(1, -1)
+        
+        return self.search_batch(query_embedding, k)[0]
+    
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 1) -> List[List[Tuple[int, float]]]:
+        """
+        Search for most similar embeddings of several queries in one FAISS call.
+        
+        Args:
+            query_embeddings: Query matrix of shape (n_queries, embedding_dim)
+            k: Number of nearest neighbors to return per query
+        
+        Returns:
+            One list of tuples (user_id, similarity_score) per query; with
+            multi_sample, one entry per user scored by sample_scoring
+        """
+        with self.lock.read():
+            return self._search(query_embeddings.astype('float32'), k)
+    
+    def _search(self, query_embeddings: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """Search the index (read lock must be held)."""
+        k = min(k, self.get_total_embeddings())
+        if k <= 0:
+            return [[] for _ in range(len(query_embeddings))]
+        
+        rerank = self._reranking()
+        fetch = k * SAMPLE_FETCH_FACTOR if self.multi_sample else k
+        if rerank:
+            fetch *= self.rerank
+        
+        while True:
+            # Search (returns distances and indices)
+            # For inner product with normalized vectors, distance = cosine similarity
+            distances, indices = self.index.search(query_embeddings, min(fetch, self.index.ntotal))
+            if rerank:
+                self._rerank(query_embeddings, distances, indices)
             
-            # Ensure query is 2D array
-            if query_embedding.ndim == 1:
-                query_embedding = query_embedding.reshape(1, -1)
+            results = [
+                self._collect(query, query_distances, query_ids, k)
+                for query, query_distances, query_ids in zip(query_embeddings, distances, indices)
+            ]
             
-            # Search (returns distances and indices)
-            # For IndexFlatIP with normalized vectors, distance = cosine similarity
-            distances, indices = self.index.search(query_embedding.astype('float32'), min(k, self.index.ntotal))
+            if (not self.dead and not self.multi_sample) or fetch >= self.index.ntotal \
+                    or all(len(r) == k for r in results):
+                return results
+            
+            # Dead HNSW vectors or other samples of the same users crowded out users, search deeper
+            fetch *= 2
+    
+    def _reranking(self) -> bool:
+        """Check whether search results are re-ranked with exact embeddings."""
+        return bool(self.rerank) and self.exact_vectors is not None and self.index_kind in QUANTIZED_TYPES
+    
+    def _rerank(self, queries: np.ndarray, distances: np.ndarray, indices: np.ndarray) -> None:
+        """Re-score search results in place with exact embeddings and re-sort each query's hits."""
+        exact = self.exact_vectors(np.unique(indices[indices >= 0]).tolist())
+        
+        for row, (query, keys) in enumerate(zip(queries, indices)):
+            for col, key in enumerate(keys):
+                vector = exact.get(int(key))
+                if vector is not None:
+                    distances[row, col] = np.dot(query, vector)
             
-            # Convert to list of (user_id, similarity)
-            results = []
-            for dist, idx in zip(distances[0], indices[0]):
-                if idx != -1:  # Valid result
-                    user_id = self.id_mapping[idx]
-                    similarity = float(dist)  # Already cosine similarity
-                    results.append((user_id, similarity))
+            order = np.argsort(-distances[row], kind='stable')
+            distances[row], indices[row] = distances[row, order], indices[row, order]
+    
+    def _collect(self, query: np.ndarray, distances: np.ndarray, ids: np.ndarray,
+                 k: int) -> List[Tuple[int, float]]:
+        """Convert one query's FAISS results to (user_id, similarity), skipping dead entries."""
+        similarities = {}
+        seen = set()
+        for dist, key in zip(distances, ids):
+            key = int(key)
+            if key == -1 or key in self.tombstones or key in seen:
+                continue
+            seen.add(key)
             
-            return results
+            similarity = float(dist)  # Already cosine similarity
+            if key in self.superseded:
+                # The hit may be a stale vector, score the user's current one
+                similarity = float(np.dot(query, self.index.reconstruct(key)))
+            
+            # Hits come best first, so a user's first sample is its best one
+            user_id = key >> SAMPLE_KEY_BITS if self.multi_sample else key
+            if user_id not in similarities or similarity > similarities[user_id]:
+                similarities[user_id] = similarity
+        
+        if self.multi_sample and self.sample_scoring == "mean":
+            for user_id in similarities:
+                samples = self.index.reconstruct_batch(np.array(self._user_keys(user_id), dtype='int64'))
+                similarities[user_id] = float(np.mean(samples @ query))
+        elif not self.superseded:
+            return list(similarities.items())[:k]
+        
+        return sorted(similarities.items(), key=lambda r: r[1], reverse=True)[:k]
     
     def remove_embedding(self, user_id: int) -> bool:
         """
-        Remove embedding by user_id.
-        
-        Note: FAISS doesn't support efficient deletion, so we rebuild the index.
+        Remove embedding (every sample with multi_sample) by user_id.
         
         Args:
             user_id: User ID to remove
-            
+        
         Returns:
             True if removed, False if not found
         """
-        with self.lock:
-            # Find all positions with this user_id
-            positions_to_remove = [i for i, uid in enumerate(self.id_mapping) if uid == user_id]
-            
-            if not positions_to_remove:
+        with self.write_lock:
+            keys = self._user_keys(user_id)
+            if not keys:
                 return False
             
-            # Get all embeddings except the ones to remove
-            all_embeddings = []
-            new_mapping = []
-            
-            for i in range(self.index.ntotal):
-                if i not in positions_to_remove:
-                    # Reconstruct embedding from index
-                    embedding = self.index.reconstruct(i)
-                    all_embeddings.append(embedding)
-                    new_mapping.append(self.id_mapping[i])
+            for key in keys:
+                self.wal.append_remove(key)
+            with self.lock.write():
+                for key in keys:
+                    self._remove(key)
+        
+        self._maybe_snapshot()
+        return True
+    
+    def get_total_embeddings(self) -> int:
+        """Get total number of embeddings in the index."""
+        return self.index.ntotal - self.dead
+    
+    def _maybe_snapshot(self) -> None:
+        """Start a background snapshot once enough changes are logged, or a rebuild when due."""
+        rebuild = self._needs_rebuild()
+        if self.wal.records < self.snapshot_every and not rebuild:
+            return
+        if self.snapshot_thread is not None and self.snapshot_thread.is_alive():
+            return
+        
+        target = self.rebuild if rebuild else self.snapshot
+        self.snapshot_thread = Thread(target=target, name="vector-snapshot", daemon=True)
+        self.snapshot_thread.start()
+    
+    def rebuild(self, user_ids: Optional[np.ndarray] = None, embeddings: Optional[np.ndarray] = None) -> None:
+        """
+        Rebuild the index as the type the gallery should use, then snapshot it.
+        
+        Switches between flat and the configured ANN index and compacts dead
+        HNSW vectors. Training and insertion run without the locks, searches
+        use the old index meanwhile; changes made during the build are applied
+        to the new index before it replaces the old one.
+        
+        Args:
+            user_ids: Replace the whole gallery with these users (default: keep the current one)
+            embeddings: Embeddings of user_ids, shape (n, embedding_dim)
+        """
+        with self.snapshot_lock:
+            with self.write_lock, self.lock.read():
+                if user_ids is None:
+                    ids, vectors = self._export()
+                else:
+                    ids = np.asarray(user_ids, dtype='int64')
+                    vectors = np.ascontiguousarray(embeddings, dtype='float32')
+                index_type = self._target_type(len(ids))
+                self.pending = []
             
-            # Rebuild index
-            self.index = faiss.IndexFlatIP(self.embedding_dim)
-            self.id_mapping = []
+            try:
+                start = time.perf_counter()
+                index = self._create_index(index_type, len(ids))
+                if not index.is_trained:
+                    index.train(vectors)
+                if len(ids):
+                    index.add_with_ids(vectors, ids)
+            except Exception:
+                with self.write_lock:
+                    self.pending = None
+                raise
             
-            if all_embeddings:
-                embeddings_array = np.array(all_embeddings).astype('float32')
-                self.index.add(embeddings_array)
-                self.id_mapping = new_mapping
+            with self.write_lock, self.lock.write():
+                pending, self.pending = self.pending, None
+                self.index = index
+                self.index_kind = index_type
+                self.tombstones, self.superseded, self.dead = set(), set(), 0
+                
+                for op, user_id, vector in pending:
+                    if op == OP_ADD:
+                        self._upsert(user_id, vector)
+                    else:
+                        self._remove(user_id)
             
-            # Save to disk
-            self._save_index()
+            print(f"Rebuilt vector index as {index_type} with {len(ids)} embeddings "
+                  f"in {time.perf_counter() - start:.1f}s")
+        
+        self.snapshot()
+    
+    def get_ids(self) -> np.ndarray:
+        """Get the user IDs that have an embedding (sample keys with multi_sample)."""
+        with self.lock.read():
+            return self._ids()
+    
+    def _export(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Copy out the current embedding of every user (lock must be held).
+        
+        Returns:
+            Tuple of (user_ids, vectors); IVF-PQ vectors are decoded approximations
+        """
+        ids = self._ids()
+        if not len(ids):
+            return ids, np.zeros((0, self.embedding_dim), dtype='float32')
+        return ids, self.index.reconstruct_batch(ids)
+    
+    def _ids(self) -> np.ndarray:
+        """User IDs in the index, excluding tombstones (lock must be held)."""
+        if self.index_kind in ("ivf_flat", "ivf_pq"):
+            invlists = self.index.invlists
+            ids = np.concatenate([np.zeros(0, dtype='int64')] + [
+                faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+                for list_no in range(self.index.nlist)
+            ])
+        else:
+            ids = np.unique(faiss.vector_to_array(self.index.id_map))
+            if self.tombstones:
+                ids = ids[~np.isin(ids, np.fromiter(self.tombstones, dtype='int64'))]
+        return ids
+    
+    def benchmark(self, n_queries: int = 100, k: int = 10, noise: float = 0.5,
+                  max_vectors: int = BENCHMARK_MAX_VECTORS) -> dict:
+        """
+        Measure recall and latency of the current index at several search settings.
+        
+        Queries are enrolled embeddings with random noise added (a new capture
+        of an enrolled face). Recall is measured against exact search over the
+        exact embeddings (from exact_vectors, else as stored in the index), so
+        it includes the loss from quantization. Quantized indexes are measured
+        with and without re-ranking.
+        
+        Larger galleries are sampled: queries and ground truth come from
+        max_vectors random embeddings, and only recall@1 is measured, since a
+        query's nearest neighbour is the sampled embedding it was made from.
+        Searches are only blocked while one setting is measured, not for the
+        whole sweep.
+        
+        Args:
+            n_queries: Number of queries per setting
+            k: Neighbors compared for recall@k
+            noise: Norm of the noise added to each query
+            max_vectors: Embeddings the ground truth is computed over
+        
+        Returns:
+            Dict with the index type and one recall/latency point per setting
+        """
+        rng = np.random.default_rng(0)
+        with self.lock.read():
+            ids = self._ids()
+            total = len(ids)
+            if total > max_vectors:
+                ids = np.sort(rng.choice(ids, max_vectors, replace=False))
+            vectors = self.index.reconstruct_batch(ids) if len(ids) else None
+            index_kind = self.index_kind
+            result = {
+                "index_type": index_kind,
+                "embeddings": total,
+                "sampled": len(ids),
+                "bytes_per_vector": self._bytes_per_vector(),
+                "exact_truth": self.exact_vectors is not None,
+                "points": []
+            }
+            param, configured = self._search_param(self.index, index_kind)
+            nlist = getattr(self.index, "nlist", 0)
+            reranks = [0, self.rerank] if self._reranking() else [self.rerank]
+        
+        if not len(ids):
+            self.last_benchmark = result
+            return result
+        
+        if self.exact_vectors is not None:
+            exact = self.exact_vectors(ids.tolist())
+            vectors = np.stack([exact.get(int(key), vector) for key, vector in zip(ids, vectors)])
+        
+        queries = vectors[rng.choice(len(ids), min(n_queries, len(ids)), replace=False)]
+        queries = queries + rng.standard_normal(queries.shape).astype('float32') * noise / math.sqrt(self.embedding_dim)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        
+        # Deeper neighbours of a sample are not the gallery's, so sampled runs measure recall@1 only
+        k = min(k, len(ids)) if len(ids) == total else 1
+        _, truth = faiss.knn(queries, vectors, k, metric=faiss.METRIC_INNER_PRODUCT)
+        truth = ids[truth] >> SAMPLE_KEY_BITS if self.multi_sample else ids[truth]
+        
+        if param == "efSearch":
+            values = sorted({16, 32, 64, 128, 256, configured})
+        elif param == "nprobe":
+            values = sorted({min(2 ** i, nlist) for i in range(12)} | {configured})
+        else:
+            values = [None]
+        
+        for value, rerank in ((value, rerank) for value in values for rerank in reranks):
+            # Exclusive: the search settings are changed while measuring
+            with self.lock.write():
+                if self.index_kind != index_kind:
+                    # The index was rebuilt as another type meanwhile
+                    result["interrupted"] = True
+                    break
+                
+                configured_rerank = self.rerank
+                try:
+                    if param is not None:
+                        faiss.ParameterSpace().set_index_parameter(self.index, param, value)
+                    self.rerank = rerank
+                    
+                    hits_at_1 = hits_at_k = 0
+                    start = time.perf_counter()
+                    for query, expected in zip(queries, truth):
+                        found = [user_id for user_id, _ in self._search(query.reshape(1, -1), k)[0]]
+                        hits_at_1 += bool(found) and found[0] == expected[0]
+                        hits_at_k += len(set(found) & set(expected.tolist()))
+                    elapsed = time.perf_counter() - start
+                finally:
+                    self.rerank = configured_rerank
+                    self._apply_search_params(self.index, self.index_kind)
             
-            return True
+            point = {param: value} if param is not None else {}
+            if len(reranks) > 1:
+                point["rerank"] = rerank
+            point.update({
+                "recall_at_1": hits_at_1 / len(queries),
+                f"recall_at_{k}": hits_at_k / (len(queries) * k),
+                "latency_ms": elapsed / len(queries) * 1000
+            })
+            result["points"].append(point)
+        
+        self.last_benchmark = result
+        return result
     
-    def get_total_embeddings(self) -> int:
-        """Get total number of embeddings in the index."""
-        return self.index.ntotal
+    def _bytes_per_vector(self) -> int:
+        """Memory used per stored vector (codes only, without IDs or graph links)."""
+        index = self.index
+        if isinstance(index, faiss.IndexIDMap2):
+            index = faiss.downcast_index(index.index)
+        if isinstance(index, faiss.IndexHNSW):
+            index = faiss.downcast_index(index.storage)
+        return int(index.code_size)
     
-    def _save_index(self) -> None:
-        """Save FAISS index and mapping to disk."""
+    def get_stats(self) -> dict:
+        """Get index type, size and search settings, with the last benchmark."""
+        param, value = self._search_param(self.index, self.index_kind)
+        stats = {
+            "index_type": self.index_kind,
+            "configured_index_type": self.index_type,
+            "ann_threshold": self.ann_threshold,
+            "embeddings": self.get_total_embeddings(),
+            "dead_vectors": self.dead,
+            "bytes_per_vector": self._bytes_per_vector(),
+            "rerank": self.rerank if self._reranking() else 0,
+            "multi_sample": self.multi_sample
+        }
+        if self.multi_sample:
+            stats["sample_scoring"] = self.sample_scoring
+        if param is not None:
+            stats[param] = value
+        if self.index_kind in ("ivf_flat", "ivf_pq"):
+            stats["nlist"] = self.index.nlist
+        
+        stats["benchmark"] = self.last_benchmark
+        return stats
+    
+    def snapshot(self) -> None:
+        """Write a full snapshot of the index and drop the log records it contains."""
+        with self.snapshot_lock:
+            # Copy state while changes wait (searches continue), write it to disk without the locks
+            with self.write_lock, self.lock.read():
+                index_bytes = faiss.serialize_index(self.index)
+                meta = {
+                    'seq': self.wal.seq,
+                    'tombstones': sorted(self.tombstones),
+                    'superseded': sorted(self.superseded),
+                    'dead': self.dead
+                }
+                wal_offset = self.wal.tell()
+            
+            self._save_index(index_bytes, meta)
+            self.wal.truncate_before(wal_offset)
+    
+    def _save_index(self, index_bytes: np.ndarray, meta: dict) -> None:
+        """
+        Save FAISS index and metadata to disk.
+        
+        Both files are written to temporary paths first and then renamed,
+        index before metadata, so _recover_snapshot can finish an interrupted save.
+        """
         # Create directory if needed
         os.makedirs(os.path.dirname(self.index_path) if os.path.dirname(self.index_path) else ".", exist_ok=True)
         
-        # Save FAISS index
-        faiss.write_index(self.index, self.index_path)
+        # Save FAISS index (serialized bytes are the index file format)
+        with open(self.index_path + ".tmp", 'wb') as f:
+            f.write(index_bytes.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        
+        # Save the last log sequence number the snapshot contains, and HNSW dead entries
+        with open(self.meta_path + ".tmp", 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        os.replace(self.index_path + ".tmp", self.index_path)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+    
+    def _recover_snapshot(self) -> None:
+        """Complete or discard a snapshot interrupted by a crash."""
+        index_tmp = self.index_path + ".tmp"
+        meta_tmp = self.meta_path + ".tmp"
+        
+        # Crashed between the two renames: the new index is in place, finish the metadata
+        if os.path.exists(meta_tmp) and not os.path.exists(index_tmp):
+            os.replace(meta_tmp, self.meta_path)
         
-        # Save mapping
-        with open(self.mapping_path, 'wb') as f:
-            pickle.dump(self.id_mapping, f)
+        for tmp_path in (index_tmp, meta_tmp):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
     
     def _load_index(self) -> None:
-        """Load FAISS index and mapping from disk."""
-        if os.path.exists(self.index_path) and os.path.exists(self.mapping_path):
+        """Load the FAISS index snapshot and replay the write-ahead log."""
+        self._recover_snapshot()
+        seq = 0
+        
+        if os.path.exists(self.index_path):
             try:
                 # Load FAISS index
                 self.index = faiss.read_index(self.index_path)
+                self.index_kind = self._index_type_of(self.index)
+                self._apply_search_params(self.index, self.index_kind)
                 
-                # Load mapping
-                with open(self.mapping_path, 'rb') as f:
-                    self.id_mapping = pickle.load(f)
-                    
-                print(f"Loaded FAISS index with {self.index.ntotal} embeddings")
+                if os.path.exists(self.legacy_mapping_path):
+                    seq = self._migrate_legacy_mapping()
+                elif os.path.exists(self.meta_path):
+                    with open(self.meta_path) as f:
+                        meta = json.load(f)
+                    seq = meta['seq']
+                    self.tombstones = set(meta.get('tombstones', []))
+                    self.superseded = set(meta.get('superseded', []))
+                    self.dead = meta.get('dead', 0)
+                
+                print(f"Loaded {self.index_kind} FAISS index with {self.get_total_embeddings()} embeddings")
             except Exception as e:
                 print(f"Error loading index: {e}. Starting with empty index.")
-                self.index = faiss.IndexFlatIP(self.embedding_dim)
-                self.id_mapping = []
+                # Keep the unreadable snapshot for inspection instead of overwriting it
+                os.replace(self.index_path, self.index_path + ".corrupt")
+                self.index_kind = "flat"
+                self.index = self._create_index("flat")
+                self.tombstones, self.superseded, self.dead = set(), set(), 0
+                seq = 0
+        
+        # Replay changes made since the snapshot
+        self.wal = WriteAheadLog(self.wal_path, self.embedding_dim, fsync=self.wal_fsync)
+        records = self.wal.replay(after_seq=seq)
+        
+        added = {}
+        for op, user_id, vector in records:
+            if op == OP_ADD:
+                added[user_id] = vector
+                continue
+            
+            # Flush pending adds before applying a removal
+            self._add_to_index(added)
+            added = {}
+            self._remove(user_id)
+        self._add_to_index(added)
+        
+        if records:
+            print(f"Replayed {len(records)} vector store changes from write-ahead log")
+        
+        if os.path.exists(self.legacy_mapping_path):
+            # Persist the migrated index before dropping the positional mapping
+            self.snapshot()
+            os.remove(self.legacy_mapping_path)
+        
+        # Switch index type in the background if the configuration or gallery size calls for it
+        self._maybe_snapshot()
+    
+    @staticmethod
+    def _index_type_of(index: faiss.Index) -> str:
+        """Determine which of INDEX_TYPES a loaded index is."""
+        if isinstance(index, faiss.IndexIVFPQ):
+            return "ivf_pq"
+        if isinstance(index, faiss.IndexIVFFlat):
+            return "ivf_flat"
+        if isinstance(index, faiss.IndexIDMap2):
+            sub_index = faiss.downcast_index(index.index)
+            if isinstance(sub_index, faiss.IndexHNSW):
+                return "hnsw"
+            if isinstance(sub_index, faiss.IndexPQ):
+                return "pq"
+            if isinstance(sub_index, faiss.IndexScalarQuantizer):
+                return "sq_fp16" if sub_index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq_int8"
+        return "flat"
+    
+    def _migrate_legacy_mapping(self) -> int:
+        """
+        Convert a positional IndexFlatIP + pickled user_id list into an ID-mapped index.
+        
+        Returns:
+            Log sequence number contained in the legacy snapshot
+        """
+        with open(self.legacy_mapping_path, 'rb') as f:
+            mapping = pickle.load(f)
+        
+        # Mapping is a plain list, or a dict with the log sequence number
+        seq = 0
+        if isinstance(mapping, dict):
+            mapping, seq = mapping['id_mapping'], mapping['seq']
+        
+        vectors = self.index.reconstruct_n(0, self.index.ntotal) if self.index.ntotal else None
+        self.index_kind = "flat"
+        self.index = self._create_index("flat")
+        
+        # Keep the last embedding per user
+        latest = {user_id: position for position, user_id in enumerate(mapping)}
+        if latest:
+            positions = np.array(list(latest.values()))
+            self.index.add_with_ids(vectors[positions], np.array(list(latest.keys()), dtype='int64'))
+        
+        print(f"Migrated legacy FAISS index mapping ({len(mapping)} entries)")
+        return seq
+    
+    def _add_to_index(self, entries: dict) -> None:
+        """Bulk upsert {user_id: vector} into the in-memory index."""
+        if not entries:
+            return
+        
+        ids = np.fromiter(entries.keys(), dtype='int64', count=len(entries))
+        self._upsert_many(ids, np.stack(list(entries.values())).astype('float32'))
     
     def clear(self) -> None:
         """Clear all embeddings from the index."""
-        with self.lock:
-            self.index = faiss.IndexFlatIP(self.embedding_dim)
-            self.id_mapping = []
-            self._save_index()
+        with self.write_lock, self.lock.write():
+            self.index_kind = "flat"
+            self.index = self._create_index("flat")
+            self.tombstones, self.superseded, self.dead = set(), set(), 0
+        
+        self.snapshot()
+    
+    def instrument(self, timer) -> None:
+        """Time searches (single queries go through search_batch), see Metrics.timer."""
+        self.search_batch = timer("search", self.search_batch)
+    
+    def close(self) -> None:
+        """Wait for background snapshots, write a final one and close the log."""
+        if self.snapshot_thread is not None:
+            self.snapshot_thread.join()
+        
+        if self.wal.records:
+            self.snapshot()
+        
+        self.wal.close()
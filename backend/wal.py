@@ -0,0 +1,198 @@
+"""Append-only write-ahead log of vector store changes."""
+import os
+import struct
+from threading import Lock
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+# File header: magic, format version, embedding dimension
+HEADER = struct.Struct('<6sHI')
+MAGIC = b'HFWAL\x00'
+VERSION = 1
+
+# Record header: sequence number, operation, user_id (followed by the vector for adds)
+RECORD = struct.Struct('<QBq')
+
+OP_ADD = 1
+OP_REMOVE = 2
+
+
+class WriteAheadLog:
+    """
+    Append-only log of (user_id, vector) additions and user_id removals.
+
+    Every record carries a monotonically increasing sequence number. A
+    snapshot stores the sequence number it includes, so replay after a crash
+    skips records the snapshot already contains.
+    """
+
+    def __init__(self, path: str, embedding_dim: int, fsync: bool = False):
+        """
+        Open (or create) a write-ahead log.
+
+        Args:
+            path: Log file path
+            embedding_dim: Dimension of logged vectors
+            fsync: If True, fsync after every record (survives OS crashes, slower)
+        """
+        self.path = path
+        self.embedding_dim = embedding_dim
+        self.fsync = fsync
+        self.vector_size = embedding_dim * 4  # float32
+
+        self.lock = Lock()
+        self.seq = 0  # Last sequence number written
+        self.records = 0  # Records currently in the file
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = self._open()
+
+    def _open(self):
+        """Open the log for appending, writing the header of a new file."""
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        f = open(self.path, 'ab')
+        if new_file:
+            f.write(HEADER.pack(MAGIC, VERSION, self.embedding_dim))
+            f.flush()
+        return f
+
+    def append_add(self, user_id: int, embedding: np.ndarray) -> int:
+        """Log an embedding addition. Returns its sequence number."""
+        vector = np.ascontiguousarray(embedding, dtype=np.float32).reshape(-1)
+        return self._append(OP_ADD, user_id, vector.tobytes())
+
+    def append_adds(self, user_ids: np.ndarray, embeddings: np.ndarray) -> int:
+        """Log several embedding additions with one write. Returns the last sequence number."""
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(user_ids), -1)
+        with self.lock:
+            records = []
+            for user_id, vector in zip(user_ids, vectors):
+                self.seq += 1
+                records.append(RECORD.pack(self.seq, OP_ADD, int(user_id)) + vector.tobytes())
+            self._write(b''.join(records), len(records))
+            return self.seq
+
+    def append_remove(self, user_id: int) -> int:
+        """Log the removal of all embeddings of a user. Returns its sequence number."""
+        return self._append(OP_REMOVE, user_id, b'')
+
+    def _append(self, op: int, user_id: int, payload: bytes) -> int:
+        """Write one record and flush it to the OS."""
+        with self.lock:
+            self.seq += 1
+            self._write(RECORD.pack(self.seq, op, user_id) + payload, 1)
+            return self.seq
+
+    def _write(self, data: bytes, n_records: int) -> None:
+        """Append encoded records and flush them (lock must be held)."""
+        self.file.write(data)
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.records += n_records
+
+    def replay(self, after_seq: int = 0) -> List[Tuple[int, int, Optional[np.ndarray]]]:
+        """
+        Read logged records newer than a snapshot.
+
+        A torn record at the end of the file (crash mid-write) is discarded.
+
+        Args:
+            after_seq: Sequence number already contained in the snapshot
+
+        Returns:
+            List of tuples (op, user_id, vector or None)
+        """
+        with self.lock:
+            self.file.close()
+            valid_end = HEADER.size
+
+            if os.path.getsize(self.path) < HEADER.size:
+                # Crashed while creating the log, start it again
+                os.remove(self.path)
+                self.file = self._open()
+                return []
+
+            with open(self.path, 'rb') as f:
+                header = f.read(HEADER.size)
+                magic, version, dim = HEADER.unpack(header)
+                if magic != MAGIC or version != VERSION or dim != self.embedding_dim:
+                    raise ValueError(f"Incompatible write-ahead log: {self.path}")
+
+                records = []
+                self.records = 0
+                while True:
+                    head = f.read(RECORD.size)
+                    if len(head) < RECORD.size:
+                        break
+                    seq, op, user_id = RECORD.unpack(head)
+
+                    vector = None
+                    if op == OP_ADD:
+                        data = f.read(self.vector_size)
+                        if len(data) < self.vector_size:
+                            break
+                        vector = np.frombuffer(data, dtype=np.float32)
+                    elif op != OP_REMOVE:
+                        break
+
+                    valid_end = f.tell()
+                    self.seq = max(self.seq, seq)
+                    self.records += 1
+                    if seq > after_seq:
+                        records.append((op, user_id, vector))
+
+            # Drop a torn tail so new records are appended after valid data
+            if valid_end < os.path.getsize(self.path):
+                with open(self.path, 'r+b') as f:
+                    f.truncate(valid_end)
+
+            self.seq = max(self.seq, after_seq)
+            self.file = self._open()
+
+        return records
+
+    def tell(self) -> int:
+        """Current end offset of the log (used to mark a snapshot point)."""
+        with self.lock:
+            return self.file.tell()
+
+    def truncate_before(self, offset: int) -> None:
+        """
+        Drop records before a byte offset, keeping newer ones.
+
+        Called after a snapshot is durably written, with the offset returned
+        by tell() when the snapshot was taken.
+        """
+        with self.lock:
+            self.file.close()
+            tmp_path = self.path + ".tmp"
+
+            with open(self.path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                dst.write(src.read(HEADER.size))
+                src.seek(offset)
+                tail = src.read()
+                dst.write(tail)
+                dst.flush()
+                os.fsync(dst.fileno())
+
+            os.replace(tmp_path, self.path)
+            self.records = self._count_records(tail)
+            self.file = self._open()
+
+    def _count_records(self, data: bytes) -> int:
+        """Count complete records in a block of log data."""
+        count = 0
+        pos = 0
+        while pos + RECORD.size <= len(data):
+            _, op, _ = RECORD.unpack_from(data, pos)
+            pos += RECORD.size + (self.vector_size if op == OP_ADD else 0)
+            count += 1
+        return count
+
+    def close(self) -> None:
+        """Close the log file."""
+        with self.lock:
+            self.file.close()
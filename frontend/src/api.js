@@ -42,13 +42,26 @@ export const api = {
     },
 
     async getUsers() {
-        const response = await fetch(`${API_BASE_URL}/users`);
-
-        if (!response.ok) {
-            throw new Error('Failed to fetch users');
-        }
-
-        return response.json();
+        // Follow the cursor through every page
+        const users = [];
+        let cursor = null;
+        let total = 0;
+
+        do {
+            const query = cursor === null ? '?limit=1000' : `?limit=1000&cursor=${cursor}`;
+            const response = await fetch(`${API_BASE_URL}/users${query}`);
+
+            if (!response.ok) {
+                throw new Error('Failed to fetch users');
+            }
+
+            const page = await response.json();
+            users.push(...page.users);
+            total = page.total;
+            cursor = page.next_cursor;
+        } while (cursor !== null);
+
+        return { users, total };
     },
 
     async deleteUser(userId) {
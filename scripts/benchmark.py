@@ -1,5 +1,18 @@
-"""Performance benchmark script."""
+"""
+Performance benchmark suite with regression tracking.
+
+Times each recognition stage (decode, detect, align, embed, search, DB lookup)
+on synthetic face images drawn locally, against galleries of increasing size
+built in a temporary directory. Results are written as JSON; given a stored
+baseline, the script exits non-zero when a stage got slower than the tolerance.
+"""
+import argparse
+import json
+import platform
+import tempfile
 import time
+from collections import defaultdict
+import cv2
 import numpy as np
 import sys
 import os
@@ -7,94 +20,321 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
 
+from config import DETECTION_MAX_SIDE, INSIGHTFACE_MODEL, PIPELINE_MODE, VECTOR_BACKEND
+from database import Database
 from face_detector import FaceDetector
 from face_embedder import FaceEmbedder
+from numpy_store import NumpyVectorStore
 from vector_store import VectorStore
 
+SKIN_TONES = [(255, 219, 172), (241, 194, 125), (224, 172, 105), (198, 134, 66), (141, 85, 36)]
+GALLERY_STAGES = ["search", "db_lookup"]
+COMPARED_PERCENTILES = ["p50", "p95"]
+
+
+def synthetic_face(seed, width=640, height=480):
+    """
+    Draw a frontal face (skin, hair, brows, eyes, nose, mouth) on a noisy background.
+    
+    Position, scale, colors and background vary with the seed; MediaPipe
+    detects these reliably, unlike random noise.
+    
+    Returns:
+        RGB image of shape (height, width, 3)
+    """
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), rng.integers(60, 200, 3), dtype=np.float32)
+    image = np.clip(background + rng.normal(0, 8, background.shape), 0, 255).astype(np.uint8)
+    image = cv2.GaussianBlur(image, (5, 5), 0)
+    
+    scale = rng.uniform(0.8, 1.2) * height / 480
+    cx = width // 2 + int(rng.integers(-60, 60) * scale)
+    cy = height // 2 + int(rng.integers(-30, 30) * scale)
+    fw, fh = int(90 * scale), int(120 * scale)
+    skin = SKIN_TONES[rng.integers(len(SKIN_TONES))]
+    shade = tuple(int(c * 0.8) for c in skin)
+    hair = tuple(int(c) for c in rng.integers(10, 90, 3))
+    
+    # Face and hair
+    cv2.ellipse(image, (cx, cy), (fw, fh), 0, 0, 360, skin, -1)
+    cv2.ellipse(image, (cx, cy - int(fh * 0.55)), (int(fw * 1.05), int(fh * 0.5)), 0, 180, 360, hair, -1)
+    
+    # Eyes and brows
+    eye_dx, eye_y = int(fw * 0.4), cy - int(fh * 0.15)
+    for side in (-1, 1):
+        ex = cx + side * eye_dx
+        cv2.ellipse(image, (ex, eye_y), (int(fw * 0.2), int(fh * 0.08)), 0, 0, 360, (245, 245, 245), -1)
+        cv2.circle(image, (ex, eye_y), int(fh * 0.065), (60, 40, 30), -1)
+        cv2.circle(image, (ex, eye_y), int(fh * 0.03), (10, 10, 10), -1)
+        cv2.line(image, (ex - int(fw * 0.22), eye_y - int(fh * 0.16)),
+                 (ex + int(fw * 0.22), eye_y - int(fh * 0.18)), hair, max(2, int(6 * scale)))
+    
+    # Nose and mouth
+    cv2.line(image, (cx, eye_y + 10), (cx - 8, cy + int(fh * 0.25)), shade, 3)
+    cv2.ellipse(image, (cx, cy + int(fh * 0.27)), (int(fw * 0.18), int(fh * 0.05)), 0, 0, 360, shade, -1)
+    cv2.ellipse(image, (cx, cy + int(fh * 0.5)), (int(fw * 0.35), int(fh * 0.1)), 0, 0, 180, (150, 50, 60), -1)
+    
+    return cv2.GaussianBlur(image, (3, 3), 0)
+
+
+def face_fixtures(count, width, height):
+    """Encode synthetic faces as JPEG bytes, as uploads arrive."""
+    fixtures = []
+    for seed in range(count):
+        bgr = cv2.cvtColor(synthetic_face(seed, width, height), cv2.COLOR_RGB2BGR)
+        fixtures.append(cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return fixtures
+
+
+def summarize(samples):
+    """Percentiles in milliseconds of a list of durations in seconds."""
+    ms = np.array(samples) * 1000
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 4),
+        "p95": round(float(np.percentile(ms, 95)), 4),
+        "p99": round(float(np.percentile(ms, 99)), 4),
+        "mean": round(float(ms.mean()), 4),
+        "runs": len(ms)
+    }
+
+
+def benchmark_pipeline(detector, embedder, fixtures, runs, warmup, align):
+    """
+    Time decode, detect, align and embed, cycling through the fixtures.
+    
+    Each run goes through detect_from_bytes and get_embeddings_batch as a
+    request does, with the stages timed through the components' instrument()
+    hooks. Runs where no face was found are left out of the stage statistics
+    (they skip align and embed) and only counted.
+    
+    Returns:
+        Tuple (stats per stage, detection counts, query embeddings of the fixtures with a face)
+    """
+    timings = defaultdict(float)
+    
+    def timer(stage, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timings[stage] += time.perf_counter() - start
+        return timed
+    
+    detector.instrument(timer)
+    embedder.instrument(timer)
+    
+    samples = defaultdict(list)
+    detection = {"runs": runs, "with_face": 0, "faces": 0}
+    queries = {}
+    
+    for run in range(warmup + runs):
+        index = run % len(fixtures)
+        timings.clear()
+        
+        faces = detector.detect_from_bytes(fixtures[index], align=align)
+        embeddings = embedder.get_embeddings_batch([crop for crop, _ in faces])
+        
+        if embeddings and embeddings[0] is not None:
+            queries[index] = embeddings[0]
+        if run < warmup:
+            continue
+        
+        detection["faces"] += len(faces)
+        if faces:
+            detection["with_face"] += 1
+            for stage, duration in timings.items():
+                samples[stage].append(duration)
+    
+    return {stage: summarize(durations) for stage, durations in samples.items()}, detection, list(queries.values())
+
 
-def benchmark():
-    """Run performance benchmarks."""
+def random_embeddings(n, dim, rng):
+    """Generate L2 normalized random embeddings."""
+    embeddings = rng.standard_normal((n, dim)).astype('float32')
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def grow_gallery(store, database, start, size, queries, rng, chunk_size=50000):
+    """
+    Enroll users start+1..size in both the vector store and the database.
+    
+    The first users are noisy copies of the query faces, so searches find
+    a genuine match; the rest are random embeddings.
+    """
+    for first in range(start + 1, size + 1, chunk_size):
+        ids = np.arange(first, min(first + chunk_size, size + 1))
+        embeddings = random_embeddings(len(ids), store.embedding_dim, rng)
+        
+        for row, user_id in enumerate(ids):
+            if user_id <= len(queries):
+                noisy = queries[user_id - 1] + random_embeddings(1, store.embedding_dim, rng)[0] * 0.3
+                embeddings[row] = noisy / np.linalg.norm(noisy)
+        
+        database.create_users([(f"User {i}", f"user{i}@benchmark.local", None) for i in ids])
+        store.add_embeddings(ids, embeddings)
+
+
+def benchmark_gallery(store, database, queries, runs, warmup):
+    """Time top-1 search and the DB lookup of the matched user."""
+    samples = {stage: [] for stage in GALLERY_STAGES}
+    
+    for run in range(warmup + runs):
+        query = queries[run % len(queries)]
+        
+        start = time.perf_counter()
+        results = store.search(query, k=1)
+        searched = time.perf_counter()
+        database.get_user(int(results[0][0]))
+        looked_up = time.perf_counter()
+        
+        if run >= warmup:
+            samples["search"].append(searched - start)
+            samples["db_lookup"].append(looked_up - searched)
+    
+    return {stage: summarize(durations) for stage, durations in samples.items()}
+
+
+def find_regressions(results, baseline, tolerance, min_delta_ms):
+    """
+    Compare p50/p95 of every stage present in both results.
+    
+    Args:
+        results: Results of this run
+        baseline: Stored results to compare against
+        tolerance: Allowed relative slowdown (0.25 = 25%)
+        min_delta_ms: Slowdowns smaller than this are treated as noise
+    
+    Returns:
+        List of human readable regression descriptions
+    """
+    pairs = [(stage, results["stages"][stage], baseline.get("stages", {}).get(stage))
+             for stage in results["stages"]]
+    for size, stages in results["galleries"].items():
+        for stage, stats in stages.items():
+            pairs.append((f"{stage}@{size}", stats, baseline.get("galleries", {}).get(size, {}).get(stage)))
+    
+    regressions = []
+    for name, current, previous in pairs:
+        if not previous:
+            continue
+        for percentile in COMPARED_PERCENTILES:
+            now, before = current[percentile], previous[percentile]
+            if now > before * (1 + tolerance) and now - before > min_delta_ms:
+                regressions.append(f"{name} {percentile}: {before:.2f}ms -> {now:.2f}ms (+{(now / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_stats(name, stats):
+    """Print one row of the results table."""
+    print(f"   {name:<18} {stats['p50']:>9.3f} {stats['p95']:>9.3f} {stats['p99']:>9.3f}")
+
+
+def main():
+    """Run the benchmark suite and compare against an optional baseline."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Comma-separated gallery sizes")
+    parser.add_argument("--runs", type=int, default=100, help="Measured runs per stage")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured warm-up runs per stage")
+    parser.add_argument("--fixtures", type=int, default=20, help="Number of synthetic face images")
+    parser.add_argument("--image-size", default="640x480", help="Fixture size as WIDTHxHEIGHT")
+    parser.add_argument("--backend", choices=["faiss", "numpy"], default=VECTOR_BACKEND, help="Vector store backend")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before failing")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Ignore slowdowns below this many ms")
+    args = parser.parse_args()
+    
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    width, height = (int(side) for side in args.image_size.lower().split("x"))
+    align = PIPELINE_MODE == "single_pass"
+    
     print("⚡ HelloFace Performance Benchmark")
     print("=" * 50)
     
     # Initialize components
     print("\n1️⃣ Loading models...")
     start = time.time()
-    detector = FaceDetector()
-    detector_load_time = time.time() - start
-    print(f"   MediaPipe loaded in {detector_load_time:.2f}s")
+    detector = FaceDetector(min_detection_confidence=0.7, working_size=DETECTION_MAX_SIDE)
+    embedder = FaceEmbedder(model_name=INSIGHTFACE_MODEL, single_pass=align)
+    load_time = time.time() - start
+    print(f"   Models loaded in {load_time:.2f}s ({PIPELINE_MODE})")
     
-    start = time.time()
-    embedder = FaceEmbedder()
-    embedder_load_time = time.time() - start
-    print(f"   InsightFace loaded in {embedder_load_time:.2f}s")
-    
-    vector_store = VectorStore()
-    
-    # Create test image (640x480 with random noise)
-    print("\n2️⃣ Creating test image...")
-    test_image = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
-    
-    # Benchmark face detection
-    print("\n3️⃣ Benchmarking face detection...")
-    times = []
-    for i in range(10):
-        start = time.time()
-        faces = detector.detect_faces(test_image)
-        times.append(time.time() - start)
-    
-    print(f"   Average: {np.mean(times)*1000:.1f}ms")
-    print(f"   Min: {np.min(times)*1000:.1f}ms")
-    print(f"   Max: {np.max(times)*1000:.1f}ms")
-    
-    # Create a test face crop
-    test_face = np.random.randint(0, 255, (112, 112, 3), dtype=np.uint8)
-    
-    # Benchmark embedding generation
-    print("\n4️⃣ Benchmarking embedding generation...")
-    times = []
-    for i in range(10):
-        start = time.time()
-        embedding = embedder.get_embedding(test_face)
-        times.append(time.time() - start)
-    
-    print(f"   Average: {np.mean(times)*1000:.1f}ms")
-    print(f"   Min: {np.min(times)*1000:.1f}ms")
-    print(f"   Max: {np.max(times)*1000:.1f}ms")
-    
-    # Benchmark vector search
-    print("\n5️⃣ Benchmarking vector search...")
-    
-    # Add test embeddings
-    for i in range(1000):
-        test_emb = np.random.randn(512).astype('float32')
-        test_emb = test_emb / np.linalg.norm(test_emb)
-        vector_store.add_embedding(i, test_emb)
-    
-    query_emb = np.random.randn(512).astype('float32')
-    query_emb = query_emb / np.linalg.norm(query_emb)
-    
-    times = []
-    for i in range(100):
-        start = time.time()
-        results = vector_store.search(query_emb, k=1)
-        times.append(time.time() - start)
-    
-    print(f"   Database size: 1000 embeddings")
-    print(f"   Average: {np.mean(times)*1000:.2f}ms")
-    print(f"   Min: {np.min(times)*1000:.2f}ms")
-    print(f"   Max: {np.max(times)*1000:.2f}ms")
+    print(f"\n2️⃣ Drawing {args.fixtures} synthetic faces ({width}x{height})...")
+    fixtures = face_fixtures(args.fixtures, width, height)
+    
+    print("\n3️⃣ Benchmarking pipeline stages...")
+    stages, detection, queries = benchmark_pipeline(detector, embedder, fixtures, args.runs, args.warmup, align)
+    print(f"   Faces found in {detection['with_face']}/{detection['runs']} runs ({detection['faces']} faces)")
+    if detection["with_face"] < detection["runs"]:
+        print("   ⚠️  Runs without a face are left out of the stage timings")
+    if not queries:
+        print("   ⚠️  No fixture produced an embedding, searching with random queries")
+        queries = list(random_embeddings(args.fixtures, embedder.embedding_size, np.random.default_rng(1)))
+    
+    print(f"\n4️⃣ Benchmarking {args.backend} search and DB lookup...")
+    galleries = {}
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store_class = NumpyVectorStore if args.backend == "numpy" else VectorStore
+        store = store_class(embedding_dim=embedder.embedding_size, index_path=os.path.join(tmp, "index"),
+                            snapshot_every=sizes[-1] + 1, wal_fsync=False)
+        database = Database(db_path=os.path.join(tmp, "benchmark.db"))
+        
+        enrolled = 0
+        for size in sizes:
+            start = time.time()
+            grow_gallery(store, database, enrolled, size, queries, rng)
+            enrolled = size
+            galleries[str(size)] = benchmark_gallery(store, database, queries, args.runs, args.warmup)
+            print(f"   {size:,} users enrolled in {time.time() - start:.1f}s")
+        
+        database.engine.dispose()
+    
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "pipeline_mode": PIPELINE_MODE,
+            "backend": args.backend,
+            "image_size": [width, height],
+            "runs": args.runs,
+            "warmup": args.warmup,
+            "model_load_s": round(load_time, 2)
+        },
+        "detection": detection,
+        "stages": stages,
+        "galleries": galleries
+    }
     
     # Summary
-    print("\n📊 Summary:")
-    print(f"   Model loading: {detector_load_time + embedder_load_time:.2f}s (one-time cost)")
-    print(f"   Face detection: ~{np.mean(times)*1000:.0f}ms per image")
-    print(f"   Embedding generation: ~{np.mean(times)*1000:.0f}ms per face")
-    print(f"   Vector search: ~{np.mean(times)*1000:.1f}ms for 1K users")
-    print(f"\n   Total recognition time: ~{(np.mean(times)*3)*1000:.0f}ms per image")
+    print("\n📊 Summary (ms):")
+    print(f"   {'stage':<18} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage, stats in stages.items():
+        print_stats(stage, stats)
+    for size, gallery in galleries.items():
+        for stage, stats in gallery.items():
+            print_stats(f"{stage} @ {int(size):,}", stats)
+    
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
     
     print("\n✅ Benchmark complete!")
 
 
 if __name__ == "__main__":
-    benchmark()
+    main()
@@ -0,0 +1,83 @@
+"""Compare the NumPy and FAISS flat search backends on synthetic galleries."""
+import argparse
+import tempfile
+import time
+import numpy as np
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from numpy_store import NumpyVectorStore
+from vector_store import VectorStore
+
+
+def random_embeddings(n, dim, seed):
+    """Generate L2 normalized random embeddings."""
+    embeddings = np.random.default_rng(seed).standard_normal((n, dim)).astype('float32')
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def time_searches(store, queries, k, batch_size):
+    """Average milliseconds per query, searching one at a time and in batches."""
+    store.search(queries[0], k=k)  # Warm up
+    
+    start = time.perf_counter()
+    for query in queries:
+        store.search(query, k=k)
+    single = (time.perf_counter() - start) * 1000 / len(queries)
+    
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        store.search_batch(queries[i:i + batch_size], k=k)
+    batched = (time.perf_counter() - start) * 1000 / len(queries)
+    return single, batched
+
+
+def main():
+    """Time single and batched searches of both backends at several gallery sizes."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,50000", help="Comma-separated gallery sizes")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per measurement")
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per batched search")
+    parser.add_argument("--k", type=int, default=5, help="Neighbors per query")
+    parser.add_argument("--dim", type=int, default=512, help="Embedding dimension")
+    args = parser.parse_args()
+    
+    print("⚡ HelloFace Search Backend Benchmark")
+    print("=" * 50)
+    print(f"   {'gallery':>8}  {'backend':>7}  {'single ms':>9}  {'batched ms/query':>16}  {'add s':>6}")
+    
+    for size in [int(size) for size in args.sizes.split(",")]:
+        embeddings = random_embeddings(size, args.dim, seed=0)
+        noise = random_embeddings(args.queries, args.dim, seed=1) * 0.5
+        picked = embeddings[np.random.default_rng(2).integers(0, size, args.queries)]
+        queries = (picked + noise) / np.linalg.norm(picked + noise, axis=1, keepdims=True)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            stores = {
+                "numpy": NumpyVectorStore(embedding_dim=args.dim, index_path=os.path.join(tmp, "numpy"),
+                                          snapshot_every=size + 1),
+                "faiss": VectorStore(embedding_dim=args.dim, index_path=os.path.join(tmp, "faiss"),
+                                     snapshot_every=size + 1)
+            }
+            
+            results = {}
+            for name, store in stores.items():
+                start = time.perf_counter()
+                store.add_embeddings(np.arange(1, size + 1), embeddings)
+                added = time.perf_counter() - start
+                
+                single, batched = time_searches(store, queries, args.k, args.batch_size)
+                results[name] = [hits[0][0] for hits in store.search_batch(queries[:20], k=1)]
+                print(f"   {size:>8}  {name:>7}  {single:>9.2f}  {batched:>16.3f}  {added:>6.2f}")
+            
+            if results["numpy"] != results["faiss"]:
+                print("   ⚠️  Backends disagree on the best match")
+    
+    print("\n✅ Benchmark complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Enroll a directory or zip/tar archive of labelled photos."""
+import argparse
+import json
+import time
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from database import Database
+from vector_store import VectorStore
+from shared_store import SharedVectorStore
+from numpy_store import NumpyVectorStore
+from face_detector import FaceDetector
+from face_embedder import FaceEmbedder
+from bulk_enroll import bulk_enroll, iter_photos
+from config import (
+    PIPELINE_MODE, INSIGHTFACE_MODEL, ONNX_INTRA_OP_THREADS, DETECTION_MAX_SIDE,
+    VECTOR_SNAPSHOT_EVERY, VECTOR_INDEX_TYPE, VECTOR_ANN_THRESHOLD,
+    HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, IVF_NLIST, IVF_NPROBE, IVF_PQ_M,
+    EMBEDDING_STORAGE_DTYPE, BULK_ENROLL_BATCH_SIZE, TEMPLATE_MODE, SAMPLE_SCORING, VECTOR_SHARED_GALLERY,
+    VECTOR_BACKEND
+)
+
+
+def main():
+    """Bulk enroll photos into a stopped backend's database and index."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("source", help="Directory, .zip or .tar(.gz) of photos")
+    parser.add_argument("--manifest", help="CSV with columns file,name,email (default: manifest.csv in source)")
+    parser.add_argument("--db", default="data/helloface.db", help="SQLite database path")
+    parser.add_argument("--index", default="data/faiss_index", help="FAISS index path")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Detection/embedding threads")
+    parser.add_argument("--batch-size", type=int, default=BULK_ENROLL_BATCH_SIZE, help="Photos per transaction")
+    parser.add_argument("--report", default="bulk_enroll_report.jsonl", help="Per-photo results (appended)")
+    args = parser.parse_args()
+    
+    print("📥 HelloFace Bulk Enrollment")
+    print("=" * 50)
+    
+    print("Loading models...")
+    face_detector = FaceDetector(min_detection_confidence=0.7, working_size=DETECTION_MAX_SIDE)
+    face_embedder = FaceEmbedder(
+        model_name=INSIGHTFACE_MODEL,
+        single_pass=PIPELINE_MODE == "single_pass",
+        intra_op_threads=ONNX_INTRA_OP_THREADS
+    )
+    
+    database = Database(db_path=args.db, embedding_dtype=EMBEDDING_STORAGE_DTYPE)
+    if VECTOR_SHARED_GALLERY:
+        vector_store = SharedVectorStore(
+            embedding_dim=512,
+            index_path=args.index,
+            snapshot_every=VECTOR_SNAPSHOT_EVERY,
+            multi_sample=TEMPLATE_MODE == "all",
+            sample_scoring=SAMPLE_SCORING
+        )
+    elif VECTOR_BACKEND == "numpy":
+        vector_store = NumpyVectorStore(
+            embedding_dim=512,
+            index_path=args.index,
+            snapshot_every=VECTOR_SNAPSHOT_EVERY,
+            multi_sample=TEMPLATE_MODE == "all",
+            sample_scoring=SAMPLE_SCORING
+        )
+    else:
+        vector_store = VectorStore(
+            embedding_dim=512,
+            index_path=args.index,
+            snapshot_every=VECTOR_SNAPSHOT_EVERY,
+            index_type=VECTOR_INDEX_TYPE,
+            ann_threshold=VECTOR_ANN_THRESHOLD,
+            hnsw_m=HNSW_M,
+            ef_construction=HNSW_EF_CONSTRUCTION,
+            ef_search=HNSW_EF_SEARCH,
+            nlist=IVF_NLIST,
+            nprobe=IVF_NPROBE,
+            pq_m=IVF_PQ_M,
+            multi_sample=TEMPLATE_MODE == "all",
+            sample_scoring=SAMPLE_SCORING
+        )
+    
+    start = time.time()
+    with open(args.report, "a") as report:
+        def on_result(result: dict):
+            report.write(json.dumps(result) + "\n")
+            if result["status"] == "failed":
+                print(f"   ❌ {result['file']}: {result['error']}")
+        
+        counts = bulk_enroll(
+            iter_photos(args.source, manifest=args.manifest),
+            face_detector,
+            face_embedder,
+            database,
+            vector_store,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            on_result=on_result
+        )
+    
+    vector_store.close()
+    
+    elapsed = time.time() - start
+    print(f"\n   Enrolled {counts['enrolled']}, already enrolled {counts['exists']}, failed {counts['failed']}")
+    print(f"   {counts['total']} photos in {elapsed:.1f}s ({counts['total'] / max(elapsed, 1e-9):.1f}/s)")
+    print(f"   Results written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+HTTP load test of the HelloFace API.
+
+Drives a weighted mix of enroll, recognize and delete requests from many
+concurrent clients, with payloads encoded up front, and reports throughput,
+latency percentiles and error rates per operation. Runs the app in-process
+(uvicorn in a background thread, data in a temporary directory) unless --url
+points at a running server. --stub-models swaps MediaPipe/InsightFace for
+model-free stubs, so the web layer, database and vector store are measured
+without inference cost (for an external server, start it with STUB_MODELS=true).
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+import httpx
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from benchmark import face_fixtures, summarize
+
+OPERATIONS = ["enroll", "recognize", "delete"]
+
+
+class InProcessServer:
+    """The FastAPI app served by uvicorn on a background thread."""
+    
+    def __init__(self, stub_models, port):
+        """
+        Initialize server.
+        
+        Args:
+            stub_models: Use the stub detector and embedder
+            port: Local port to listen on
+        """
+        import uvicorn
+        import main
+        
+        main.STUB_MODELS = stub_models
+        self.server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.url = f"http://127.0.0.1:{port}"
+    
+    def start(self, timeout=600):
+        """Start serving and wait until startup (model loading) finishes."""
+        self.thread.start()
+        deadline = time.time() + timeout
+        while not self.server.started:
+            if not self.thread.is_alive() or time.time() > deadline:
+                raise RuntimeError("In-process server failed to start")
+            time.sleep(0.05)
+    
+    def stop(self):
+        """Shut down gracefully (runs the app's shutdown handlers)."""
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def free_port():
+    """Pick an unused local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_mix(mix):
+    """Parse "recognize=8,enroll=1,delete=1" into operation weights."""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}, expected one of {OPERATIONS}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class Payloads:
+    """Request bodies encoded once, before the clock starts."""
+    
+    def __init__(self, images, api):
+        """
+        Initialize payloads.
+        
+        Args:
+            images: Encoded JPEG fixtures
+            api: "v1" (JSON with base64 images) or "v2" (raw uploads)
+        """
+        self.api = api
+        self.run_id = uuid.uuid4().hex[:8]
+        self.counter = 0
+        
+        if api == "v1":
+            self.images = [json.dumps(base64.b64encode(image).decode()).encode() for image in images]
+            self.recognize_bodies = [b'{"image":' + image + b'}' for image in self.images]
+        else:
+            self.images = images
+            self.recognize_bodies = images
+    
+    def enroll(self):
+        """Request arguments enrolling a new, unique user."""
+        self.counter += 1
+        name = f"Load User {self.counter}"
+        email = f"load-{self.run_id}-{self.counter}@example.com"
+        image = self.images[self.counter % len(self.images)]
+        
+        if self.api == "v1":
+            body = b'{"name":"' + name.encode() + b'","email":"' + email.encode() + b'","image":' + image + b'}'
+            return "/enroll", {"content": body, "headers": {"Content-Type": "application/json"}}
+        return "/v2/enroll", {
+            "content": image,
+            "params": {"name": name, "email": email},
+            "headers": {"Content-Type": "application/octet-stream"}
+        }
+    
+    def recognize(self):
+        """Request arguments recognizing one of the fixtures."""
+        body = random.choice(self.recognize_bodies)
+        if self.api == "v1":
+            return "/recognize", {"content": body, "headers": {"Content-Type": "application/json"}}
+        return "/v2/recognize", {"content": body, "headers": {"Content-Type": "application/octet-stream"}}
+
+
+class LoadTest:
+    """Concurrent clients issuing a weighted mix of operations."""
+    
+    def __init__(self, client, payloads, weights):
+        """
+        Initialize load test.
+        
+        Args:
+            client: httpx.AsyncClient pointed at the server
+            payloads: Pre-encoded request bodies
+            weights: Relative frequency of each operation
+        """
+        self.client = client
+        self.payloads = payloads
+        self.operations = list(weights)
+        self.weights = list(weights.values())
+        
+        # Users enrolled by this run, the only ones it deletes
+        self.enrolled = []
+        
+        self.latencies = {name: [] for name in OPERATIONS}
+        self.statuses = {name: Counter() for name in OPERATIONS}
+        self.skipped = Counter()
+    
+    async def request(self, name):
+        """Issue one operation and record its latency and outcome."""
+        if name == "delete":
+            if not self.enrolled:
+                self.skipped[name] += 1
+                return
+            method, path, kwargs = "DELETE", f"/users/{self.enrolled.pop(random.randrange(len(self.enrolled)))}", {}
+        else:
+            method = "POST"
+            path, kwargs = getattr(self.payloads, name)()
+        
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            outcome = response.status_code
+        except httpx.HTTPError as e:
+            response, outcome = None, type(e).__name__
+        self.latencies[name].append(time.perf_counter() - start)
+        self.statuses[name][outcome] += 1
+        
+        if name == "enroll" and outcome == 200:
+            self.enrolled.append(response.json()["user_id"])
+    
+    async def client_loop(self, deadline, budget):
+        """Issue requests back to back until the deadline or request budget runs out."""
+        while time.perf_counter() < deadline and budget[0] > 0:
+            budget[0] -= 1
+            await self.request(random.choices(self.operations, self.weights)[0])
+    
+    async def run(self, concurrency, duration, max_requests):
+        """
+        Run the mix with concurrency clients.
+        
+        Returns:
+            Wall-clock seconds the run took
+        """
+        deadline = time.perf_counter() + duration
+        budget = [max_requests or float("inf")]
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(self.client_loop(deadline, budget) for _ in range(concurrency)))
+        return time.perf_counter() - start
+    
+    def report(self, elapsed):
+        """Throughput, latency and errors per operation and overall."""
+        operations = {}
+        for name in OPERATIONS:
+            statuses = self.statuses[name]
+            total = sum(statuses.values())
+            if not total and not self.skipped[name]:
+                continue
+            
+            errors = total - statuses[200]
+            operations[name] = {
+                "requests": total,
+                "errors": errors,
+                "error_rate": round(errors / total, 4) if total else 0.0,
+                "throughput_rps": round(total / elapsed, 2),
+                "statuses": {str(outcome): count for outcome, count in statuses.items()},
+                "skipped": self.skipped[name],
+                "latency_ms": summarize(self.latencies[name]) if total else None
+            }
+        
+        requests = sum(operation["requests"] for operation in operations.values())
+        errors = sum(operation["errors"] for operation in operations.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": requests,
+            "throughput_rps": round(requests / elapsed, 2),
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+            "operations": operations
+        }
+
+
+async def drive(url, args, weights, images):
+    """Seed the gallery, then run the measured load test."""
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        payloads = Payloads(images, args.api)
+        
+        if args.seed_users:
+            print(f"\n2️⃣ Enrolling {args.seed_users} seed users...")
+            seed = LoadTest(client, payloads, {"enroll": 1})
+            await seed.run(args.concurrency, float("inf"), args.seed_users)
+            print(f"   {len(seed.enrolled)} enrolled, {args.seed_users - len(seed.enrolled)} failed")
+        
+        print(f"\n3️⃣ Running {args.concurrency} clients for {args.duration:.0f}s...")
+        load_test = LoadTest(client, payloads, weights)
+        if args.seed_users:
+            load_test.enrolled = seed.enrolled
+        elapsed = await load_test.run(args.concurrency, args.duration, args.requests)
+        return load_test.report(elapsed)
+
+
+def main():
+    """Run the load test and print a summary."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running server (default: start the app in-process)")
+    parser.add_argument("--stub-models", action="store_true", help="In-process: use stub detector/embedder")
+    parser.add_argument("--mix", type=parse_mix, default="recognize=8,enroll=1,delete=1",
+                        help="Operation weights, e.g. recognize=8,enroll=1,delete=1")
+    parser.add_argument("--api", choices=["v1", "v2"], default="v2", help="JSON/base64 (v1) or raw upload (v2) endpoints")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0 = no limit)")
+    parser.add_argument("--seed-users", type=int, default=100, help="Users enrolled before measuring")
+    parser.add_argument("--fixtures", type=int, default=20, help="Number of synthetic face images")
+    parser.add_argument("--image-size", default="640x480", help="Fixture size as WIDTHxHEIGHT")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    args = parser.parse_args()
+    
+    print("🔥 HelloFace Load Test")
+    print("=" * 50)
+    
+    width, height = (int(side) for side in args.image_size.lower().split("x"))
+    images = face_fixtures(args.fixtures, width, height)
+    
+    server = None
+    workdir = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            if args.url:
+                url = args.url.rstrip("/")
+                print(f"\n1️⃣ Targeting {url}")
+            else:
+                print(f"\n1️⃣ Starting app in-process ({'stub' if args.stub_models else 'real'} models)...")
+                # main.py keeps its data under ./data, so isolate it
+                os.chdir(tmp)
+                server = InProcessServer(args.stub_models, free_port())
+                server.start()
+                url = server.url
+            
+            results = asyncio.run(drive(url, args, args.mix, images))
+        finally:
+            if server:
+                server.stop()
+            os.chdir(workdir)
+    
+    results["config"] = {
+        "target": args.url or "in-process",
+        "stub_models": args.stub_models,
+        "api": args.api,
+        "mix": args.mix,
+        "concurrency": args.concurrency,
+        "seed_users": args.seed_users
+    }
+    
+    # Summary
+    print(f"\n📊 {results['requests']} requests in {results['elapsed_s']}s: "
+          f"{results['throughput_rps']} req/s, {results['error_rate']:.1%} errors")
+    print(f"   {'operation':<10} {'req/s':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, operation in results["operations"].items():
+        latency = operation["latency_ms"] or {"p50": 0, "p95": 0, "p99": 0}
+        print(f"   {name:<10} {operation['throughput_rps']:>8.1f} {operation['error_rate']:>7.1%} "
+              f"{latency['p50']:>8.1f} {latency['p95']:>8.1f} {latency['p99']:>8.1f}")
+        failures = {status: count for status, count in operation["statuses"].items() if status != "200"}
+        if failures:
+            print(f"      failures: {failures}")
+        if operation["skipped"]:
+            print(f"      skipped: {operation['skipped']} (no enrolled user left to delete)")
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    
+    print("\n✅ Load test complete!")
+
+
+if __name__ == "__main__":
+    main()
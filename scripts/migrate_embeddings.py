@@ -0,0 +1,41 @@
+"""Convert stored user and face sample embeddings from JSON-in-Fernet to the compact binary format."""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from database import Database
+from config import EMBEDDING_STORAGE_DTYPE
+
+
+def main():
+    """Re-encrypt legacy embedding rows, optionally reclaiming the freed space."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="data/helloface.db", help="SQLite database path")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows converted per transaction")
+    parser.add_argument("--vacuum", action="store_true", help="Run VACUUM afterwards to shrink the file")
+    args = parser.parse_args()
+    
+    print("🔐 HelloFace Embedding Migration")
+    print("=" * 50)
+    
+    database = Database(db_path=args.db, embedding_dtype=EMBEDDING_STORAGE_DTYPE)
+    size_before = os.path.getsize(args.db)
+    
+    start = time.time()
+    migrated = database.migrate_embeddings(chunk_size=args.chunk_size)
+    print(f"\n   Converted {migrated} user and face sample embeddings in {time.time() - start:.1f}s")
+    
+    if args.vacuum:
+        database.engine.dispose()
+        with sqlite3.connect(args.db) as connection:
+            connection.execute("VACUUM")
+        print(f"   Database size: {size_before / 1e6:.1f} MB -> {os.path.getsize(args.db) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Rebuild the FAISS index from the embeddings stored in the database."""
+import argparse
+import time
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from database import Database
+from vector_store import VectorStore
+from shared_store import SharedVectorStore
+from numpy_store import NumpyVectorStore
+from index_sync import rebuild_index, sync_index
+from config import (
+    VECTOR_SNAPSHOT_EVERY, VECTOR_INDEX_TYPE, VECTOR_ANN_THRESHOLD,
+    HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, IVF_NLIST, IVF_NPROBE, IVF_PQ_M,
+    TEMPLATE_MODE, SAMPLE_SCORING, VECTOR_SHARED_GALLERY,
+    VECTOR_BACKEND
+)
+
+
+def main():
+    """Rebuild (or with --check, repair) the index of a stopped backend."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="data/helloface.db", help="SQLite database path")
+    parser.add_argument("--index", default="data/faiss_index", help="FAISS index path")
+    parser.add_argument("--workers", type=int, default=0, help="Decryption processes (0 = one per core)")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows read per chunk")
+    parser.add_argument("--check", action="store_true", help="Only re-index missing users and drop orphans")
+    args = parser.parse_args()
+    
+    print("🔧 HelloFace Index Rebuild")
+    print("=" * 50)
+    
+    database = Database(db_path=args.db)
+    if VECTOR_SHARED_GALLERY:
+        vector_store = SharedVectorStore(
+            embedding_dim=512,
+            index_path=args.index,
+            snapshot_every=VECTOR_SNAPSHOT_EVERY,
+            multi_sample=TEMPLATE_MODE == "all",
+            sample_scoring=SAMPLE_SCORING
+        )
+    elif VECTOR_BACKEND == "numpy":
+        vector_store = NumpyVectorStore(
+            embedding_dim=512,
+            index_path=args.index,
+            snapshot_every=VECTOR_SNAPSHOT_EVERY,
+            multi_sample=TEMPLATE_MODE == "all",
+            sample_scoring=SAMPLE_SCORING
+        )
+    else:
+        vector_store = VectorStore(
+            embedding_dim=512,
+            index_path=args.index,
+            snapshot_every=VECTOR_SNAPSHOT_EVERY,
+            index_type=VECTOR_INDEX_TYPE,
+            ann_threshold=VECTOR_ANN_THRESHOLD,
+            hnsw_m=HNSW_M,
+            ef_construction=HNSW_EF_CONSTRUCTION,
+            ef_search=HNSW_EF_SEARCH,
+            nlist=IVF_NLIST,
+            nprobe=IVF_NPROBE,
+            pq_m=IVF_PQ_M,
+            multi_sample=TEMPLATE_MODE == "all",
+            sample_scoring=SAMPLE_SCORING
+        )
+    
+    start = time.time()
+    if args.check:
+        report = sync_index(database, vector_store, chunk_size=args.chunk_size, workers=args.workers)
+        print(f"\n   {report}")
+    else:
+        count = rebuild_index(database, vector_store, chunk_size=args.chunk_size, workers=args.workers)
+        print(f"\n   Indexed {count} embeddings")
+    
+    vector_store.close()
+    print(f"   Done in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()